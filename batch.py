@@ -0,0 +1,155 @@
+"""
+Headless batch processing for WoD Map Editor
+
+Usage:
+    python batch.py stats maps/
+    python batch.py quantize maps/ -o snapped/
+    python batch.py convert maps/ -o resized/ --size 1920x1080
+    python batch.py convert maps/ -o native/ --format wodmap
+    python batch.py thumbnail maps/ -o thumbs/ --thumb-size 256
+"""
+
+import os
+
+# No window and no Tk: everything runs on the SDL dummy driver
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import sys
+import time
+import argparse
+import multiprocessing
+
+import pygame
+
+from config import TERRAINS, TILED_CANVAS_PIXELS
+from canvas import CanvasManager
+import mapfile
+
+JOBS = ('convert', 'quantize', 'stats', 'thumbnail')
+MAP_EXTENSIONS = ('.png', mapfile.EXTENSION)
+
+def make_canvas(w, h):
+    """CanvasManager for batch work, tiled above 4K"""
+    return CanvasManager(w, h, TERRAINS, undo_limit=1, tiled=w * h > TILED_CANVAS_PIXELS)
+
+def load_canvas(path):
+    """Load a map file into a CanvasManager, returns (canvas, off-palette pixel count)"""
+    if path.lower().endswith(mapfile.EXTENSION):
+        with mapfile.MapFile(path) as loaded:
+            canvas = make_canvas(loaded.width, loaded.height)
+            try:
+                canvas.load_tiles(loaded.tiles(canvas.palette))
+            except Exception:
+                canvas.close()
+                raise
+        return canvas, 0
+    image = pygame.image.load(path)
+    canvas = make_canvas(*image.get_size())
+    snapped = canvas.load_surface(image)
+    return canvas, snapped
+
+def output_path(out_dir, path, suffix='', extension='.png'):
+    """Path in out_dir for a processed copy of a map"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir, f"{name}{suffix}{extension}")
+
+def save_canvas(canvas, out_dir, path, file_format):
+    """Write a processed map as PNG or .wodmap"""
+    if file_format == 'wodmap':
+        mapfile.save(canvas, output_path(out_dir, path, extension=mapfile.EXTENSION))
+    else:
+        mapfile.save_png(canvas, output_path(out_dir, path))
+
+def run_job(task):
+    """Run one job on one map file, returns a result dict for reporting"""
+    job, path, options = task
+    start = time.perf_counter()
+    result = {'file': os.path.basename(path), 'job': job, 'ok': True, 'info': ''}
+    canvas = None
+    try:
+        canvas, snapped = load_canvas(path)
+        if job == 'stats':
+            total = canvas.width * canvas.height
+            shares = [f"{name} {count / total * 100:.1f}%"
+                      for name, count in canvas.terrain_counts().items() if count]
+            result['info'] = f"{canvas.width}x{canvas.height}, off-palette {snapped} | " + ", ".join(shares)
+        elif job == 'quantize':
+            save_canvas(canvas, options['out_dir'], path, options['format'])
+            result['info'] = f"snapped {snapped} pixels"
+        elif job == 'convert':
+            if options['size']:
+                canvas.resize(*options['size'])
+            save_canvas(canvas, options['out_dir'], path, options['format'])
+            result['info'] = f"{canvas.width}x{canvas.height}"
+        elif job == 'thumbnail':
+            limit = options['thumb_size']
+            scale = min(1.0, limit / max(canvas.width, canvas.height))
+            size = (max(1, int(canvas.width * scale)), max(1, int(canvas.height * scale)))
+            source, _ = canvas.mip_level(scale)
+            thumb = pygame.transform.smoothscale(source, size)
+            pygame.image.save(thumb, output_path(options['out_dir'], path, '_thumb'))
+            result['info'] = f"{size[0]}x{size[1]}"
+    except Exception as e:
+        result['ok'] = False
+        result['info'] = str(e)
+    finally:
+        # Pool workers run many jobs: each canvas goes before the next one comes
+        if canvas:
+            canvas.close()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def find_maps(directory):
+    """Map files directly inside a directory, sorted by name"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(MAP_EXTENSIONS))
+
+def parse_size(text):
+    """Parse WIDTHxHEIGHT"""
+    try:
+        w, h = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if w <= 0 or h <= 0:
+        raise argparse.ArgumentTypeError("size must be positive")
+    return w, h
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch process WoD maps without the editor window")
+    parser.add_argument('job', choices=JOBS)
+    parser.add_argument('directory', help="directory of map files")
+    parser.add_argument('-o', '--output', help="output directory (default: <directory>/<job>)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: number of cores)")
+    parser.add_argument('--size', type=parse_size, help="convert: new canvas size as WIDTHxHEIGHT")
+    parser.add_argument('--format', choices=('png', 'wodmap'), default='png',
+                        help="convert/quantize: output file format")
+    parser.add_argument('--thumb-size', type=int, default=256, help="thumbnail: longest side in pixels")
+    args = parser.parse_args(argv)
+
+    maps = find_maps(args.directory)
+    if not maps:
+        print(f"No maps found in {args.directory}")
+        return 1
+
+    out_dir = args.output or os.path.join(args.directory, args.job)
+    if args.job != 'stats':
+        os.makedirs(out_dir, exist_ok=True)
+    options = {'out_dir': out_dir, 'size': args.size, 'thumb_size': args.thumb_size,
+               'format': args.format}
+    tasks = [(args.job, path, options) for path in maps]
+
+    start = time.perf_counter()
+    failed = 0
+    workers = max(1, min(args.jobs, len(tasks)))
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(run_job, tasks):
+            status = "ok" if result['ok'] else "FAILED"
+            print(f"{result['file']}: {result['job']} {status} in {result['seconds']:.2f}s - {result['info']}")
+            failed += not result['ok']
+    elapsed = time.perf_counter() - start
+    print(f"{len(tasks)} file(s), {failed} failed, {elapsed:.2f}s total on {workers} worker(s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
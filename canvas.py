@@ -3,170 +3,808 @@ Canvas operations for WoD Map Editor
 """
 
 import pygame
+import numpy as np
 import math
-from collections import deque
+from functools import lru_cache
+from history import UndoDelta, HistoryStore
+from tiles import DenseStore, MappedStore, MappedSnapshot, TiledStore
+
+def pack_rgb(rgb):
+    """Pack an (..., 3) uint8 RGB array into 24-bit integer keys"""
+    return (rgb[..., 0].astype(np.int32) << 16) | (rgb[..., 1].astype(np.int32) << 8) | rgb[..., 2]
+
+class PaletteLUT:
+    """24-bit color to nearest palette index table, filled one red slice at a time"""
+
+    def __init__(self, palette):
+        self.palette = palette.astype(np.int32)
+        self.keys = pack_rgb(palette)
+        self.table = np.zeros(1 << 24, dtype=np.uint8)
+        self.ready = np.zeros(256, dtype=bool)
+        gb = np.arange(1 << 16)
+        green, blue = gb >> 8, gb & 255
+        # Green/blue part of the squared distance to each palette color, shared by all slices
+        self.gb_dist = ((green[:, None] - self.palette[None, :, 1]) ** 2 +
+                        (blue[:, None] - self.palette[None, :, 2]) ** 2)
+
+    def _build(self, red):
+        """Fill the table for every color with this red value"""
+        dist = self.gb_dist + (red - self.palette[:, 0]) ** 2
+        self.table[red << 16:(red + 1) << 16] = dist.argmin(axis=1)
+        self.ready[red] = True
+
+    def lookup(self, keys):
+        """Palette indices for an array of packed 24-bit colors"""
+        reds = np.flatnonzero((np.bincount((keys >> 16).ravel(), minlength=256) > 0) & ~self.ready)
+        for red in reds:
+            self._build(int(red))
+        return self.table[keys]
+
+@lru_cache(maxsize=None)
+def _palette_lut(colors):
+    return PaletteLUT(np.array(colors, dtype=np.uint8))
+
+def palette_lut(palette):
+    """Shared lookup table for a palette, built on first use"""
+    return _palette_lut(tuple(map(tuple, np.asarray(palette).tolist())))
+
+def quantize_rgb(rgb, palette):
+    """Map an (h, w, 3) RGB array to nearest palette indices"""
+    return palette_lut(palette).lookup(pack_rgb(rgb))
+
+@lru_cache(maxsize=None)
+def brush_stamp(size, smooth):
+    """Read-only footprint mask of a brush, centered on its (size, size) pixel"""
+    if smooth:
+        r = np.arange(-size, size + 1)
+        mask = r[:, None] ** 2 + r[None, :] ** 2 <= size * size
+    else:
+        # Square brushes cover [x - size, x + size) like pygame.Rect did
+        mask = np.ones((2 * size, 2 * size), dtype=bool)
+    mask.setflags(write=False)
+    return mask
+
+def palettized(block, palette):
+    """8-bit surface over an index block; SDL expands it to RGB in one blit"""
+    block = np.ascontiguousarray(block)
+    tile = pygame.image.frombuffer(block, (block.shape[1], block.shape[0]), 'P')
+    tile.set_palette([tuple(c) for c in palette])
+    return tile
+
+def halve(pixels, steps=1):
+    """Shrink a surface by 2 per step; odd edges repeat their last row or column.
+
+    Every step averages whole 2x2 blocks, so a region halves to the same
+    pixels whether it is downsampled alone or as part of a larger area.
+    """
+    for _ in range(steps):
+        w, h = pixels.get_size()
+        if w % 2 or h % 2:
+            padded = pygame.Surface((w + w % 2, h + h % 2))
+            padded.blit(pixels, (0, 0))
+            if w % 2:
+                padded.blit(pixels, (w, 0), pygame.Rect(w - 1, 0, 1, h))
+            if h % 2:
+                padded.blit(padded, (0, h), pygame.Rect(0, h - 1, w + w % 2, 1))
+            pixels = padded
+        pixels = pygame.transform.smoothscale(pixels, ((w + 1) // 2, (h + 1) // 2))
+    return pixels
+
+def owned(block):
+    """A block that keeps no larger array alive, copied out of its base if needed"""
+    if isinstance(block, int):
+        return block
+    base = block.base
+    return block.copy() if base is not None and base.nbytes > block.nbytes else block
+
+def flush_store(store):
+    """Write a memory-mapped store to its file, False for in-memory stores"""
+    if not isinstance(store, (MappedStore, MappedSnapshot)):
+        return False
+    store.flush()
+    return True
+
+def store_surface(store, palette, rect):
+    """New display surface with the pixels of a canvas rect of a store"""
+    region = pygame.Surface(rect.size)
+    region.blit(palettized(store.read(rect), palette), (0, 0))
+    return region
+
+class CanvasSnapshot:
+    """Frozen copy of a canvas for saving on a worker thread"""
+
+    def __init__(self, canvas):
+        self.width = canvas.width
+        self.height = canvas.height
+        self.terrains = canvas.terrains
+        self.palette = canvas.palette
+        self.store = canvas.store.snapshot()
+
+    def flush(self):
+        """Write a memory-mapped canvas to its file, False for in-memory canvases"""
+        return flush_store(self.store)
+
+    def region_surface(self, rect=None):
+        """Display pixels of a canvas rect, the whole canvas by default"""
+        if rect is None:
+            rect = pygame.Rect(0, 0, self.width, self.height)
+        return store_surface(self.store, self.palette, rect)
 
 class CanvasManager:
     """Manages canvas operations"""
-    
-    def __init__(self, width, height, terrains):
+
+    # Square stroke dabs are placed this fraction of the brush width apart
+    STROKE_SPACING = 0.25
+
+    def __init__(self, width, height, terrains, undo_limit=30, undo_budget_mb=256, tiled=False,
+                 store=None):
         self.width = width
         self.height = height
         self.terrains = terrains
-        self.surface = pygame.Surface((width, height))
-        self.surface.fill(terrains[0][1])
-        self.undo_stack = deque(maxlen=30)
-        self.redo_stack = deque(maxlen=30)
+        self.palette = np.array([color for _, color in terrains], dtype=np.uint8)
+        # Authoritative terrain index per pixel. There is no full-size display
+        # surface: pixels are built per region for the view, pyramid and saves.
+        if store is None:
+            store = TiledStore(width, height) if tiled else DenseStore(width, height)
+        self.store = store
+        self.history = HistoryStore(undo_limit, undo_budget_mb)
+        # Live pixel count per terrain, kept up to date by every write
+        self.counts = self.store.histogram(len(terrains))
+        self.pending = None
+        self.stroke = None
+        self.listeners = []
+        # Sparse pyramid: mip_levels[i] is 1 / 2**(i + 1) scale, None until needed
+        self.mip_levels = []
+        self.mip_dirty = []
+
+    def flush(self):
+        """Write a memory-mapped canvas to its file, False for in-memory canvases"""
+        return flush_store(self.store)
+
+    def close(self):
+        """Stop the history worker and release the backing file of a memory-mapped canvas"""
+        self.history.close()
+        if isinstance(self.store, MappedStore):
+            self.store.close()
+
+    def snapshot(self):
+        """Copy of the terrain indices that a save can encode off the main thread"""
+        return CanvasSnapshot(self)
+
+    def add_listener(self, callback):
+        """Call callback(rect) whenever pixels in a canvas rect change"""
+        self.listeners.append(callback)
+
+    def _clip(self, left, top, right, bottom):
+        """Clip an exclusive box to the canvas, None if empty"""
+        left = max(0, left)
+        top = max(0, top)
+        right = min(self.width, right)
+        bottom = min(self.height, bottom)
+        if left >= right or top >= bottom:
+            return None
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def _changed(self, rect=None):
+        """Tell the pyramid and listeners that pixels in a canvas rect changed"""
+        if rect is None:
+            rect = pygame.Rect(0, 0, self.width, self.height)
+        for dirty in self.mip_dirty:
+            if dirty is not None:
+                dirty.append(rect.copy())
+        for callback in self.listeners:
+            callback(rect)
+
+    def region_surface(self, rect=None):
+        """Display pixels of a canvas rect, the whole canvas by default"""
+        if rect is None:
+            rect = pygame.Rect(0, 0, self.width, self.height)
+        return store_surface(self.store, self.palette, rect)
+
+    def mip_level(self, scale):
+        """Pyramid surface closest to (and not below) a display scale, with its factor"""
+        level = 0
+        while scale <= 0.5 ** (level + 1) and min(self.width, self.height) >> (level + 1) > 0:
+            level += 1
+        if level == 0:
+            return self.region_surface(), 1.0
+
+        # Only requested levels are built; each refreshes from the nearest finer one
+        while len(self.mip_levels) < level:
+            self.mip_levels.append(None)
+            self.mip_dirty.append(None)
+        if self.mip_levels[level - 1] is None:
+            size = (-(-self.width >> level), -(-self.height >> level))
+            self.mip_levels[level - 1] = pygame.Surface(size)
+            self.mip_dirty[level - 1] = [pygame.Rect(0, 0, self.width, self.height)]
+        for i in range(level):
+            if self.mip_levels[i] is not None:
+                self._refresh_mip(i)
+        return self.mip_levels[level - 1], 0.5 ** level
+
+    def _refresh_mip(self, i):
+        """Downsample the dirty areas of pyramid level i from the nearest finer level"""
+        dirty = self.mip_dirty[i]
+        if not dirty:
+            return
+        if len(dirty) > 32:
+            dirty[:] = [dirty[0].unionall(dirty[1:])]
+        shift = i
+        while shift > 0 and self.mip_levels[shift - 1] is None:
+            shift -= 1
+        if shift:
+            source = self.mip_levels[shift - 1]
+            src_w, src_h = source.get_size()
+        else:
+            src_w, src_h = self.width, self.height
+        factor = 1 << (i + 1 - shift)
+        # Work in blocks so a tiled canvas never builds one huge source surface
+        step = max(1024, factor)
+        target = self.mip_levels[i]
+        for rect in dirty:
+            # Canvas rect in source-level pixels, widened to multiples of the factor
+            left = (rect.left >> shift) & ~(factor - 1)
+            top = (rect.top >> shift) & ~(factor - 1)
+            right = min(src_w, (-(-rect.right >> shift) + factor - 1) & ~(factor - 1))
+            bottom = min(src_h, (-(-rect.bottom >> shift) + factor - 1) & ~(factor - 1))
+            for y in range(top, bottom, step):
+                for x in range(left, right, step):
+                    area = pygame.Rect(x, y, min(step, right - x), min(step, bottom - y))
+                    pixels = source.subsurface(area) if shift else self.region_surface(area)
+                    target.blit(halve(pixels, i + 1 - shift), (x // factor, y // factor))
+        dirty.clear()
+
+    def _tile_rects(self, rect):
+        """Yield (key, rect) for every undo tile overlapping a canvas rect"""
+        size = UndoDelta.TILE
+        for ty in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for tx in range(rect.left // size, (rect.right - 1) // size + 1):
+                yield (tx, ty), self._clip(tx * size, ty * size, (tx + 1) * size, (ty + 1) * size)
+
+    def _record(self, rect):
+        """Keep the before-pixels of tiles an operation is about to touch"""
+        if self.pending is None:
+            self.pending = UndoDelta()
+            self.history.clear_redo()
+        before = self.pending.before
+        missing = []
+        for key, tile in self._tile_rects(rect):
+            if key in before:
+                continue
+            # Tiles the store keeps uniform are remembered as their single index
+            value = self.store.uniform(tile)
+            if value is None:
+                missing.append((key, tile))
+            else:
+                before[key] = value
+        if not missing:
+            return
+        # One read of the tiles' area, handed out as per-tile slices
+        area = missing[0][1].unionall([tile for _, tile in missing[1:]])
+        block = self._read_copy(area)
+        for key, tile in missing:
+            before[key] = block[tile.top - area.top:tile.bottom - area.top,
+                                tile.left - area.left:tile.right - area.left]
+
+    def _read_copy(self, rect):
+        """Indices of a canvas rect as an array of its own"""
+        block = self.store.read(rect)
+        # Dense and mapped stores hand out views, tiled ones build a new array
+        return block.copy() if block.base is not None else block
+
+    def _commit(self):
+        """Close the pending operation and push it onto the undo stack"""
+        delta, self.pending = self.pending, None
+        if delta is None or not delta.before:
+            return
+        keys = []
+        tiles = []
+        for key in list(delta.before):
+            tile = self._tile_rect(key)
+            value = self.store.uniform(tile)
+            if value is None:
+                keys.append(key)
+                tiles.append(tile)
+                continue
+            before = delta.before[key]
+            if before == value if isinstance(before, int) else (before == value).all():
+                del delta.before[key]
+            else:
+                delta.before[key], delta.after[key] = owned(before), value
+        if keys:
+            self._keep_changed(delta, keys, tiles)
+        if delta.before:
+            self.history.push(delta)
+
+    def _keep_changed(self, delta, keys, tiles):
+        """Drop the unchanged per-pixel tiles of a delta and read the after-side of the rest"""
+        area = tiles[0].unionall(tiles[1:])
+        if sum(tile.width * tile.height for tile in tiles) == area.width * area.height:
+            # The tiles cover their bounding box (fills, big strokes): compare it in one go
+            after = self._read_copy(area)
+            before = np.empty_like(after)
+            slices = [(slice(tile.top - area.top, tile.bottom - area.top),
+                       slice(tile.left - area.left, tile.right - area.left)) for tile in tiles]
+            for key, part in zip(keys, slices):
+                before[part] = delta.before[key]
+            size = UndoDelta.TILE
+            changed = np.logical_or.reduceat(before != after, np.arange(0, area.height, size), axis=0)
+            changed = np.logical_or.reduceat(changed, np.arange(0, area.width, size), axis=1)
+            # Kept tiles are slices of the two blocks only if every tile is kept,
+            # otherwise they are copied out so the entry holds exactly what it counts
+            whole = changed.all()
+            for key, tile, part in zip(keys, tiles, slices):
+                if whole:
+                    delta.before[key], delta.after[key] = before[part], after[part]
+                elif changed[(tile.top - area.top) // size, (tile.left - area.left) // size]:
+                    delta.before[key], delta.after[key] = owned(delta.before[key]), after[part].copy()
+                else:
+                    del delta.before[key]
+        else:
+            for key, tile in zip(keys, tiles):
+                after = self._read_copy(tile)
+                if np.all(after == delta.before[key]):
+                    del delta.before[key]
+                else:
+                    delta.before[key], delta.after[key] = owned(delta.before[key]), after
+
+    def _tile_rect(self, key):
+        """Canvas rect of an undo tile"""
+        size = UndoDelta.TILE
+        tx, ty = key
+        return self._clip(tx * size, ty * size, (tx + 1) * size, (ty + 1) * size)
+
+    def _uniform_rects(self, tiles):
+        """Group {key: terrain index} undo tiles into (rect, index) rectangles"""
+        # Runs of equal tiles along each tile row
+        runs = {}
+        for (tx, ty), value in sorted(tiles.items(), key=lambda item: item[0][::-1]):
+            row = runs.setdefault(ty, [])
+            if row and row[-1][1] == tx and row[-1][2] == value:
+                row[-1][1] += 1
+            else:
+                row.append([tx, tx + 1, value])
+
+        # A run repeated on the next tile row grows downwards
+        done = []
+        growing = {}
+        for ty in sorted(runs):
+            below = {}
+            for tx0, tx1, value in runs[ty]:
+                top, bottom = growing.pop((tx0, tx1, value), (ty, ty))
+                if bottom != ty:
+                    done.append(((tx0, tx1, value), (top, bottom)))
+                    top = ty
+                below[(tx0, tx1, value)] = (top, ty + 1)
+            done.extend(growing.items())
+            growing = below
+        done.extend(growing.items())
+        size = UndoDelta.TILE
+        return [(self._clip(tx0 * size, top * size, tx1 * size, bottom * size), value)
+                for (tx0, tx1, value), (top, bottom) in done]
+
+    def _restore(self, tiles):
+        """Write saved tiles back into the canvas, returns their bounding rect"""
+        bounds = None
+        uniform = {}
+        for key, block in tiles.items():
+            if isinstance(block, int):
+                uniform[key] = block
+                continue
+            tile = self._tile_rect(key)
+            self.counts -= self._histogram(self.store.read(tile))
+            self.store.write(tile, block)
+            self.counts += self._histogram(block)
+            self._changed(tile)
+            bounds = tile if bounds is None else bounds.union(tile)
+        for rect, value in self._uniform_rects(uniform):
+            self.counts -= self.store.histogram(len(self.counts), rect)
+            self.store.fill(rect, value)
+            self.counts[value] += rect.width * rect.height
+            self._changed(rect)
+            bounds = rect if bounds is None else bounds.union(rect)
+        return bounds
+
+    def _histogram(self, block):
+        """Pixel count per terrain of an index block"""
+        return np.bincount(block.ravel(), minlength=len(self.counts))
+
+    def _apply_mask(self, rect, mask, terrain_idx, previous=None):
+        """Write a terrain into the masked pixels of a canvas rect.
+
+        previous is the terrain all masked pixels hold, if the caller knows it.
+        """
+        self._record(rect)
+        painted = np.count_nonzero(mask)
+        if previous is None:
+            self.counts -= self._histogram(self.store.read(rect)[mask])
+        else:
+            self.counts[previous] -= painted
+        self.counts[terrain_idx] += painted
+        self.store.apply_mask(rect, mask, terrain_idx)
+        self._changed(rect)
+        return rect
+
+    def _fill_rect(self, rect, terrain_idx, previous=None):
+        """Write a terrain into a whole canvas rect; previous as for _apply_mask"""
+        self._record(rect)
+        if previous is None:
+            self.counts -= self._histogram(self.store.read(rect))
+        else:
+            self.counts[previous] -= rect.width * rect.height
+        self.counts[terrain_idx] += rect.width * rect.height
+        self.store.fill(rect, terrain_idx)
+        self._changed(rect)
+        return rect
+
+    def _write_block(self, rect, block):
+        """Write terrain indices into a canvas rect"""
+        self._record(rect)
+        self.counts -= self._histogram(self.store.read(rect))
+        self.counts += self._histogram(block)
+        self.store.write(rect, block)
+        self._changed(rect)
+        return rect
+
+    def _stamp(self, x, y, size, terrain_idx, smooth=True):
+        """Stamp a cached brush footprint centered on (x, y), clipped to the canvas"""
+        mask = brush_stamp(size, smooth)
+        left, top = x - size, y - size
+        rect = self._clip(left, top, left + mask.shape[1], top + mask.shape[0])
+        if rect is None:
+            return None
+        if not smooth:
+            return self._fill_rect(rect, terrain_idx)
+        mask = mask[rect.top - top:rect.bottom - top, rect.left - left:rect.right - left]
+        return self._apply_mask(rect, mask, terrain_idx)
+
+    def _spans_mask(self, rect, rows, starts, ends):
+        """Mask of a rect from disjoint, non-touching (row, start, end) spans inside it"""
+        # +1 at each start, -1 at each end, then a running sum along each row
+        stride = rect.width + 1
+        marks = np.zeros(rect.height * stride + 1, dtype=np.int8)
+        base = (rows - rect.top) * stride - rect.left
+        marks[base + starts] = 1
+        marks[base + ends] = -1
+        mask = np.cumsum(marks[:-1], dtype=np.int8).reshape(rect.height, stride)[:, :-1]
+        return mask.view(bool)
+
+    def _apply_spans(self, rows, starts, ends, terrain_idx):
+        """Write a terrain into row spans sorted by row, one undo-tile band at a time"""
+        keep = (rows >= 0) & (rows < self.height)
+        starts = starts[keep].clip(0, self.width)
+        ends = ends[keep].clip(0, self.width)
+        rows = rows[keep]
+        keep = starts < ends
+        rows, starts, ends = rows[keep], starts[keep], ends[keep]
+        if not len(rows):
+            return None
+
+        # Bands keep each written rect tight to the spans it holds
+        bands = rows // UndoDelta.TILE
+        cuts = np.flatnonzero(np.diff(bands)) + 1
+        bounds = None
+        for r, s, e in zip(np.split(rows, cuts), np.split(starts, cuts), np.split(ends, cuts)):
+            left, right = int(s.min()), int(e.max())
+            rect = pygame.Rect(left, int(r[0]), right - left, int(r[-1]) - int(r[0]) + 1)
+            self._apply_mask(rect, self._spans_mask(rect, r, s, e), terrain_idx)
+            bounds = rect if bounds is None else bounds.union(rect)
+        return bounds
+
+    def _capsule_spans(self, x1, y1, x2, y2, radius):
+        """Row spans of every pixel within radius of a segment, sorted by row"""
+        ys = np.arange(min(y1, y2) - radius, max(y1, y2) + radius + 1)
+        lo = np.full(len(ys), np.inf)
+        hi = np.full(len(ys), -np.inf)
+
+        # End caps
+        for px, py in ((x1, y1), (x2, y2)):
+            h2 = radius * radius - (ys - py) ** 2.0
+            ok = h2 >= 0
+            h = np.sqrt(np.where(ok, h2, 0.0))
+            lo = np.where(ok, np.minimum(lo, px - h), lo)
+            hi = np.where(ok, np.maximum(hi, px + h), hi)
+
+        # Strip between the caps: 0 <= (p - a).d <= |d|^2 and |(p - a) x d| <= radius |d|
+        dx, dy = x2 - x1, y2 - y1
+        if dx or dy:
+            length2 = dx * dx + dy * dy
+            reach = radius * math.sqrt(length2)
+            ry = (ys - y1).astype(np.float64)
+            s_lo = np.full(len(ys), -np.inf)
+            s_hi = np.full(len(ys), np.inf)
+            if dx:
+                a, b = -ry * dy / dx, (length2 - ry * dy) / dx
+                s_lo, s_hi = np.maximum(s_lo, np.minimum(a, b)), np.minimum(s_hi, np.maximum(a, b))
+            else:
+                s_hi = np.where((ry * dy >= 0) & (ry * dy <= length2), s_hi, -np.inf)
+            if dy:
+                a, b = (ry * dx - reach) / dy, (ry * dx + reach) / dy
+                s_lo, s_hi = np.maximum(s_lo, np.minimum(a, b)), np.minimum(s_hi, np.maximum(a, b))
+            else:
+                s_hi = np.where(np.abs(ry * dx) <= reach, s_hi, -np.inf)
+            ok = s_lo <= s_hi
+            lo = np.where(ok, np.minimum(lo, s_lo + x1), lo)
+            hi = np.where(ok, np.maximum(hi, s_hi + x1), hi)
+
+        # The capsule is convex, so each row is a single span
+        keep = lo <= hi
+        starts = np.ceil(lo[keep]).astype(np.int64)
+        ends = np.floor(hi[keep]).astype(np.int64) + 1
+        return ys[keep], starts, ends
+
+    def _merge_spans(self, rows, starts, ends):
+        """Union of possibly overlapping row spans, clipped to the canvas width"""
+        order = np.lexsort((starts, rows))
+        stride = self.width + 2
+        start_keys = rows[order] * stride + starts[order].clip(0, self.width)
+        end_keys = np.maximum.accumulate(rows[order] * stride + ends[order].clip(0, self.width))
+        # A span opens a new run only if it starts past everything before it
+        heads = np.ones(len(order), dtype=bool)
+        heads[1:] = start_keys[1:] > end_keys[:-1]
+        tails = np.append(heads[1:], True)
+        merged_rows = rows[order][heads]
+        return (merged_rows, start_keys[heads] - merged_rows * stride,
+                end_keys[tails] - merged_rows * stride)
+
+    def _stamp_capsule(self, x1, y1, x2, y2, radius, terrain_idx):
+        """Stamp every pixel within radius of the segment (x1, y1)-(x2, y2)"""
+        rows, starts, ends = self._capsule_spans(x1, y1, x2, y2, radius)
+        return self._apply_spans(rows, starts, ends, terrain_idx)
+
+    def _stroke_dab(self, x, y):
+        """Stamp one dab of the current stroke"""
+        stroke = self.stroke
+        return self._stamp(x, y, stroke['size'], stroke['terrain'], stroke['smooth'])
+
+    def begin_stroke(self, x, y, brush_size, terrain_idx, smooth=True):
+        """Start a brush stroke at a canvas point, returns the touched rect"""
+        self.stroke = {'pos': (x, y), 'size': brush_size, 'terrain': terrain_idx,
+                       'smooth': smooth, 'travel': 0.0}
+        return self._stroke_dab(x, y)
+
+    def stroke_to(self, x, y):
+        """Extend the current stroke to a canvas point, returns the touched rect"""
+        stroke = self.stroke
+        if stroke is None or (x, y) == stroke['pos']:
+            return None
+        x0, y0 = stroke['pos']
+        stroke['pos'] = (x, y)
+        if stroke['smooth']:
+            # Round brushes sweep the whole segment as one capsule
+            return self._stamp_capsule(x0, y0, x, y, stroke['size'], stroke['terrain'])
+
+        # Square brushes place dabs at a fixed spacing, carried across segments
+        spacing = max(1.0, 2 * stroke['size'] * self.STROKE_SPACING)
+        length = math.hypot(x - x0, y - y0)
+        along = spacing - stroke['travel']
+        bounds = None
+        while along <= length:
+            t = along / length
+            rect = self._stroke_dab(int(round(x0 + (x - x0) * t)), int(round(y0 + (y - y0) * t)))
+            if rect:
+                bounds = rect if bounds is None else bounds.union(rect)
+            along += spacing
+        stroke['travel'] = length - (along - spacing)
+        return bounds
+
+    def end_stroke(self):
+        """Finish the current brush stroke"""
+        self.stroke = None
 
     def save_state(self):
-        """Save current state to undo stack"""
-        self.undo_stack.append(self.surface.copy())
-        self.redo_stack.clear()
+        """Start a new undoable operation"""
+        self._commit()
+        self.pending = UndoDelta()
+        self.history.clear_redo()
 
     def undo(self):
         """Undo last operation"""
-        if self.undo_stack:
-            self.redo_stack.append(self.surface.copy())
-            self.surface = self.undo_stack.pop()
-            return True
-        return False
+        self._commit()
+        tiles = self.history.undo()
+        if tiles is None:
+            return False
+        self._restore(tiles)
+        return True
 
     def redo(self):
         """Redo last undone operation"""
-        if self.redo_stack:
-            self.undo_stack.append(self.surface.copy())
-            self.surface = self.redo_stack.pop()
-            return True
-        return False
+        self._commit()
+        tiles = self.history.redo()
+        if tiles is None:
+            return False
+        self._restore(tiles)
+        return True
+
+    def terrain_counts(self):
+        """Pixel count of every terrain by name"""
+        return {name: int(count) for (name, _), count in zip(self.terrains, self.counts)}
+
+    def terrain_fraction(self, terrain_idx):
+        """Share of the map covered by a terrain, 0.0 to 1.0"""
+        return int(self.counts[terrain_idx]) / (self.width * self.height)
+
+    def history_bytes(self):
+        """Memory held by the undo history"""
+        pending = self.pending.nbytes() if self.pending else 0
+        return self.history.nbytes() + pending
 
     def paint(self, x, y, brush_size, terrain_idx, smooth=True):
-        """Paint on canvas"""
+        """Paint on canvas, returns the touched rect"""
         if 0 <= x < self.width and 0 <= y < self.height:
-            color = self.terrains[terrain_idx][1]
-            if smooth:
-                pygame.draw.circle(self.surface, color, (x, y), brush_size)
-            else:
-                rect = pygame.Rect(x - brush_size, y - brush_size, brush_size * 2, brush_size * 2)
-                pygame.draw.rect(self.surface, color, rect)
+            return self._stamp(x, y, brush_size, terrain_idx, smooth)
+        return None
 
     def erase(self, x, y, brush_size):
-        """Erase on canvas"""
+        """Erase on canvas, returns the touched rect"""
         if 0 <= x < self.width and 0 <= y < self.height:
-            pygame.draw.circle(self.surface, self.terrains[0][1], (x, y), brush_size)
+            return self._stamp(x, y, brush_size, 0)
+        return None
 
-    def flood_fill(self, x, y, new_color):
-        """Flood fill algorithm"""
+    def flood_fill(self, x, y, terrain_idx):
+        """Scanline flood fill, returns (filled pixel count, bounding rect)"""
         if not (0 <= x < self.width and 0 <= y < self.height):
-            return 0
+            return 0, None
 
-        try:
-            target = self.surface.get_at((x, y))[:3]
-        except:
-            return 0
+        target = self.store.get(x, y)
+        if target == terrain_idx:
+            return 0, None
 
-        if target == new_color:
-            return 0
+        all_rows, all_starts, all_ends = self.store.spans(target)
+        region = self._connected_spans(all_rows, all_starts, all_ends, x, y)
+        rows, starts, ends = all_rows[region], all_starts[region], all_ends[region]
 
-        pixels = [(x, y)]
-        filled = set()
-        max_px = 100000
+        left, right = int(starts.min()), int(ends.max())
+        top, bottom = int(rows.min()), int(rows.max()) + 1
+        rect = pygame.Rect(left, top, right - left, bottom - top)
 
-        pygame.Surface.lock(self.surface)
+        if len(rows) == rect.height and (starts == left).all() and (ends == right).all():
+            # One span per row, each as wide as the box: the region is its bounding box
+            self._fill_rect(rect, terrain_idx, previous=target)
+            return rect.width * rect.height, rect
 
-        try:
-            while pixels and len(filled) < max_px:
-                if not pixels:
-                    break
+        inside = ((all_rows >= top) & (all_rows < bottom) &
+                  (all_starts < right) & (all_ends > left))
+        if np.count_nonzero(inside) == len(rows):
+            # The region is the only target terrain in its bounding box
+            mask = self.store.read(rect) == target
+        else:
+            mask = self._spans_mask(rect, rows, starts, ends)
+        self._apply_mask(rect, mask, terrain_idx, previous=target)
+        return int((ends - starts).sum()), rect
 
-                px, py = pixels.pop()
+    def _connected_spans(self, rows, starts, ends, x, y):
+        """Select the spans 4-connected to the span containing (x, y)"""
+        # Spans are sorted by (row, start), so keys on a padded row stride are too
+        stride = self.width + 2
+        start_keys = rows * stride + starts
+        end_keys = rows * stride + ends
 
-                if (px, py) in filled or not (0 <= px < self.width and 0 <= py < self.height):
-                    continue
+        # For each span, the index range of overlapping spans in the rows below and above
+        below = (rows + 1) * stride
+        above = (rows - 1) * stride
+        down_lo = np.searchsorted(end_keys, below + starts, 'right').tolist()
+        down_hi = np.searchsorted(start_keys, below + ends, 'left').tolist()
+        up_lo = np.searchsorted(end_keys, above + starts, 'right').tolist()
+        up_hi = np.searchsorted(start_keys, above + ends, 'left').tolist()
 
-                try:
-                    current_color = self.surface.get_at((px, py))[:3]
-                    if current_color != target:
-                        continue
-                except:
-                    continue
+        seed = int(np.searchsorted(start_keys, y * stride + x, 'right')) - 1
+        seen = bytearray(len(rows))
+        seen[seed] = 1
+        stack = [seed]
+        while stack:
+            i = stack.pop()
+            for j in range(down_lo[i], down_hi[i]):
+                if not seen[j]:
+                    seen[j] = 1
+                    stack.append(j)
+            for j in range(up_lo[i], up_hi[i]):
+                if not seen[j]:
+                    seen[j] = 1
+                    stack.append(j)
+        return np.frombuffer(seen, dtype=bool)
 
-                self.surface.set_at((px, py), new_color)
-                filled.add((px, py))
+    def draw_line(self, x1, y1, x2, y2, brush_size, terrain_idx):
+        """Draw a line, returns the touched rect"""
+        return self._stamp_capsule(x1, y1, x2, y2, brush_size, terrain_idx)
 
-                pixels.extend([
-                    (px + 1, py), (px - 1, py),
-                    (px, py + 1), (px, py - 1)
-                ])
-        finally:
-            pygame.Surface.unlock(self.surface)
+    def draw_polyline(self, points, brush_size, terrain_idx):
+        """Draw joined line segments, each pixel written once, returns the touched rect"""
+        if not points:
+            return None
+        if len(points) == 1:
+            points = [points[0], points[0]]
+        spans = [self._capsule_spans(x1, y1, x2, y2, brush_size)
+                 for (x1, y1), (x2, y2) in zip(points, points[1:])]
+        rows, starts, ends = (np.concatenate(parts) for parts in zip(*spans))
+        rows, starts, ends = self._merge_spans(rows, starts, ends)
+        return self._apply_spans(rows, starts, ends, terrain_idx)
 
-        return len(filled)
+    def draw_circle(self, cx, cy, radius, brush_size, terrain_idx, filled=False):
+        """Draw a ring (or a filled disc) of the brush width, returns the touched rect"""
+        outer = radius + brush_size
+        inner = 0 if filled else max(0, radius - brush_size)
+        dy = np.arange(-outer, outer + 1)
+        half = np.floor(np.sqrt(outer * outer - dy * dy)).astype(np.int64)
+        rows = cy + dy
+        starts = cx - half
+        ends = cx + half + 1
 
-    def draw_line(self, x1, y1, x2, y2, brush_size, terrain_idx):
-        """Draw a line"""
-        color = self.terrains[terrain_idx][1]
-        dx = x2 - x1
-        dy = y2 - y1
-        distance = max(abs(dx), abs(dy), 1)
-
-        for i in range(distance + 1):
-            t = i / distance
-            x = max(0, min(int(x1 + dx * t), self.width - 1))
-            y = max(0, min(int(y1 + dy * t), self.height - 1))
-            pygame.draw.circle(self.surface, color, (x, y), brush_size)
-
-    def draw_circle(self, cx, cy, radius, brush_size, terrain_idx):
-        """Draw a circle"""
-        color = self.terrains[terrain_idx][1]
-        steps = max(int(2 * math.pi * radius), 36)
-        for i in range(steps):
-            angle = (2 * math.pi * i) / steps
-            x = int(cx + radius * math.cos(angle))
-            y = int(cy + radius * math.sin(angle))
-            if 0 <= x < self.width and 0 <= y < self.height:
-                pygame.draw.circle(self.surface, color, (x, y), brush_size)
+        # Rows that cross the hole split into a left and a right span
+        hole = dy * dy < inner * inner
+        gap = np.ceil(np.sqrt(inner * inner - dy[hole] * dy[hole])).astype(np.int64)
+        left_ends = ends.copy()
+        left_ends[hole] = cx - gap + 1
+        rows = np.concatenate([rows, rows[hole]])
+        starts = np.concatenate([starts, cx + gap])
+        ends = np.concatenate([left_ends, ends[hole]])
+        order = np.lexsort((starts, rows))
+        return self._apply_spans(rows[order], starts[order], ends[order], terrain_idx)
 
     def draw_rectangle(self, x1, y1, x2, y2, terrain_idx):
-        """Draw a rectangle"""
-        color = self.terrains[terrain_idx][1]
-        left = max(0, min(x1, x2))
-        top = max(0, min(y1, y2))
-        right = min(self.width - 1, max(x1, x2))
-        bottom = min(self.height - 1, max(y1, y2))
-        width = right - left + 1
-        height = bottom - top + 1
-        pygame.draw.rect(self.surface, color, (left, top, width, height))
+        """Draw a rectangle, returns the touched rect"""
+        rect = self._clip(min(x1, x2), min(y1, y2), max(x1, x2) + 1, max(y1, y2) + 1)
+        if rect:
+            return self._fill_rect(rect, terrain_idx)
+        return None
 
     def pick_color(self, x, y):
         """Pick color from canvas"""
         if 0 <= x < self.width and 0 <= y < self.height:
-            try:
-                color = self.surface.get_at((x, y))[:3]
-                min_dist = float('inf')
-                best_idx = 0
-                for i, (name, tcolor) in enumerate(self.terrains):
-                    dist = sum((a-b)**2 for a, b in zip(color, tcolor))
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_idx = i
-                return best_idx, self.terrains[best_idx][0]
-            except:
-                return None, None
+            idx = self.store.get(x, y)
+            return idx, self.terrains[idx][0]
         return None, None
 
+    def load_surface(self, surface):
+        """Replace the canvas with an image snapped to the palette, returns the off-palette pixel count"""
+        rgb = pygame.surfarray.array3d(surface).transpose(1, 0, 2)
+        keys = pack_rgb(rgb)
+        lut = palette_lut(self.palette)
+        indices = lut.lookup(keys)
+        self.store.write(pygame.Rect(0, 0, self.width, self.height), indices)
+        self.counts = self._histogram(indices)
+        self._changed()
+        return int(np.count_nonzero(lut.keys[indices] != keys))
+
+    def load_tiles(self, tiles):
+        """Replace the canvas contents from (rect, indices or single terrain index) pairs"""
+        for rect, data in tiles:
+            if isinstance(data, int):
+                self.store.fill(rect, data)
+            else:
+                self.store.write(rect, data)
+        self.counts = self.store.histogram(len(self.terrains))
+        self._changed()
+
+    def apply_image(self, image, pos):
+        """Bake an image into the canvas, snapped to the terrain palette"""
+        bounds = image.get_rect(topleft=pos)
+        rect = self._clip(bounds.left, bounds.top, bounds.right, bounds.bottom)
+        if rect is None:
+            return None
+        base = pygame.Surface(rect.size)
+        base.blit(self.region_surface(rect), (0, 0))
+        base.blit(image, (bounds.left - rect.left, bounds.top - rect.top))
+        rgb = pygame.surfarray.array3d(base).transpose(1, 0, 2)
+        return self._write_block(rect, quantize_rgb(rgb, self.palette))
+
     def resize(self, width, height):
         """Resize canvas"""
         self.width = width
         self.height = height
-        old_surface = self.surface
-        self.surface = pygame.Surface((width, height))
-        self.surface.fill(self.terrains[0][1])
-        self.surface.blit(old_surface, (0, 0))
-        self.undo_stack.clear()
-        self.redo_stack.clear()
+        self.store = self.store.resized(width, height)
+        self.counts = self.store.histogram(len(self.terrains))
+        self.mip_levels = []
+        self.mip_dirty = []
+        self._changed()
+        self.history.clear()
+        self.pending = None
 
     def clear(self):
         """Clear canvas"""
-        self.surface.fill(self.terrains[0][1])
-        self.undo_stack.clear()
-        self.redo_stack.clear()
+        self.store.fill(pygame.Rect(0, 0, self.width, self.height), 0)
+        self.counts[:] = 0
+        self.counts[0] = self.width * self.height
+        self._changed()
+        self.history.clear()
+        self.pending = None
@@ -7,11 +7,15 @@ import os
 
 # Settings
 SETTINGS_FILE = "wod_editor_settings.json"
-RECOVERY_FILE = "wod_editor_recovery.png"
+# Recovery snapshot (.wodmap) and the journal of tiles edited since it was taken
+RECOVERY_FILE = "wod_editor_recovery.wodmap"
+RECOVERY_JOURNAL_FILE = "wod_editor_recovery.journal"
 RECOVERY_INFO_FILE = "wod_editor_recovery_info.json"
+# Backing file of memory-mapped canvases, doubles as their recovery data
+RECOVERY_MAP_FILE = "wod_editor_recovery.map"
 
 DEFAULT_SETTINGS = {
-    'last_save_path': 'my_map.png',
+    'last_save_path': 'my_map.wodmap',
     'canvas_width': 960,
     'canvas_height': 540,
     'dark_theme': True,
@@ -22,7 +26,9 @@ DEFAULT_SETTINGS = {
     'show_coordinates': True,
     'smooth_brush': True,
     'undo_limit': 30,
-    'auto_save_interval': 120,
+    'undo_memory_mb': 256,
+    'memory_mapped_canvas': False,
+    'auto_save_interval': 5,
     'ui_animations': True,
     'show_minimap': True,
     'panel_opacity': 95,
@@ -33,6 +39,7 @@ FPS = 60
 MIN_BRUSH = 1
 MAX_BRUSH = 100
 MAX_UNDO = 30
+UNDO_MEMORY_MB = 256
 MIN_ZOOM = 0.1
 MAX_ZOOM = 8.0
 
@@ -56,8 +63,13 @@ PRESETS = [
     ("Large", 1920, 1080),
     ("HD", 1600, 900),
     ("4K", 3840, 2160),
+    ("8K", 7680, 4320),
+    ("16K", 15360, 8640),
 ]
 
+# Canvases larger than this keep their pixels in chunks (see tiles.py)
+TILED_CANVAS_PIXELS = 3840 * 2160
+
 def load_settings():
     """Load settings from file"""
     try:
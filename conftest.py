@@ -0,0 +1,38 @@
+"""
+Shared test fixtures: canvases that are closed after each test, and a pixel reader
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import pytest
+
+from config import TERRAINS
+from canvas import CanvasManager
+
+def read_pixels(canvas):
+    """Copy of every terrain index on a canvas"""
+    return canvas.store.read(pygame.Rect(0, 0, canvas.width, canvas.height)).copy()
+
+@pytest.fixture
+def pixels():
+    return read_pixels
+
+@pytest.fixture
+def make_canvas():
+    """Build CanvasManagers like the constructor does, closing them all after the test"""
+    canvases = []
+
+    def make(width, height, terrains=TERRAINS, **kwargs):
+        canvas = CanvasManager(width, height, terrains, **kwargs)
+        canvases.append(canvas)
+        return canvas
+
+    yield make
+    for canvas in canvases:
+        canvas.close()
+
+@pytest.fixture(params=[False, True], ids=['dense', 'tiled'])
+def canvas(request, make_canvas):
+    return make_canvas(300, 200, tiled=request.param)
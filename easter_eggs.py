@@ -182,6 +182,12 @@ class EasterEggManager:
         self.update_shake_mode()
         self.update_sparkle_mode()
 
+    def animating(self):
+        """Whether a timed effect is running and the screen needs redrawing every frame"""
+        return (self.disco_mode or self.party_mode or self.inverted_mode or self.shake_mode
+                or self.sparkle_mode or bool(self.sparkles)
+                or (self.matrix_mode and bool(self.matrix_drops)))
+
     def get_disco_color(self, base_color):
         """Get disco mode color transformation"""
         if not self.disco_mode:
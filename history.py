@@ -0,0 +1,191 @@
+"""
+Undo history for WoD Map Editor
+"""
+
+import zlib
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+
+class UndoDelta:
+    """Before/after terrain indices of the tiles one operation touched.
+
+    A tile the store keeps uniform is held as its single terrain index.
+    """
+
+    TILE = 64
+
+    def __init__(self):
+        self.before = {}
+        self.after = {}
+        self.compressed = False
+        # Bytes this entry adds to its HistoryStore's running total, 0 once dropped
+        self.counted = 0
+
+    def nbytes(self):
+        """Memory held by this entry"""
+        total = 0
+        for tiles in (self.before, self.after):
+            for tile in tiles.values():
+                if isinstance(tile, int):
+                    continue
+                total += len(tile[1]) if self.compressed else tile.nbytes
+        return total
+
+    def tiles(self, which):
+        """Tile arrays of the 'before' or 'after' side, decompressing if needed"""
+        tiles = self.before if which == 'before' else self.after
+        if not self.compressed:
+            return tiles
+        return {key: tile if isinstance(tile, int) else
+                np.frombuffer(zlib.decompress(tile[1]), dtype=np.uint8).reshape(tile[0])
+                for key, tile in tiles.items()}
+
+    def compress(self):
+        """Pack both sides with zlib"""
+        if self.compressed:
+            return
+        packed = [{key: tile if isinstance(tile, int) else (tile.shape, zlib.compress(tile.tobytes(), 1))
+                   for key, tile in tiles.items()}
+                  for tiles in (self.before, self.after)]
+        self.before, self.after = packed
+        self.compressed = True
+
+class HistoryStore:
+    """Undo/redo stacks bounded by step count and a memory budget"""
+
+    # Entries this close to the top of the undo stack stay uncompressed
+    KEEP_RAW = 2
+
+    def __init__(self, max_steps=30, budget_mb=256):
+        self.max_steps = max_steps
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        # Started by the first entry to age out of the raw window
+        self._worker = None
+
+    def _compress_worker(self):
+        """Compress entries that have aged out of the raw window"""
+        while True:
+            delta = self._jobs.get()
+            if delta is None:
+                return
+            # Compress a throwaway copy so readers never see a half-packed entry
+            packed = UndoDelta()
+            with self._lock:
+                packed.before, packed.after = delta.before, delta.after
+                packed.compressed = delta.compressed
+            if packed.compressed:
+                continue
+            packed.compress()
+            with self._lock:
+                if not delta.compressed:
+                    delta.before, delta.after = packed.before, packed.after
+                    delta.compressed = True
+                    self._recount(delta)
+
+    def push(self, delta):
+        """Push a finished operation and enforce the limits"""
+        with self._lock:
+            self.undo_stack.append(delta)
+            delta.counted = delta.nbytes()
+            self._bytes += delta.counted
+            self._drop_all(self.redo_stack)
+            if len(self.undo_stack) > self.KEEP_RAW:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._compress_worker, daemon=True)
+                    self._worker.start()
+                self._jobs.put(self.undo_stack[-self.KEEP_RAW - 1])
+            self._evict()
+
+    def _evict(self):
+        """Drop the oldest undo entries while over a limit"""
+        while len(self.undo_stack) > max(1, self.max_steps):
+            self._drop(self.undo_stack.popleft())
+        if self._bytes <= self.budget:
+            return
+
+        # Over budget before the worker caught up: pack older entries right away
+        for delta in list(self.undo_stack)[:-self.KEEP_RAW]:
+            if not delta.compressed:
+                delta.compress()
+                self._recount(delta)
+            if self._bytes <= self.budget:
+                return
+        while len(self.undo_stack) > 1 and self._bytes > self.budget:
+            self._drop(self.undo_stack.popleft())
+
+    def _recount(self, delta):
+        """Update the running total after an entry changed size"""
+        if delta.counted:
+            size = delta.nbytes()
+            self._bytes += size - delta.counted
+            delta.counted = size
+
+    def _drop(self, delta):
+        """Take a discarded entry out of the running total"""
+        self._bytes -= delta.counted
+        delta.counted = 0
+
+    def _drop_all(self, stack):
+        for delta in stack:
+            self._drop(delta)
+        stack.clear()
+
+    def nbytes(self):
+        """Memory held by the undo and redo stacks"""
+        with self._lock:
+            return self._bytes
+
+    def undo(self):
+        """Move the newest entry to the redo stack, returns its before-tiles"""
+        with self._lock:
+            if not self.undo_stack:
+                return None
+            delta = self.undo_stack.pop()
+            self.redo_stack.append(delta)
+            return self._snapshot(delta, 'before')
+
+    def redo(self):
+        """Move the newest undone entry back, returns its after-tiles"""
+        with self._lock:
+            if not self.redo_stack:
+                return None
+            delta = self.redo_stack.pop()
+            self.undo_stack.append(delta)
+            return self._snapshot(delta, 'after')
+
+    def _snapshot(self, delta, which):
+        """Copy of one side of an entry, safe against the compressor swapping it"""
+        view = UndoDelta()
+        view.before, view.after, view.compressed = delta.before, delta.after, delta.compressed
+        return view.tiles(which)
+
+    def clear_redo(self):
+        """Forget undone operations"""
+        with self._lock:
+            self._drop_all(self.redo_stack)
+
+    def clear(self):
+        """Forget all history"""
+        with self._lock:
+            self._drop_all(self.undo_stack)
+            self._drop_all(self.redo_stack)
+
+    def close(self):
+        """Stop the compression worker and forget all history"""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._jobs.put(None)
+            worker.join()
+        self.clear()
+
+    def __len__(self):
+        return len(self.undo_stack)
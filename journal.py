@@ -0,0 +1,189 @@
+"""
+Recovery journal for WoD Map Editor
+
+Autosave keeps a full .wodmap snapshot of the canvas and appends the tiles
+changed since then to a journal, so each checkpoint writes only what was
+edited. Journal layout, all little-endian:
+    header    b'WODJRNL', version u16, width u32, height u32
+    records   x u32, y u32, w u16, h u16, encoding u8, size u32, crc32 u32, payload
+
+Payloads use the .wodmap tile encodings. Replay stops at the first record a
+crash cut short. Once the journal outgrows the snapshot it is compacted into
+a new snapshot.
+"""
+
+import os
+import zlib
+import struct
+import threading
+
+import pygame
+
+from tiles import MappedStore
+import mapfile
+
+MAGIC = b'WODJRNL'
+VERSION = 1
+
+HEADER = struct.Struct('<7sHII')
+RECORD = struct.Struct('<IIHHBII')
+
+class RecoveryJournal:
+    """Snapshot plus append-only journal of the tiles edited since"""
+
+    # Journals are compacted once larger than this and the snapshot itself
+    COMPACT_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, base_path, journal_path):
+        self.base_path = base_path
+        self.journal_path = journal_path
+        self.canvas = None
+        self.dirty = set()
+        self.size = None
+        self.lock = threading.Lock()
+        # Shared with the save thread, under the lock
+        self.queue = []
+        self.needs_base = True
+        self.base_bytes = 0
+        self.journal_bytes = 0
+
+    def attach(self, canvas):
+        """Follow the edits of a canvas; the next checkpoint writes a full snapshot"""
+        if canvas is not self.canvas:
+            canvas.add_listener(self._on_change)
+            self.canvas = canvas
+        self.reset()
+
+    def reset(self):
+        """Drop queued checkpoints and start from a full snapshot next time"""
+        with self.lock:
+            self.queue = []
+            self.needs_base = True
+        self.dirty.clear()
+
+    def _on_change(self, rect):
+        """Listener marking the journal tiles under changed pixels"""
+        size = mapfile.TILE_SIZE
+        for ty in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for tx in range(rect.left // size, (rect.right - 1) // size + 1):
+                self.dirty.add((tx, ty))
+
+    def checkpoint(self):
+        """Queue the changes since the last checkpoint for write(), False if there are none"""
+        canvas = self.canvas
+        if canvas is None:
+            return False
+        size = (canvas.width, canvas.height)
+        with self.lock:
+            if isinstance(canvas.store, MappedStore):
+                # The mapped file is its own recovery data, it only needs flushing
+                self.queue = [('flush', canvas.snapshot())]
+                self.size = size
+            elif (self.needs_base or size != self.size
+                  or self.journal_bytes > max(self.COMPACT_BYTES, self.base_bytes)):
+                # A snapshot supersedes anything still queued
+                self.queue = [('base', canvas.snapshot())]
+                self.needs_base = False
+                self.size = size
+            elif self.dirty:
+                bounds = pygame.Rect(0, 0, canvas.width, canvas.height)
+                tiles = []
+                for tx, ty in sorted(self.dirty):
+                    rect = pygame.Rect(tx * mapfile.TILE_SIZE, ty * mapfile.TILE_SIZE,
+                                       mapfile.TILE_SIZE, mapfile.TILE_SIZE).clip(bounds)
+                    if rect.width and rect.height:
+                        tiles.append((rect, canvas.store.read(rect).copy()))
+                self.queue.append(('tiles', tiles))
+            else:
+                return False
+        self.dirty.clear()
+        return True
+
+    def write(self):
+        """Write the queued checkpoints, returns whether the canvas is mapped or None if idle"""
+        with self.lock:
+            queue, self.queue = self.queue, []
+        if not queue:
+            return None
+        mapped = False
+        try:
+            for kind, data in queue:
+                if kind == 'flush':
+                    data.flush()
+                    mapped = True
+                elif kind == 'base':
+                    # Empty the journal before replacing the snapshot: a crash in
+                    # between leaves an older map, never stale records on a newer one
+                    self._start_journal(data.width, data.height)
+                    mapfile.save(data, self.base_path)
+                    self.base_bytes = os.path.getsize(self.base_path)
+                else:
+                    self._append(data)
+        except Exception:
+            with self.lock:
+                self.needs_base = True
+            raise
+        return mapped
+
+    def _start_journal(self, width, height):
+        """Replace the journal with an empty one for a canvas size"""
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, width, height))
+        os.replace(temp_path, self.journal_path)
+        self.journal_bytes = HEADER.size
+
+    def _append(self, tiles):
+        """Append one record per tile to the journal"""
+        records = []
+        for rect, block in tiles:
+            encoding, payload = mapfile.encode_tile(block)
+            records.append(RECORD.pack(rect.x, rect.y, rect.width, rect.height, encoding,
+                                       len(payload), zlib.crc32(payload)))
+            records.append(payload)
+        data = b''.join(records)
+        if not os.path.exists(self.journal_path):
+            # Deleted under us (a map save clears recovery files): write() falls back to a snapshot
+            raise OSError("recovery journal is missing")
+        with open(self.journal_path, 'ab') as f:
+            f.write(data)
+        self.journal_bytes += len(data)
+
+def read_journal(path, width, height):
+    """Yield (rect, data) for every intact record of a journal over a width x height map"""
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return
+    with f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        magic, version, journal_w, journal_h = HEADER.unpack(header)
+        if magic != MAGIC or version > VERSION or (journal_w, journal_h) != (width, height):
+            return
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            x, y, w, h, encoding, size, crc = RECORD.unpack(head)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                return
+            yield pygame.Rect(x, y, w, h), mapfile.decode_tile(encoding, payload, (h, w))
+
+class RecoveredMap(mapfile.MapFile):
+    """A recovery snapshot with its journal replayed on top, loaded like a .wodmap"""
+
+    def __init__(self, base_path, journal_path):
+        super().__init__(base_path)
+        self.journal_path = journal_path
+
+    def tiles(self, palette):
+        """Yield (rect, data) for the snapshot tiles, then for every journal record"""
+        yield from super().tiles(palette)
+        remap = self.remap(palette)
+        for rect, data in read_journal(self.journal_path, self.width, self.height):
+            if remap is not None:
+                data = int(remap[data]) if isinstance(data, int) else remap[data]
+            yield rect, data
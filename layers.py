@@ -95,11 +95,11 @@ class LayerManager:
             return None, str(e)
 
     def apply_layer(self, canvas, idx):
-        """Bake layer into canvas"""
+        """Bake layer into a CanvasManager"""
         if 0 <= idx < len(self.layers):
             layer = self.layers[idx]
             if layer.visible and layer.image:
-                canvas.blit(layer.image, layer.pos)
+                canvas.apply_image(layer.image, layer.pos)
                 layer_name = layer.name
                 self.remove_layer(idx)
                 return layer_name
@@ -0,0 +1,222 @@
+"""
+Widget layout for WoD Map Editor
+
+Rects of every clickable widget, worked out from the window size and the
+bits of state that move them. Event handlers hit-test against these and the
+draw functions in ui.py place their widgets with them, so handling input
+never has to draw anything. Results are cached per input: treat the rects
+as read-only.
+"""
+
+import pygame
+from functools import lru_cache
+
+TOOLBAR_H = 90
+SIDE_PANEL_W = 340
+
+TOOLBAR_BUTTONS = ("Save", "Load", "New", "Layers", "Settings", "Help")
+
+# (tool, label, hotkey)
+TOOLS = (
+    ("brush", "Brush", "B"),
+    ("eraser", "Eraser", "E"),
+    ("fill", "Fill", "F"),
+    ("rect", "Rectangle", "R"),
+    ("line", "Line", "L"),
+    ("circle", "Circle", "C"),
+    ("picker", "Picker", "P"),
+)
+
+# (setting, label) for the settings dialog checkboxes
+SETTINGS_OPTIONS = (
+    ('dark_theme', "Dark Theme"),
+    ('show_grid', "Show Grid"),
+    ('show_minimap', "Show Minimap"),
+    ('smooth_brush', "Smooth Brush (Anti-aliased)"),
+    ('show_coordinates', "Show Coordinates"),
+)
+
+LAYER_ACTIONS = ('add_layer', 'toggle', 'apply', 'clear', 'close')
+
+@lru_cache(maxsize=4)
+def welcome_layout(width, height):
+    """Start button of the welcome screen"""
+    btn_w = 300
+    return pygame.Rect(width // 2 - btn_w // 2, height - 200, btn_w, 60)
+
+@lru_cache(maxsize=4)
+def canvas_select_layout(width, presets):
+    """(rect, width, height, kind) of every preset card and the load button"""
+    start_y = 180
+    cols = 3
+    card_w = 280
+    card_h = 100
+    spacing_x = 30
+    spacing_y = 30
+
+    total_width = cols * card_w + (cols - 1) * spacing_x
+    start_x = (width - total_width) // 2
+
+    rects = []
+    for i, (name, w, h) in enumerate(presets):
+        x = start_x + (i % cols) * (card_w + spacing_x)
+        y = start_y + (i // cols) * (card_h + spacing_y)
+        rects.append((pygame.Rect(x, y, card_w, card_h), w, h, 'preset'))
+
+    load_y = start_y + ((len(presets) - 1) // cols + 1) * (card_h + spacing_y) + 20
+    rects.append((pygame.Rect(width // 2 - 150, load_y, 300, 50), 0, 0, 'load'))
+    return rects
+
+@lru_cache(maxsize=4)
+def toolbar_layout(width):
+    """(rect, label) of the toolbar buttons"""
+    btn_x = width - 650
+    btn_w = 90
+    btn_spacing = 10
+    rects = []
+    for label in TOOLBAR_BUTTONS:
+        rects.append((pygame.Rect(btn_x, 20, btn_w, 50), label))
+        btn_x += btn_w + btn_spacing
+    return rects
+
+class SidePanelLayout:
+    """Terrain cards, tool buttons and brush slider of the side panel"""
+
+    def __init__(self, width, height, terrain_count):
+        self.rect = pygame.Rect(width - SIDE_PANEL_W, TOOLBAR_H, SIDE_PANEL_W, height - TOOLBAR_H)
+        left = self.rect.x + 20
+        inner_w = SIDE_PANEL_W - 40
+        y = 110
+
+        # Terrain grid (2 columns)
+        self.terrain_title_y = y
+        y += 40
+        cols = 2
+        terrain_w = (SIDE_PANEL_W - 60) // cols
+        terrain_h = 44
+        spacing = 10
+        self.terrain_rects = []
+        for i in range(terrain_count):
+            x = left + (i % cols) * (terrain_w + spacing)
+            self.terrain_rects.append(pygame.Rect(x, y + (i // cols) * (terrain_h + spacing),
+                                                  terrain_w, terrain_h))
+        y += ((terrain_count - 1) // cols + 1) * (terrain_h + spacing) + 25
+
+        # Tools
+        self.tools_rule_y = y
+        y += 15
+        self.tools_title_y = y
+        y += 35
+        self.tool_rects = []
+        for tool_name, label, hotkey in TOOLS:
+            self.tool_rects.append((pygame.Rect(left, y, inner_w, 36), tool_name))
+            y += 40
+        y += 10
+
+        # Brush size slider
+        self.brush_rule_y = y
+        y += 15
+        self.brush_label_y = y
+        y += 25
+        self.slider_rect = pygame.Rect(left, y, inner_w, 20)
+
+@lru_cache(maxsize=4)
+def side_panel_layout(width, height, terrain_count):
+    """SidePanelLayout for a window size"""
+    return SidePanelLayout(width, height, terrain_count)
+
+@lru_cache(maxsize=4)
+def settings_layout(width, height):
+    """Settings dialog rect and its (setting or 'close', rect) hit areas"""
+    panel_w = 500
+    panel_h = 400
+    panel = pygame.Rect(width // 2 - panel_w // 2, height // 2 - panel_h // 2, panel_w, panel_h)
+
+    rects = []
+    y = panel.y + 70
+    for key, label in SETTINGS_OPTIONS:
+        rects.append((key, pygame.Rect(panel.x + 20, y, 30, 30)))
+        y += 45
+    rects.append(('close', pygame.Rect(panel.x + 150, panel.bottom - 60, 200, 40)))
+    return panel, rects
+
+@lru_cache(maxsize=4)
+def help_layout(width, height):
+    """Help dialog rect and its ('close', rect) hit area"""
+    panel_w = 600
+    panel_h = 500
+    panel = pygame.Rect(width // 2 - panel_w // 2, height // 2 - panel_h // 2, panel_w, panel_h)
+    return panel, [('close', pygame.Rect(panel.x + 200, panel.bottom - 60, 200, 40))]
+
+class LayerPanelLayout:
+    """Layer manager panel; rects holds the hit areas in the order they are tested"""
+
+    def __init__(self, width, height, layer_count, has_current, custom_pos=None):
+        panel_w = 600
+        panel_h = min(500, height - 200)
+
+        # Use custom position if dragged, otherwise default centered position
+        if custom_pos:
+            panel_x = max(0, min(width - panel_w, custom_pos[0]))
+            panel_y = max(TOOLBAR_H, min(height - panel_h, custom_pos[1]))
+        else:
+            panel_x = width // 2 - panel_w // 2
+            panel_y = height - panel_h - 60
+        self.rect = pygame.Rect(panel_x, panel_y, panel_w, panel_h)
+        left = panel_x + 20
+        inner_w = panel_w - 40
+
+        # Drag handle bar at the top
+        self.drag_handle = pygame.Rect(panel_x, panel_y, panel_w, 60)
+        self.rects = [('drag_handle', self.drag_handle, 0)]
+
+        y = panel_y + 20
+        self.title_y = y
+        y += 35
+        self.subtitle_y = y
+        y += 25
+        self.rule_ys = [y]
+        y += 15
+
+        # Layer list
+        layer_list_h = 180
+        list_y = y
+        self.layer_rects = []
+        for i in range(layer_count):
+            rect = pygame.Rect(left, y, inner_w, 38)
+            self.layer_rects.append(rect)
+            self.rects.append(('layer_select', rect, i))
+            y += 42
+        y = list_y + max(layer_list_h, layer_count * 42 + 10)
+        self.rule_ys.append(y)
+        y += 15
+
+        # Current layer sliders
+        self.alpha_slider = self.scale_slider = None
+        if has_current:
+            self.alpha_label_y = y
+            y += 25
+            self.alpha_slider = pygame.Rect(left, y, inner_w, 22)
+            self.rects.append(('alpha_slider', self.alpha_slider))
+            y += 35
+            self.scale_label_y = y
+            y += 25
+            self.scale_slider = pygame.Rect(left, y, inner_w, 22)
+            self.rects.append(('scale_slider', self.scale_slider))
+            y += 40
+        self.rule_ys.append(y)
+        y += 12
+
+        # Action buttons
+        btn_count = len(LAYER_ACTIONS)
+        btn_w = (inner_w - 10 * (btn_count - 1)) // btn_count
+        self.buttons = []
+        for i, action in enumerate(LAYER_ACTIONS):
+            rect = pygame.Rect(left + i * (btn_w + 10), y, btn_w, 44)
+            self.buttons.append((action, rect))
+            self.rects.append((action, rect))
+
+@lru_cache(maxsize=8)
+def layer_panel_layout(width, height, layer_count, has_current, custom_pos=None):
+    """LayerPanelLayout for a window size, layer count and drag position"""
+    return LayerPanelLayout(width, height, layer_count, has_current, custom_pos)
@@ -18,8 +18,12 @@ from config import *
 from animation import AnimationManager
 from layers import LayerManager
 from canvas import CanvasManager
+from renderer import CanvasRenderer, CheckerBackground, GridOverlay, ScreenUpdates, zoomed_rect
+from tiles import MappedStore
+from journal import RecoveryJournal
 from utils import *
 from ui import *
+from layout import *
 from easter_eggs import EasterEggManager
 
 def main():
@@ -59,6 +63,11 @@ def main():
     canvas_manager = None
     layer_manager = LayerManager()
     anim_manager = AnimationManager()
+    canvas_renderer = CanvasRenderer()
+    checker_background = CheckerBackground()
+    grid_overlay = GridOverlay()
+    screen_updates = ScreenUpdates()
+    canvas_changes = []
     ui_state = UIState()
     easter_egg_manager = EasterEggManager()
 
@@ -76,8 +85,9 @@ def main():
     painting = False
     panning = False
     pan_start = None
-    last_paint_pos = None
     shape_start = None
+    # Canvas vertices of a polyline still being placed with the line tool
+    line_points = []
     unsaved_changes = False
     dragging_slider = False
     show_exit_confirm = False
@@ -113,13 +123,48 @@ def main():
     print("  - Ctrl+Shift+1-9 for overlay layer control")
     print("\nPress H for help")
     print("Press Ctrl+O for multi-layer overlay")
-    print("Auto-save: ON (every {}s)".format(settings.get('auto_save_interval', 120)))
+    print("Auto-save: ON (every {}s)".format(settings.get('auto_save_interval', 5)))
     print("=" * 50)
 
     clock = pygame.time.Clock()
+    saver = BackgroundSaver()
+    journal = RecoveryJournal(RECOVERY_FILE, RECOVERY_JOURNAL_FILE)
     running = True
     last_auto_save = pygame.time.get_ticks()
-    auto_save_interval = settings.get('auto_save_interval', 120) * 1000
+    auto_save_interval = settings.get('auto_save_interval', 5) * 1000
+
+    def make_canvas(w, h, store=None):
+        """Create a CanvasManager with the configured undo limits and storage"""
+        # The old canvas stops its history worker and lets go of the shared backing file
+        if canvas_manager:
+            if isinstance(canvas_manager.store, MappedStore):
+                # Queued saves still read the mapping, and the next mapped canvas truncates its file
+                saver.wait()
+            canvas_manager.close()
+        if store is None and settings.get('memory_mapped_canvas', False):
+            store = MappedStore(w, h, RECOVERY_MAP_FILE)
+        canvas = CanvasManager(w, h, TERRAINS,
+                               settings.get('undo_limit', MAX_UNDO),
+                               settings.get('undo_memory_mb', UNDO_MEMORY_MB),
+                               tiled=w * h > TILED_CANVAS_PIXELS, store=store)
+        journal.attach(canvas)
+        canvas.add_listener(canvas_changes.append)
+        return canvas
+
+    # Pick up unsaved work left behind by a crash
+    if check_for_recovery():
+        loaded, canvas_w, canvas_h, recovery_info = load_recovery_file()
+        if loaded is not None:
+            if isinstance(loaded, MappedStore):
+                canvas_manager = make_canvas(canvas_w, canvas_h, store=loaded)
+            else:
+                canvas_manager = make_canvas(canvas_w, canvas_h)
+                fill_canvas(canvas_manager, loaded)
+            settings['last_save_path'] = recovery_info.get('last_save_path') or settings['last_save_path']
+            base_canvas_x = (WIDTH - canvas_w) // 2
+            unsaved_changes = True
+            current_screen = "editor"
+            ui_state.add_notification("Recovered unsaved work", 'warning', 4000)
 
     def get_screen_to_canvas():
         """Create screen_to_canvas function with current state"""
@@ -130,7 +175,15 @@ def main():
             settings.get('grid_size', 32)
         )
 
+    idle = False
+    idle_timeout = 0
     while running:
+        events = []
+        if idle:
+            # Nothing is moving on screen: sleep until input arrives or a timer is due
+            event = pygame.event.wait(idle_timeout)
+            if event.type != NOEVENT:
+                events.append(event)
         dt = clock.tick(FPS)
         anim_manager.update()
 
@@ -140,18 +193,41 @@ def main():
         # Auto-save
         if settings['auto_save'] and current_screen == "editor" and canvas_manager:
             if current_time - last_auto_save > auto_save_interval:
-                if unsaved_changes:
-                    save_recovery_file(canvas_manager.surface, canvas_manager.width, 
-                                     canvas_manager.height, settings['last_save_path'])
+                if unsaved_changes and not saver.busy('recovery'):
+                    # Only tiles edited since the last checkpoint get written
+                    if journal.checkpoint():
+                        saver.submit('recovery', save_recovery_file, journal, settings['last_save_path'])
                     last_auto_save = current_time
 
-        for event in pygame.event.get():
+        # Results of saves finished on the worker thread
+        for key, result, error in saver.poll():
+            if key != 'map':
+                continue
+            if error:
+                unsaved_changes = True
+                ui_state.add_notification(f"Save failed: {error}", 'error')
+            else:
+                # The recovery files went with the save: start over from a full snapshot
+                journal.reset()
+                settings['last_save_path'] = result
+                saver.submit('settings', save_settings, dict(settings))
+                ui_state.add_notification(f"Saved: {os.path.basename(result)}", 'success')
+
+                # Easter egg: Check rapid save
+                egg_msg = easter_egg_manager.check_rapid_save()
+                if egg_msg:
+                    ui_state.add_notification(egg_msg, 'success', 5000)
+
+        events.extend(pygame.event.get())
+        for event in events:
             if event.type == QUIT:
-                if settings['auto_save'] and unsaved_changes and canvas_manager:
-                    save_recovery_file(canvas_manager.surface, canvas_manager.width,
-                                     canvas_manager.height, settings['last_save_path'])
+                if settings['auto_save'] and unsaved_changes and journal.checkpoint():
+                    saver.submit('recovery', save_recovery_file, journal, settings['last_save_path'])
                 running = False
 
+            elif event.type in (VIDEOEXPOSE, WINDOWEXPOSED):
+                screen_updates.invalidate()
+
             elif event.type == VIDEORESIZE:
                 WIDTH, HEIGHT = event.w, event.h
                 if canvas_manager:
@@ -179,6 +255,8 @@ def main():
                         show_settings = False
                     elif show_help:
                         show_help = False
+                    elif line_points:
+                        line_points = []
                     else:
                         running = False
 
@@ -353,20 +431,11 @@ def main():
 
                     # Save/Load
                     elif event.key == K_s and pygame.key.get_mods() & KMOD_CTRL:
-                        result = save_map(canvas_manager.surface, settings['last_save_path'])
-                        if result:
-                            settings['last_save_path'] = result
-                            save_settings(settings)
+                        filename = ask_save_path(settings['last_save_path'])
+                        if filename:
+                            saver.submit('map', write_map, canvas_manager.snapshot(), filename)
                             unsaved_changes = False
-                            delete_recovery_files()
-                            ui_state.add_notification(f"Saved: {os.path.basename(result)}", 'success')
-
-                            # Easter egg: Check rapid save
-                            egg_msg = easter_egg_manager.check_rapid_save()
-                            if egg_msg:
-                                ui_state.add_notification(egg_msg, 'success', 5000)
-                        elif result is False:
-                            ui_state.add_notification("Save failed", 'error')
+                            ui_state.add_notification(f"Saving {os.path.basename(filename)}...", 'accent')
                     elif event.key == K_n and pygame.key.get_mods() & KMOD_CTRL:
                         current_screen = "canvas_select"
 
@@ -412,8 +481,7 @@ def main():
             elif event.type == MOUSEBUTTONDOWN and event.button == 1:
                 # Handle settings panel
                 if show_settings:
-                    settings_rects = draw_settings_panel(screen, WIDTH, HEIGHT, settings,
-                                                        COLORS, font_large, font, small_font)
+                    _, settings_rects = settings_layout(WIDTH, HEIGHT)
                     for item in settings_rects:
                         name, rect = item
                         if rect.collidepoint(mx, my):
@@ -422,24 +490,25 @@ def main():
                             elif name == 'dark_theme':
                                 settings['dark_theme'] = not settings['dark_theme']
                                 COLORS = get_colors(settings['dark_theme'])
-                                save_settings(settings)
+                                saver.submit('settings', save_settings, dict(settings))
                             elif name in settings:
                                 settings[name] = not settings[name]
-                                save_settings(settings)
+                                saver.submit('settings', save_settings, dict(settings))
                             break
 
                 # Handle help panel
                 elif show_help:
-                    help_rects = draw_help_panel(screen, WIDTH, HEIGHT, COLORS,
-                                                 font_large, font, tiny_font)
+                    _, help_rects = help_layout(WIDTH, HEIGHT)
                     for name, rect in help_rects:
                         if rect.collidepoint(mx, my) and name == 'close':
                             show_help = False
                             break
 
                 elif show_overlay_controls and layer_manager.layers:
-                    layer_rects, panel_rect = draw_layer_panel(screen, WIDTH, HEIGHT, layer_manager,
-                                                   COLORS, settings, font_large, small_font, tiny_font, layer_panel_pos)
+                    panel_layout = layer_panel_layout(WIDTH, HEIGHT, len(layer_manager.layers),
+                                                      layer_manager.get_current_layer() is not None,
+                                                      layer_panel_pos)
+                    layer_rects, panel_rect = panel_layout.rects, panel_layout.rect
                     handled = False
 
                     for item in layer_rects:
@@ -470,8 +539,9 @@ def main():
                                             'accent'
                                         )
                                 elif name == 'apply':
+                                    canvas_manager.save_state()
                                     layer_name = layer_manager.apply_layer(
-                                        canvas_manager.surface,
+                                        canvas_manager,
                                         layer_manager.current_idx
                                     )
                                     if layer_name:
@@ -534,23 +604,22 @@ def main():
                                                     my - layer.pos[1] * zoom_level)
 
                 elif current_screen == "welcome":
-                    start_btn, title_rect = draw_welcome_screen(screen, WIDTH, HEIGHT, COLORS,
-                                                                font_large, font, small_font, tiny_font,
-                                                                use_alternate_welcome)
+                    start_btn = welcome_layout(WIDTH, HEIGHT)
                     if start_btn.collidepoint(mx, my):
                         current_screen = "canvas_select"
                         ui_state.add_notification("Welcome to WoD Map Maker!", 'accent', 2000)
 
                 elif current_screen == "canvas_select":
-                    rects = draw_canvas_select(screen, WIDTH, HEIGHT, COLORS, PRESETS,
-                                              font_large, font, small_font, tiny_font)
+                    rects = canvas_select_layout(WIDTH, tuple(PRESETS))
                     for rect, w, h, btn_type in rects:
                         if rect.collidepoint(mx, my):
                             if btn_type == 'load':
                                 loaded, canvas_w, canvas_h = load_map()
                                 if loaded:
-                                    canvas_manager = CanvasManager(canvas_w, canvas_h, TERRAINS)
-                                    canvas_manager.surface = loaded
+                                    canvas_manager = make_canvas(canvas_w, canvas_h)
+                                    snapped = fill_canvas(canvas_manager, loaded)
+                                    if snapped:
+                                        ui_state.add_notification(f"Snapped {snapped} off-palette pixels", 'warning')
                                     base_canvas_x = (WIDTH - canvas_w) // 2
                                     base_canvas_y = 100
                                     unsaved_changes = False
@@ -559,12 +628,12 @@ def main():
                                 elif canvas_h:
                                     ui_state.add_notification(f"Load failed: {canvas_h}", 'error')
                             else:
-                                canvas_manager = CanvasManager(w, h, TERRAINS)
+                                canvas_manager = make_canvas(w, h)
                                 base_canvas_x = (WIDTH - w) // 2
                                 base_canvas_y = 100
                                 settings['canvas_width'] = w
                                 settings['canvas_height'] = h
-                                save_settings(settings)
+                                saver.submit('settings', save_settings, dict(settings))
                                 ui_state.add_notification(f"Canvas created: {w}x{h}", 'success')
                                 current_screen = "editor"
 
@@ -582,13 +651,11 @@ def main():
                     # Get UI elements
                     screen_to_canvas_func = get_screen_to_canvas()
                     
-                    btn_rects = draw_toolbar(screen, WIDTH, canvas_manager.width,
-                                           canvas_manager.height, len(layer_manager.layers),
-                                           COLORS, font_large, small_font)
-                    terrain_rects, tool_rects, slider_rect = draw_side_panel(
-                        screen, WIDTH, HEIGHT, selected_terrain, tool, brush_size,
-                        TERRAINS, COLORS, font, small_font, tiny_font, MIN_BRUSH, MAX_BRUSH
-                    )
+                    btn_rects = toolbar_layout(WIDTH)
+                    panel_layout = side_panel_layout(WIDTH, HEIGHT, len(TERRAINS))
+                    terrain_rects = panel_layout.terrain_rects
+                    tool_rects = panel_layout.tool_rects
+                    slider_rect = panel_layout.slider_rect
 
                     # Check slider
                     if slider_rect.collidepoint(mx, my):
@@ -602,20 +669,18 @@ def main():
                         for btn, label in btn_rects:
                             if btn.collidepoint(mx, my):
                                 if label == "Save":
-                                    result = save_map(canvas_manager.surface, settings['last_save_path'])
-                                    if result:
-                                        settings['last_save_path'] = result
-                                        save_settings(settings)
+                                    filename = ask_save_path(settings['last_save_path'])
+                                    if filename:
+                                        saver.submit('map', write_map, canvas_manager.snapshot(), filename)
                                         unsaved_changes = False
-                                        delete_recovery_files()
-                                        ui_state.add_notification(f"Saved: {os.path.basename(result)}", 'success')
-                                    elif result is False:
-                                        ui_state.add_notification("Save failed", 'error')
+                                        ui_state.add_notification(f"Saving {os.path.basename(filename)}...", 'accent')
                                 elif label == "Load":
                                     loaded, canvas_w, canvas_h = load_map()
                                     if loaded:
-                                        canvas_manager = CanvasManager(canvas_w, canvas_h, TERRAINS)
-                                        canvas_manager.surface = loaded
+                                        canvas_manager = make_canvas(canvas_w, canvas_h)
+                                        snapped = fill_canvas(canvas_manager, loaded)
+                                        if snapped:
+                                            ui_state.add_notification(f"Snapped {snapped} off-palette pixels", 'warning')
                                         base_canvas_x = (WIDTH - canvas_w) // 2
                                         unsaved_changes = False
                                         ui_state.add_notification(f"Loaded: {canvas_w}x{canvas_h}", 'success')
@@ -678,7 +743,7 @@ def main():
                                     pan_start = (mx, my)
                                 elif tool == "fill":
                                     canvas_manager.save_state()
-                                    filled = canvas_manager.flood_fill(x, y, TERRAINS[selected_terrain][1])
+                                    filled, _ = canvas_manager.flood_fill(x, y, selected_terrain)
                                     if filled > 0:
                                         unsaved_changes = True
                                         ui_state.add_notification(f"Filled {filled} pixels", 'success')
@@ -695,9 +760,8 @@ def main():
                                     painting = True
                                     paint_start_time = pygame.time.get_ticks()
                                     canvas_manager.save_state()
-                                    last_paint_pos = (mx, my)
-                                    canvas_manager.paint(x, y, brush_size, selected_terrain,
-                                                       settings.get('smooth_brush', True))
+                                    canvas_manager.begin_stroke(x, y, brush_size, selected_terrain,
+                                                                settings.get('smooth_brush', True))
                                     unsaved_changes = True
 
                                     # Track terrain usage
@@ -708,8 +772,7 @@ def main():
                                 elif tool == "eraser":
                                     painting = True
                                     canvas_manager.save_state()
-                                    last_paint_pos = (mx, my)
-                                    canvas_manager.erase(x, y, brush_size)
+                                    canvas_manager.begin_stroke(x, y, brush_size, 0)
                                     unsaved_changes = True
 
             elif event.type == MOUSEBUTTONDOWN and event.button == 2:
@@ -764,60 +827,63 @@ def main():
                         x1, y1 = screen_to_canvas_func(shape_start[0], shape_start[1])
                         x2, y2 = screen_to_canvas_func(mx, my)
 
-                        canvas_manager.save_state()
-                        if tool == "rect":
-                            canvas_manager.draw_rectangle(x1, y1, x2, y2, selected_terrain)
-                        elif tool == "line":
-                            canvas_manager.draw_line(x1, y1, x2, y2, brush_size, selected_terrain)
-                        elif tool == "circle":
-                            radius = int(math.sqrt((x2 - x1)**2 + (y2 - y1)**2))
-                            canvas_manager.draw_circle(x1, y1, radius, brush_size, selected_terrain)
-
                         shape_start = None
-                        unsaved_changes = True
-
+                        if tool == "line":
+                            # An open polyline continues from its last vertex
+                            points = line_points + [(x2, y2)] if line_points else [(x1, y1), (x2, y2)]
+                            if pygame.key.get_mods() & KMOD_SHIFT:
+                                # Shift keeps the line open: the release point becomes a vertex
+                                line_points = points
+                            else:
+                                line_points = []
+                                canvas_manager.save_state()
+                                canvas_manager.draw_polyline(points, brush_size, selected_terrain)
+                                unsaved_changes = True
+                        else:
+                            canvas_manager.save_state()
+                            if tool == "rect":
+                                canvas_manager.draw_rectangle(x1, y1, x2, y2, selected_terrain)
+                            elif tool == "circle":
+                                radius = int(math.sqrt((x2 - x1)**2 + (y2 - y1)**2))
+                                filled = bool(pygame.key.get_mods() & KMOD_SHIFT)
+                                canvas_manager.draw_circle(x1, y1, radius, brush_size, selected_terrain,
+                                                           filled)
+                            unsaved_changes = True
+
+                    if painting:
+                        canvas_manager.end_stroke()
                     painting = False
-                    last_paint_pos = None
 
         # Continuous interactions
+        if line_points and tool != "line":
+            # Picking another tool drops an unfinished polyline
+            line_points = []
+
         if dragging_layer_panel and layer_panel_drag_offset:
             layer_panel_pos = (mx - layer_panel_drag_offset[0], my - layer_panel_drag_offset[1])
 
         if dragging_slider and current_screen == "editor":
-            terrain_rects, tool_rects, slider_rect = draw_side_panel(
-                screen, WIDTH, HEIGHT, selected_terrain, tool, brush_size,
-                TERRAINS, COLORS, font, small_font, tiny_font, MIN_BRUSH, MAX_BRUSH
-            )
+            slider_rect = side_panel_layout(WIDTH, HEIGHT, len(TERRAINS)).slider_rect
             percent = max(0, min(1, (mx - slider_rect.x) / slider_rect.width))
             brush_size = int(MIN_BRUSH + percent * (MAX_BRUSH - MIN_BRUSH))
 
         if dragging_alpha_slider:
             layer = layer_manager.get_current_layer()
             if layer:
-                layer_rects, panel_rect = draw_layer_panel(screen, WIDTH, HEIGHT, layer_manager,
-                                               COLORS, settings, font_large, small_font, tiny_font, layer_panel_pos)
-                for item in layer_rects:
-                    if len(item) == 2:
-                        name, rect = item
-                        if name == 'alpha_slider':
-                            percent = max(0, min(1, (mx - rect.x) / rect.width))
-                            layer.alpha = int(255 * percent)
-                            layer.update_image()
-                            break
+                rect = layer_panel_layout(WIDTH, HEIGHT, len(layer_manager.layers), True,
+                                          layer_panel_pos).alpha_slider
+                percent = max(0, min(1, (mx - rect.x) / rect.width))
+                layer.alpha = int(255 * percent)
+                layer.update_image()
 
         if dragging_scale_slider:
             layer = layer_manager.get_current_layer()
             if layer:
-                layer_rects, panel_rect = draw_layer_panel(screen, WIDTH, HEIGHT, layer_manager,
-                                               COLORS, settings, font_large, small_font, tiny_font, layer_panel_pos)
-                for item in layer_rects:
-                    if len(item) == 2:
-                        name, rect = item
-                        if name == 'scale_slider':
-                            percent = max(0, min(1, (mx - rect.x) / rect.width))
-                            layer.scale = 0.1 + percent * (3.0 - 0.1)
-                            layer.update_image()
-                            break
+                rect = layer_panel_layout(WIDTH, HEIGHT, len(layer_manager.layers), True,
+                                          layer_panel_pos).scale_slider
+                percent = max(0, min(1, (mx - rect.x) / rect.width))
+                layer.scale = 0.1 + percent * (3.0 - 0.1)
+                layer.update_image()
 
         if dragging_overlay and overlay_drag_start:
             layer = layer_manager.get_current_layer()
@@ -844,32 +910,14 @@ def main():
 
             screen_to_canvas_func = get_screen_to_canvas()
             x, y = screen_to_canvas_func(mx, my)
-
-            if tool == "brush":
-                canvas_manager.paint(x, y, brush_size, selected_terrain,
-                                   settings.get('smooth_brush', True))
-            else:
-                canvas_manager.erase(x, y, brush_size)
-
-            if last_paint_pos:
-                lx, ly = last_paint_pos
-                steps = max(abs(mx - lx), abs(my - ly), 1)
-                for i in range(steps):
-                    t = i / steps
-                    ix = int(lx + (mx - lx) * t)
-                    iy = int(ly + (my - ly) * t)
-                    x, y = screen_to_canvas_func(ix, iy)
-                    if tool == "brush":
-                        canvas_manager.paint(x, y, brush_size, selected_terrain,
-                                           settings.get('smooth_brush', True))
-                    else:
-                        canvas_manager.erase(x, y, brush_size)
-            last_paint_pos = (mx, my)
+            canvas_manager.stroke_to(x, y)
         else:
             paint_start_time = None
 
         # Update Easter egg states
         easter_egg_manager.update_all_modes()
+        effects = easter_egg_manager.animating()
+        dialog_open = show_settings or show_help or bool(show_overlay_controls and layer_manager.layers)
 
         # Draw
         if current_screen == "welcome":
@@ -894,29 +942,12 @@ def main():
             zoomed_w = int(canvas_manager.width * zoom_level)
             zoomed_h = int(canvas_manager.height * zoom_level)
 
-            # Checkerboard background
-            checker_size = 16
-            for x in range(0, zoomed_w, checker_size):
-                for y in range(0, zoomed_h, checker_size):
-                    if (x // checker_size + y // checker_size) % 2 == 0:
-                        color = (200, 200, 200) if settings['dark_theme'] else (240, 240, 240)
-                    else:
-                        color = (180, 180, 180) if settings['dark_theme'] else (220, 220, 220)
-                    pygame.draw.rect(screen, color,
-                                   (canvas_x + x, canvas_y + y,
-                                    min(checker_size, zoomed_w - x),
-                                    min(checker_size, zoomed_h - y)))
-
-            # Scale canvas
-            if abs(zoom_level - 1.0) > 0.01:
-                zoomed_canvas = pygame.transform.smoothscale(canvas_manager.surface,
-                                                            (zoomed_w, zoomed_h))
-            else:
-                zoomed_canvas = canvas_manager.surface
-                canvas_x = base_canvas_x
-                canvas_y = base_canvas_y
+            # Checkerboard background, only where the canvas is on screen
+            checker_background.draw(screen, pygame.Rect(int(canvas_x), int(canvas_y), zoomed_w, zoomed_h),
+                                    settings['dark_theme'])
 
-            screen.blit(zoomed_canvas, (canvas_x, canvas_y))
+            # Scale only the visible part of the canvas
+            canvas_renderer.draw(screen, canvas_manager, canvas_x, canvas_y, zoom_level)
 
             # Draw all visible overlay layers
             for layer in layer_manager.layers:
@@ -941,16 +972,14 @@ def main():
             # Grid overlay
             if settings['show_grid'] and zoom_level >= 0.3:
                 grid_size = int(settings['grid_size'] * zoom_level)
-                grid_color = COLORS['grid']
+                grid_overlay.draw(screen, pygame.Rect(int(canvas_x), int(canvas_y), zoomed_w, zoomed_h),
+                                  grid_size, COLORS['grid'])
 
-                for x in range(0, zoomed_w, grid_size):
-                    pygame.draw.line(screen, grid_color,
-                                   (canvas_x + x, canvas_y),
-                                   (canvas_x + x, canvas_y + zoomed_h), 1)
-                for y in range(0, zoomed_h, grid_size):
-                    pygame.draw.line(screen, grid_color,
-                                   (canvas_x, canvas_y + y),
-                                   (canvas_x + zoomed_w, canvas_y + y), 1)
+            # Polyline placed so far, with a rubber band to the mouse
+            if line_points and tool == "line" and not shape_start:
+                points = [(int(px * zoom_level) + canvas_x, int(py * zoom_level) + canvas_y)
+                          for px, py in line_points]
+                pygame.draw.lines(screen, COLORS['accent_hover'], False, points + [(mx, my)], 3)
 
             # Shape preview
             if shape_start and tool in ["rect", "line", "circle"]:
@@ -965,11 +994,10 @@ def main():
                     h = int(abs(y2 - y1) * zoom_level)
                     pygame.draw.rect(screen, COLORS['accent_hover'], (left, top, w, h), 3)
                 elif tool == "line":
-                    sx1 = int(x1 * zoom_level) + canvas_x
-                    sy1 = int(y1 * zoom_level) + canvas_y
-                    sx2 = int(x2 * zoom_level) + canvas_x
-                    sy2 = int(y2 * zoom_level) + canvas_y
-                    pygame.draw.line(screen, COLORS['accent_hover'], (sx1, sy1), (sx2, sy2), 3)
+                    points = line_points + [(x2, y2)] if line_points else [(x1, y1), (x2, y2)]
+                    points = [(int(px * zoom_level) + canvas_x, int(py * zoom_level) + canvas_y)
+                              for px, py in points]
+                    pygame.draw.lines(screen, COLORS['accent_hover'], False, points, 3)
                 elif tool == "circle":
                     cx = int(x1 * zoom_level) + canvas_x
                     cy = int(y1 * zoom_level) + canvas_y
@@ -983,8 +1011,7 @@ def main():
             draw_side_panel(screen, WIDTH, HEIGHT, selected_terrain, tool, brush_size,
                           TERRAINS, COLORS, font, small_font, tiny_font, MIN_BRUSH, MAX_BRUSH)
             
-            draw_minimap(screen, canvas_manager.surface, canvas_manager.width,
-                        canvas_manager.height, WIDTH, HEIGHT, zoom_level,
+            minimap_rect = draw_minimap(screen, canvas_manager, WIDTH, HEIGHT, zoom_level,
                         zoom_offset_x, zoom_offset_y, COLORS, tiny_font,
                         settings.get('show_minimap', True))
             
@@ -994,9 +1021,12 @@ def main():
                           brush_size, zoom_level, len(layer_manager.layers),
                           visible_layers, unsaved_changes, TERRAINS, COLORS, tiny_font,
                           canvas_manager.width, canvas_manager.height,
-                          screen_to_canvas_func, settings.get('show_coordinates', True))
+                          screen_to_canvas_func, settings.get('show_coordinates', True),
+                          canvas_manager.history_bytes(),
+                          canvas_manager.terrain_fraction(selected_terrain))
             
-            draw_notifications(screen, ui_state, WIDTH, COLORS, small_font)
+            for rect in draw_notifications(screen, ui_state, WIDTH, COLORS, small_font):
+                screen_updates.add_transient(rect)
 
             # Layer panel
             if show_overlay_controls and layer_manager.layers:
@@ -1011,7 +1041,7 @@ def main():
             # Help panel
             if show_help:
                 draw_help_panel(screen, WIDTH, HEIGHT, COLORS,
-                              font_large, font, tiny_font)
+                              font_large, font, small_font, tiny_font)
 
             # Easter egg visual effects
             easter_egg_manager.draw_party_effects(screen, WIDTH, HEIGHT)
@@ -1024,16 +1054,54 @@ def main():
             if easter_egg_manager.get_discovered_count() > 0:
                 progress_msg = easter_egg_manager.get_progress_message()
                 progress_color = easter_egg_manager.get_inverted_color(COLORS['accent_hover'])
-                progress_surf = tiny_font.render(progress_msg, True, progress_color)
+                progress_surf = render_text(tiny_font, progress_msg, True, progress_color)
                 screen.blit(progress_surf, (WIDTH - progress_surf.get_width() - 20, 95))
 
-        pygame.display.flip()
+            # Regions whose inputs changed since the last frame
+            screen_updates.region('toolbar', (0, 0, WIDTH, TOOLBAR_H), panel_version('toolbar'))
+            screen_updates.region('side_panel', (WIDTH - SIDE_PANEL_W, TOOLBAR_H, SIDE_PANEL_W, HEIGHT - TOOLBAR_H),
+                                  (panel_version('side_panel'), easter_egg_manager.get_discovered_count()))
+            screen_updates.region('status_bar', (0, HEIGHT - 35, WIDTH, 35), panel_version('status_bar'))
+
+            view_rect = pygame.Rect(0, TOOLBAR_H, WIDTH - SIDE_PANEL_W, HEIGHT - TOOLBAR_H)
+            view_inputs = (canvas_manager, canvas_x, canvas_y, zoom_level,
+                           settings['show_grid'], settings['grid_size'], settings.get('show_minimap', True),
+                           tuple((layer.image, layer.visible, tuple(layer.pos)) for layer in layer_manager.layers),
+                           tool, shape_start, tuple(line_points),
+                           (mx, my) if shape_start or line_points else None)
+            if not screen_updates.region('view', view_rect, view_inputs) and canvas_changes:
+                # Same view, so only the edited parts of the canvas (and the minimap) changed
+                for rect in canvas_changes:
+                    dirty = zoomed_rect(rect.inflate(2, 2), zoom_level).move(int(round(canvas_x)), int(round(canvas_y)))
+                    screen_updates.add(dirty.inflate(4, 4).clip(view_rect))
+                if minimap_rect:
+                    screen_updates.add(minimap_rect)
+
+        # Push the whole screen when the screen, window, theme or dialogs changed,
+        # and on every frame of full-screen effects
+        screen_updates.region('screen', screen.get_rect(),
+                              (current_screen, WIDTH, HEIGHT, settings['dark_theme'], dialog_open, effects))
+        screen_updates.update(full=current_screen != "editor" or dialog_open or effects)
+        del canvas_changes[:]
+
+        # Sleep in the next frame unless something is animating or input is in progress
+        idle = not (current_screen == "welcome" or effects or anim_manager.animations
+                    or ui_state.notification_queue or painting or panning or dragging_slider
+                    or dragging_overlay or dragging_alpha_slider or dragging_scale_slider
+                    or dragging_layer_panel or shape_start)
+        idle_timeout = 0
+        if saver.busy():
+            # Wake up to collect the result
+            idle_timeout = 100
+        elif settings['auto_save'] and current_screen == "editor" and canvas_manager and unsaved_changes:
+            idle_timeout = max(1, last_auto_save + auto_save_interval - pygame.time.get_ticks() + 1)
 
     # Cleanup
-    if settings['auto_save'] and unsaved_changes and canvas_manager:
-        save_recovery_file(canvas_manager.surface, canvas_manager.width,
-                         canvas_manager.height, settings['last_save_path'])
+    if settings['auto_save'] and unsaved_changes and journal.checkpoint():
+        saver.submit('recovery', save_recovery_file, journal, settings['last_save_path'])
         print("Work auto-saved to recovery file")
+    # Let in-flight saves finish before the process exits
+    saver.wait()
 
     pygame.quit()
     sys.exit()
@@ -0,0 +1,175 @@
+"""
+Native .wodmap format for WoD Map Editor
+
+Layout, all little-endian:
+    header    b'WODMAP', version u16, width u32, height u32, tile size u16, terrain count u16
+    terrains  per terrain: name length u8, name (utf-8), r u8, g u8, b u8
+    table     per tile, row-major: offset u64, size u32, encoding u8
+    tiles     payloads at their offsets, each decodable on its own
+
+Tile encodings: uniform (one index byte), RLE (run values u8 * n then run
+lengths u16 * n), or RLE packed with zlib when that is smaller.
+
+PNG export writes palette-indexed PNGs straight from the terrain indices.
+"""
+
+import os
+import zlib
+import struct
+
+import numpy as np
+import pygame
+
+from canvas import pack_rgb, palette_lut
+
+MAGIC = b'WODMAP'
+VERSION = 1
+TILE_SIZE = 256
+EXTENSION = '.wodmap'
+
+UNIFORM = 0
+RLE = 1
+RLE_ZLIB = 2
+
+HEADER = struct.Struct('<6sHIIHH')
+ENTRY = struct.Struct('<QIB')
+
+def tile_rects(width, height, size=TILE_SIZE):
+    """Canvas rects of every tile, row-major"""
+    return [pygame.Rect(x, y, min(size, width - x), min(size, height - y))
+            for y in range(0, height, size)
+            for x in range(0, width, size)]
+
+def encode_tile(block, compress=True):
+    """Encode one tile of terrain indices, returns (encoding, payload)"""
+    flat = block.ravel()
+    first = flat[0]
+    if (flat == first).all():
+        return UNIFORM, bytes([first])
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.append(starts, len(flat))).astype('<u2')
+    payload = flat[starts].tobytes() + lengths.tobytes()
+    if compress:
+        packed = zlib.compress(payload, 6)
+        if len(packed) < len(payload):
+            return RLE_ZLIB, packed
+    return RLE, payload
+
+def decode_tile(encoding, payload, shape):
+    """Decode one tile, a single int for uniform tiles"""
+    if encoding == UNIFORM:
+        return payload[0]
+    if encoding == RLE_ZLIB:
+        payload = zlib.decompress(payload)
+    runs = len(payload) // 3
+    values = np.frombuffer(payload, dtype=np.uint8, count=runs)
+    lengths = np.frombuffer(payload, dtype='<u2', count=runs, offset=runs)
+    return np.repeat(values, lengths).reshape(shape)
+
+def save(canvas, path, compress=True):
+    """Write a CanvasManager or CanvasSnapshot to a .wodmap file"""
+    rects = tile_rects(canvas.width, canvas.height)
+    header = [HEADER.pack(MAGIC, VERSION, canvas.width, canvas.height, TILE_SIZE, len(canvas.terrains))]
+    for name, color in canvas.terrains:
+        encoded = name.encode('utf-8')[:255]
+        header.append(struct.pack('<B', len(encoded)) + encoded + bytes(color))
+    header = b''.join(header)
+
+    offset = len(header) + ENTRY.size * len(rects)
+    table = []
+    payloads = []
+    for rect in rects:
+        encoding, payload = encode_tile(canvas.store.read(rect), compress)
+        table.append(ENTRY.pack(offset, len(payload), encoding))
+        payloads.append(payload)
+        offset += len(payload)
+
+    # Write next to the target and swap in, so a failed save never leaves half a map
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(table))
+        for payload in payloads:
+            f.write(payload)
+    os.replace(temp_path, path)
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+def save_png(canvas, path, band=256):
+    """Export a canvas as a palette-indexed PNG, encoding a band of rows at a time"""
+    width, height = canvas.width, canvas.height
+    compressor = zlib.compressobj(6)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)))
+        f.write(_png_chunk(b'PLTE', canvas.palette.tobytes()))
+        for top in range(0, height, band):
+            block = canvas.store.read(pygame.Rect(0, top, width, min(band, height - top)))
+            # Each row starts with filter type 0
+            rows = np.zeros((block.shape[0], width + 1), dtype=np.uint8)
+            rows[:, 1:] = block
+            data = compressor.compress(rows.tobytes())
+            if data:
+                f.write(_png_chunk(b'IDAT', data))
+        f.write(_png_chunk(b'IDAT', compressor.flush()))
+        f.write(_png_chunk(b'IEND', b''))
+    os.replace(temp_path, path)
+
+class MapFile:
+    """An open .wodmap file; tiles are only read and decoded when asked for"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            magic, version, self.width, self.height, self.tile_size, count = \
+                HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("not a .wodmap file")
+            if version > VERSION:
+                raise ValueError(f"unsupported .wodmap version {version}")
+            self.terrains = []
+            for _ in range(count):
+                length = self.file.read(1)[0]
+                name = self.file.read(length).decode('utf-8')
+                self.terrains.append((name, tuple(self.file.read(3))))
+            self.rects = tile_rects(self.width, self.height, self.tile_size)
+            table = self.file.read(ENTRY.size * len(self.rects))
+            self.entries = [ENTRY.unpack_from(table, i * ENTRY.size) for i in range(len(self.rects))]
+        except Exception:
+            self.file.close()
+            raise
+
+    def read_tile(self, i):
+        """Decode tile i (row-major): an index array, or an int if uniform"""
+        offset, size, encoding = self.entries[i]
+        self.file.seek(offset)
+        rect = self.rects[i]
+        return decode_tile(encoding, self.file.read(size), (rect.height, rect.width))
+
+    def remap(self, palette):
+        """Index array taking this file's terrains onto a palette, None if they match"""
+        colors = np.array([color for _, color in self.terrains], dtype=np.uint8)
+        remap = palette_lut(palette).lookup(pack_rgb(colors))
+        if np.array_equal(remap, np.arange(len(remap))):
+            return None
+        return remap
+
+    def tiles(self, palette):
+        """Yield (rect, data) for every tile, with indices mapped onto a palette"""
+        remap = self.remap(palette)
+        for i, rect in enumerate(self.rects):
+            data = self.read_tile(i)
+            if remap is not None:
+                data = int(remap[data]) if isinstance(data, int) else remap[data]
+            yield rect, data
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
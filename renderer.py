@@ -0,0 +1,273 @@
+"""
+Canvas rendering for WoD Map Editor
+"""
+
+import math
+import pygame
+
+def visible_canvas_rect(canvas_w, canvas_h, canvas_x, canvas_y, zoom_level, view_rect, margin=1):
+    """Canvas-space rect that shows through a screen-space view rect"""
+    left = max(0, math.floor((view_rect.left - canvas_x) / zoom_level) - margin)
+    top = max(0, math.floor((view_rect.top - canvas_y) / zoom_level) - margin)
+    right = min(canvas_w, math.ceil((view_rect.right - canvas_x) / zoom_level) + margin)
+    bottom = min(canvas_h, math.ceil((view_rect.bottom - canvas_y) / zoom_level) + margin)
+    if left >= right or top >= bottom:
+        return None
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+def zoomed_rect(rect, zoom_level):
+    """Rect in zoomed-canvas pixels covered by a canvas-space rect"""
+    x0 = int(round(rect.left * zoom_level))
+    y0 = int(round(rect.top * zoom_level))
+    x1 = int(round(rect.right * zoom_level))
+    y1 = int(round(rect.bottom * zoom_level))
+    return pygame.Rect(x0, y0, max(1, x1 - x0), max(1, y1 - y0))
+
+class CheckerBackground:
+    """Checkerboard behind the canvas, blitted from one cached pattern surface"""
+
+    CELL = 16
+
+    def __init__(self):
+        self.pattern = None
+        self.dark_theme = None
+
+    def _build(self, size, dark_theme):
+        """Pattern covering size plus one period, so any phase is a single blit"""
+        period = self.CELL * 2
+        if dark_theme:
+            light, dark = (200, 200, 200), (180, 180, 180)
+        else:
+            light, dark = (240, 240, 240), (220, 220, 220)
+        tile = pygame.Surface((period, period))
+        tile.fill(dark)
+        tile.fill(light, (0, 0, self.CELL, self.CELL))
+        tile.fill(light, (self.CELL, self.CELL, self.CELL, self.CELL))
+        self.pattern = pygame.Surface((size[0] + period, size[1] + period))
+        for y in range(0, self.pattern.get_height(), period):
+            for x in range(0, self.pattern.get_width(), period):
+                self.pattern.blit(tile, (x, y))
+        self.dark_theme = dark_theme
+
+    def draw(self, screen, rect, dark_theme):
+        """Fill the on-screen part of a screen-space canvas rect with checkers"""
+        view = screen.get_rect()
+        area = rect.clip(view)
+        if not area.width or not area.height:
+            return
+        if (self.pattern is None or dark_theme != self.dark_theme
+                or self.pattern.get_width() < view.width + self.CELL * 2
+                or self.pattern.get_height() < view.height + self.CELL * 2):
+            self._build(view.size, dark_theme)
+        # Cells stay anchored to the canvas corner
+        period = self.CELL * 2
+        phase = ((area.left - rect.left) % period, (area.top - rect.top) % period)
+        screen.blit(self.pattern, area.topleft, pygame.Rect(phase, area.size))
+
+class GridOverlay:
+    """Grid lines over the canvas, blitted from a cached colorkeyed pattern"""
+
+    def __init__(self):
+        self.pattern = None
+        self.key = None
+
+    def _build(self, size, spacing, color):
+        """Lines every spacing pixels over size plus one period"""
+        width, height = size[0] + spacing, size[1] + spacing
+        # RLE colorkey blits skip the gaps between lines, much cheaper than per-pixel alpha
+        background = (0, 0, 0) if tuple(color) != (0, 0, 0) else (255, 255, 255)
+        self.pattern = pygame.Surface((width, height))
+        self.pattern.fill(background)
+        self.pattern.set_colorkey(background, pygame.RLEACCEL)
+        for x in range(0, width, spacing):
+            pygame.draw.line(self.pattern, color, (x, 0), (x, height - 1), 1)
+        for y in range(0, height, spacing):
+            pygame.draw.line(self.pattern, color, (0, y), (width - 1, y), 1)
+
+    def draw(self, screen, rect, spacing, color):
+        """Draw grid lines every spacing pixels over the on-screen part of a canvas rect"""
+        view = screen.get_rect()
+        area = rect.clip(view)
+        if spacing < 1 or not area.width or not area.height:
+            return
+        key = (spacing, tuple(color))
+        if (key != self.key or self.pattern.get_width() < view.width + spacing
+                or self.pattern.get_height() < view.height + spacing):
+            self._build(view.size, spacing, color)
+            self.key = key
+        # Lines stay anchored to the canvas corner
+        phase = ((area.left - rect.left) % spacing, (area.top - rect.top) % spacing)
+        screen.blit(self.pattern, area.topleft, pygame.Rect(phase, area.size))
+
+class CanvasRenderer:
+    """Draws the visible part of the canvas at the current zoom"""
+
+    # Dirty rects beyond this count are merged into their union
+    MAX_DIRTY = 32
+    # The cache is scaled in blocks on a fixed canvas grid, so refreshing a
+    # block gives exactly the pixels a rebuild would. Blocks are about this
+    # many screen pixels wide: smaller ones make rebuilds slower, larger ones dabs.
+    BLOCK_SCREEN = 256
+
+    def __init__(self):
+        self.canvas_manager = None
+        self.cache = None
+        self.cache_src = None
+        self.cache_zoom = None
+        self.block = None
+        self.dirty = []
+
+    def _on_change(self, rect):
+        """Listener for canvas pixel changes"""
+        if self.cache is None or not rect.colliderect(self.cache_src):
+            return
+        self.dirty.append(rect.copy())
+        if len(self.dirty) > self.MAX_DIRTY:
+            self.dirty = [self.dirty[0].unionall(self.dirty[1:])]
+
+    def invalidate(self):
+        """Drop the scaled canvas cache"""
+        self.cache = None
+        self.cache_src = None
+        self.dirty = []
+
+    def _attach(self, canvas_manager):
+        """Start tracking a new canvas"""
+        self.canvas_manager = canvas_manager
+        canvas_manager.add_listener(self._on_change)
+        self.invalidate()
+
+    def _blocks(self, rect):
+        """Grid blocks overlapping a canvas rect, clipped to the cached area"""
+        size = self.block
+        for y in range(rect.top // size * size, rect.bottom, size):
+            for x in range(rect.left // size * size, rect.right, size):
+                block = pygame.Rect(x, y, size, size).clip(self.cache_src)
+                if block.width and block.height:
+                    yield block
+
+    def _draw_block(self, block):
+        """Scale one grid block into the cache"""
+        origin = zoomed_rect(self.cache_src, self.cache_zoom)
+        dest = zoomed_rect(block, self.cache_zoom)
+        self.cache.blit(self._scale_area(block), (dest.x - origin.x, dest.y - origin.y))
+
+    def _rebuild(self, visible, view):
+        """Scale the visible area plus a quarter-window margin on each side"""
+        canvas = self.canvas_manager
+        margin_x = int(view.width / 4 / self.cache_zoom) + 1
+        margin_y = int(view.height / 4 / self.cache_zoom) + 1
+        src = visible.inflate(margin_x * 2, margin_y * 2).clip(pygame.Rect(0, 0, canvas.width, canvas.height))
+        # Widen to whole blocks so every block is scaled the same way each time
+        size = 2 ** min(11, max(5, round(math.log2(self.BLOCK_SCREEN / self.cache_zoom))))
+        self.block = size
+        left, top = src.left // size * size, src.top // size * size
+        right = min(canvas.width, -(-src.right // size) * size)
+        bottom = min(canvas.height, -(-src.bottom // size) * size)
+        self.cache_src = pygame.Rect(left, top, right - left, bottom - top)
+        self.cache = pygame.Surface(zoomed_rect(self.cache_src, self.cache_zoom).size)
+        for block in self._blocks(self.cache_src):
+            self._draw_block(block)
+        self.dirty = []
+
+    def _scale_area(self, area):
+        """Scale a canvas rect to the cache zoom, starting from the nearest pyramid level"""
+        size = zoomed_rect(area, self.cache_zoom).size
+        if size == area.size:
+            return self.canvas_manager.region_surface(area)
+        if self.cache_zoom > 0.5:
+            return pygame.transform.smoothscale(self.canvas_manager.region_surface(area), size)
+        source, factor = self.canvas_manager.mip_level(self.cache_zoom)
+        if factor != 1.0:
+            level_w, level_h = source.get_size()
+            left = int(area.left * factor)
+            top = int(area.top * factor)
+            right = min(level_w, math.ceil(area.right * factor))
+            bottom = min(level_h, math.ceil(area.bottom * factor))
+            area = pygame.Rect(left, top, max(1, right - left), max(1, bottom - top))
+        return pygame.transform.smoothscale(source.subsurface(area), size)
+
+    def _refresh_dirty(self):
+        """Rescale only the cached blocks that drawing operations touched"""
+        blocks = set()
+        for rect in self.dirty:
+            blocks.update(tuple(block) for block in self._blocks(rect))
+        for block in blocks:
+            self._draw_block(pygame.Rect(block))
+        self.dirty = []
+
+    def draw(self, screen, canvas_manager, canvas_x, canvas_y, zoom_level):
+        """Blit the visible canvas area, rescaling only what changed"""
+        if canvas_manager is not self.canvas_manager:
+            self._attach(canvas_manager)
+
+        view = screen.get_rect()
+        visible = visible_canvas_rect(canvas_manager.width, canvas_manager.height,
+                                      canvas_x, canvas_y, zoom_level, view)
+        if visible is None:
+            return
+
+        origin_x = int(round(canvas_x))
+        origin_y = int(round(canvas_y))
+
+        bounds = pygame.Rect(0, 0, canvas_manager.width, canvas_manager.height)
+        if zoom_level != self.cache_zoom or (self.cache and not bounds.contains(self.cache_src)):
+            self.invalidate()
+            self.cache_zoom = zoom_level
+        if self.cache is None or not self.cache_src.contains(visible):
+            self._rebuild(visible, view)
+        elif self.dirty:
+            self._refresh_dirty()
+
+        dest = zoomed_rect(self.cache_src, zoom_level)
+        screen.blit(self.cache, (origin_x + dest.x, origin_y + dest.y))
+
+class ScreenUpdates:
+    """Screen rects to push to the display at the end of a frame.
+
+    Regions are pushed only when what they were drawn from changed since the
+    last frame. Transient rects (notifications and the like) are pushed on
+    the frame after too, so whatever they covered is shown again.
+    """
+
+    # Past this many rects one full update is cheaper
+    MAX_RECTS = 32
+
+    def __init__(self):
+        self.inputs = {}
+        self.rects = []
+        self.transient = []
+        self.last_transient = []
+        self.full = True
+
+    def invalidate(self):
+        """Push the whole screen at the next update"""
+        self.full = True
+
+    def region(self, name, rect, inputs):
+        """Push rect if inputs differ from last frame's, returns whether they did"""
+        if self.inputs.get(name) == inputs:
+            return False
+        self.inputs[name] = inputs
+        self.rects.append(pygame.Rect(rect))
+        return True
+
+    def add(self, rect):
+        """Push rect this frame"""
+        self.rects.append(pygame.Rect(rect))
+
+    def add_transient(self, rect):
+        """Push rect this frame and the next"""
+        self.transient.append(pygame.Rect(rect))
+
+    def update(self, full=False):
+        """Push the collected rects to the display"""
+        rects = self.rects + self.transient + [r for r in self.last_transient if r not in self.transient]
+        if full or self.full or len(rects) > self.MAX_RECTS:
+            pygame.display.update()
+        elif rects:
+            pygame.display.update(rects)
+        self.last_transient = self.transient
+        self.transient = []
+        self.rects = []
+        self.full = False
@@ -0,0 +1,86 @@
+"""
+Tests for the headless batch CLI
+"""
+
+import os
+import argparse
+import threading
+
+import numpy as np
+import pygame
+import pytest
+
+import batch
+import mapfile
+from config import TERRAINS
+
+def write_map(path, w=90, h=70, seed=0):
+    """Save a random palette PNG, returns its terrain indices"""
+    canvas = batch.make_canvas(w, h)
+    indices = np.random.default_rng(seed).integers(0, len(TERRAINS), size=(h, w), dtype=np.uint8)
+    canvas.load_tiles([(pygame.Rect(0, 0, w, h), indices)])
+    mapfile.save_png(canvas, str(path))
+    canvas.close()
+    return indices
+
+def options(out_dir, file_format='png', size=None):
+    return {'out_dir': str(out_dir), 'size': size, 'thumb_size': 32, 'format': file_format}
+
+def test_parse_size():
+    assert batch.parse_size('1920x1080') == (1920, 1080)
+    assert batch.parse_size('64X48') == (64, 48)
+    for text in ('1920', 'axb', '0x10', '10x-4'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            batch.parse_size(text)
+
+def test_convert_round_trips_through_wodmap(tmp_path, pixels):
+    indices = write_map(tmp_path / 'a.png')
+    (tmp_path / 'out').mkdir()
+    result = batch.run_job(('convert', str(tmp_path / 'a.png'), options(tmp_path / 'out', 'wodmap')))
+    assert result['ok'], result['info']
+
+    canvas, snapped = batch.load_canvas(str(tmp_path / 'out' / 'a.wodmap'))
+    assert snapped == 0
+    assert np.array_equal(pixels(canvas), indices)
+    canvas.close()
+
+def test_jobs_close_their_canvases(tmp_path):
+    write_map(tmp_path / 'a.png')
+    (tmp_path / 'broken.wodmap').write_bytes(b'not a map')
+    threads = threading.active_count()
+    for _ in range(20):
+        assert batch.run_job(('stats', str(tmp_path / 'a.png'), options(tmp_path)))['ok']
+        assert not batch.run_job(('stats', str(tmp_path / 'broken.wodmap'), options(tmp_path)))['ok']
+    assert threading.active_count() == threads
+
+def test_convert_resizes(tmp_path):
+    write_map(tmp_path / 'a.png')
+    (tmp_path / 'out').mkdir()
+    result = batch.run_job(('convert', str(tmp_path / 'a.png'), options(tmp_path / 'out', size=(40, 120))))
+    assert result['ok'] and result['info'] == '40x120'
+    assert pygame.image.load(str(tmp_path / 'out' / 'a.png')).get_size() == (40, 120)
+
+def test_stats_reports_off_palette_pixels(tmp_path):
+    image = pygame.Surface((20, 10))
+    image.fill(TERRAINS[1][1])
+    image.set_at((3, 4), (1, 2, 3))
+    pygame.image.save(image, str(tmp_path / 'b.png'))
+    result = batch.run_job(('stats', str(tmp_path / 'b.png'), options(tmp_path)))
+    assert result['ok']
+    assert result['info'].startswith('20x10, off-palette 1 |')
+
+def test_main_runs_every_map(tmp_path, capsys):
+    for i, name in enumerate(('a.png', 'b.png', 'c.png')):
+        write_map(tmp_path / name, seed=i)
+    (tmp_path / 'notes.txt').write_text('not a map')
+    assert batch.main(['thumbnail', str(tmp_path), '-j', '2']) == 0
+    thumbs = sorted(os.listdir(tmp_path / 'thumbnail'))
+    assert thumbs == ['a_thumb.png', 'b_thumb.png', 'c_thumb.png']
+    assert '3 file(s), 0 failed' in capsys.readouterr().out
+
+def test_main_reports_failures(tmp_path, capsys):
+    (tmp_path / 'broken.wodmap').write_bytes(b'not a map')
+    assert batch.main(['stats', str(tmp_path), '-j', '1']) == 1
+    assert 'broken.wodmap: stats FAILED' in capsys.readouterr().out
+    (tmp_path / 'empty').mkdir()
+    assert batch.main(['stats', str(tmp_path / 'empty')]) == 1
@@ -0,0 +1,199 @@
+"""
+Tests for the canvas drawing and undo code, checked against brute-force references
+"""
+
+import numpy as np
+import pygame
+import pytest
+
+from config import TERRAINS
+from history import UndoDelta
+
+def capsule_mask(width, height, x1, y1, x2, y2, radius):
+    """Pixels within radius of a segment, by exact integer distance to every pixel"""
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.int64)
+    px, py = xs - x1, ys - y1
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    dot = px * dx + py * dy
+    r2 = radius * radius
+    near_a = px * px + py * py <= r2
+    near_b = (xs - x2) ** 2 + (ys - y2) ** 2 <= r2
+    cross = px * dy - py * dx
+    strip = (length2 > 0) & (dot >= 0) & (dot <= length2) & (cross * cross <= r2 * length2)
+    return near_a | near_b | strip
+
+def test_undo_redo_round_trip(canvas, pixels):
+    states = [pixels(canvas)]
+    canvas.draw_rectangle(10, 10, 120, 90, 1)
+    canvas.save_state()
+    states.append(pixels(canvas))
+    canvas.paint(150, 100, 20, 2)
+    canvas.paint(160, 110, 20, 3, smooth=False)
+    canvas.save_state()
+    states.append(pixels(canvas))
+    canvas.flood_fill(0, 0, 4)
+    canvas.save_state()
+    states.append(pixels(canvas))
+
+    for state in reversed(states[:-1]):
+        canvas.undo()
+        assert np.array_equal(pixels(canvas), state)
+    for state in states[1:]:
+        canvas.redo()
+        assert np.array_equal(pixels(canvas), state)
+
+def test_undo_keeps_only_changed_tiles(canvas):
+    tile = UndoDelta.TILE
+    canvas.draw_rectangle(0, 0, 3 * tile - 1, tile - 1, 1)
+    canvas.save_state()
+    # Repaints three tiles, but only the middle one changes
+    canvas.draw_rectangle(0, 0, 3 * tile - 1, tile - 1, 1)
+    canvas.draw_rectangle(tile + 5, 5, tile + 10, 10, 2)
+    canvas.save_state()
+    delta = canvas.history.undo_stack[-1]
+    assert set(delta.after) == {(1, 0)}
+    assert set(delta.before) == {(1, 0)}
+
+def test_new_operation_clears_redo(canvas, pixels):
+    canvas.draw_rectangle(10, 10, 20, 20, 1)
+    canvas.save_state()
+    canvas.undo()
+    canvas.draw_rectangle(30, 30, 40, 40, 2)
+    canvas.save_state()
+    assert not canvas.redo()
+    assert pixels(canvas)[15, 15] == 0
+
+SEGMENTS = [
+    (40, 50, 40, 50, 7),
+    (20, 30, 260, 170, 5),
+    (250, 20, 30, 20, 9),
+    (100, 10, 100, 190, 4),
+    (-15, 150, 120, 215, 12),
+    (290, -5, 310, 60, 8),
+    (60, 80, 67, 141, 1),
+]
+
+@pytest.mark.parametrize('segment', SEGMENTS)
+def test_line_matches_capsule(canvas, segment, pixels):
+    x1, y1, x2, y2, radius = segment
+    canvas.draw_line(x1, y1, x2, y2, radius, 3)
+    expected = capsule_mask(canvas.width, canvas.height, x1, y1, x2, y2, radius)
+    assert np.array_equal(pixels(canvas) == 3, expected)
+
+def test_smooth_stroke_matches_capsules(canvas, pixels):
+    points = [(30, 40), (90, 60), (95, 150), (250, 180), (280, 20)]
+    canvas.begin_stroke(*points[0], 6, 2)
+    for x, y in points[1:]:
+        canvas.stroke_to(x, y)
+    canvas.end_stroke()
+    expected = np.zeros((canvas.height, canvas.width), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(points, points[1:]):
+        expected |= capsule_mask(canvas.width, canvas.height, x1, y1, x2, y2, 6)
+    assert np.array_equal(pixels(canvas) == 2, expected)
+
+def test_polyline_matches_capsules(canvas, pixels):
+    points = [(10, 10), (200, 40), (60, 180), (60, 180), (290, 195)]
+    canvas.draw_polyline(points, 3, 5)
+    expected = np.zeros((canvas.height, canvas.width), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(points, points[1:]):
+        expected |= capsule_mask(canvas.width, canvas.height, x1, y1, x2, y2, 3)
+    assert np.array_equal(pixels(canvas) == 5, expected)
+
+def test_square_stroke_spaces_dabs(canvas, pixels):
+    # Dabs every half brush width along a straight run leave no gaps
+    canvas.begin_stroke(20, 100, 4, 1, smooth=False)
+    canvas.stroke_to(280, 100)
+    canvas.end_stroke()
+    painted = pixels(canvas) == 1
+    assert painted[96:104, 16:284].all()
+    assert not painted[:96].any() and not painted[104:].any()
+
+def ring_mask(width, height, cx, cy, inner, outer):
+    """Pixels with inner <= distance <= outer from a center"""
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.int64)
+    d2 = (xs - cx) ** 2 + (ys - cy) ** 2
+    return (d2 >= inner * inner) & (d2 <= outer * outer)
+
+@pytest.mark.parametrize('circle', [
+    (150, 100, 60, 4),
+    (150, 100, 3, 5),
+    (20, 30, 80, 2),
+    (290, 190, 45, 7),
+    (100, 90, 0, 1),
+])
+@pytest.mark.parametrize('filled', [False, True])
+def test_circle_matches_ring(canvas, circle, filled, pixels):
+    cx, cy, radius, brush = circle
+    canvas.draw_circle(cx, cy, radius, brush, 6, filled)
+    inner = 0 if filled else max(0, radius - brush)
+    expected = ring_mask(canvas.width, canvas.height, cx, cy, inner, radius + brush)
+    assert np.array_equal(pixels(canvas) == 6, expected)
+
+def assert_counts(canvas, pixels):
+    expected = np.bincount(pixels(canvas).ravel(), minlength=len(TERRAINS))
+    assert np.array_equal(canvas.counts, expected)
+    assert sum(canvas.terrain_counts().values()) == canvas.width * canvas.height
+
+def test_counts_follow_every_operation(canvas, pixels):
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 4, size=(canvas.height, canvas.width), dtype=np.uint8)
+    canvas.load_tiles([(pygame.Rect(0, 0, canvas.width, canvas.height), noise)])
+    assert_counts(canvas, pixels)
+    for step in range(40):
+        x, y = int(rng.integers(0, canvas.width)), int(rng.integers(0, canvas.height))
+        terrain = int(rng.integers(0, 6))
+        kind = step % 5
+        if kind == 0:
+            canvas.paint(x, y, int(rng.integers(1, 15)), terrain, smooth=bool(step % 2))
+        elif kind == 1:
+            canvas.draw_line(x, y, int(rng.integers(0, 300)), int(rng.integers(0, 200)), 3, terrain)
+        elif kind == 2:
+            canvas.draw_circle(x, y, int(rng.integers(5, 60)), 3, terrain, filled=bool(step % 2))
+        elif kind == 3:
+            canvas.flood_fill(x, y, terrain)
+        else:
+            canvas.draw_rectangle(x, y, x + 40, y + 30, terrain)
+        canvas.save_state()
+        assert_counts(canvas, pixels)
+        if step % 7 == 6:
+            canvas.undo()
+            assert_counts(canvas, pixels)
+            canvas.redo()
+            assert_counts(canvas, pixels)
+
+def test_counts_after_resize_and_clear(canvas, pixels):
+    canvas.draw_rectangle(0, 0, 299, 199, 2)
+    canvas.resize(350, 150)
+    assert_counts(canvas, pixels)
+    canvas.clear()
+    assert_counts(canvas, pixels)
+
+def test_tiled_undo_keeps_uniform_tiles_as_indices(make_canvas, pixels):
+    canvas = make_canvas(700, 600, tiled=True)
+    states = [pixels(canvas)]
+    canvas.flood_fill(5, 5, 2)
+    canvas.save_state()
+    # A whole-map fill of an empty tiled map stores no pixel arrays at all
+    assert canvas.history.nbytes() == 0
+    states.append(pixels(canvas))
+    canvas.draw_rectangle(100, 100, 599, 450, 3)
+    canvas.paint(300, 300, 25, 4)
+    canvas.save_state()
+    states.append(pixels(canvas))
+    canvas.flood_fill(0, 0, 1)
+    canvas.save_state()
+    states.append(pixels(canvas))
+    canvas.flood_fill(300, 150, 5)
+    canvas.save_state()
+    states.append(pixels(canvas))
+
+    for state in reversed(states[:-1]):
+        canvas.undo()
+        assert np.array_equal(pixels(canvas), state)
+        assert np.array_equal(canvas.counts, np.bincount(state.ravel(), minlength=len(TERRAINS)))
+    for state in states[1:]:
+        canvas.redo()
+        assert np.array_equal(pixels(canvas), state)
+        assert np.array_equal(canvas.counts, np.bincount(state.ravel(), minlength=len(TERRAINS)))
+    assert canvas.store.nbytes() < 700 * 600
@@ -0,0 +1,75 @@
+"""
+Tests for the undo history limits and byte accounting
+"""
+
+import numpy as np
+
+from history import UndoDelta, HistoryStore
+
+def make_delta(rng, tiles=8, uniform=False):
+    delta = UndoDelta()
+    for i in range(tiles):
+        shape = (UndoDelta.TILE, UndoDelta.TILE)
+        if uniform:
+            delta.before[(i, 0)] = np.zeros(shape, dtype=np.uint8)
+        else:
+            delta.before[(i, 0)] = rng.integers(0, 6, size=shape, dtype=np.uint8)
+        delta.after[(i, 0)] = np.full(shape, i % 6, dtype=np.uint8)
+    return delta
+
+def recount(history):
+    """Bytes held by every entry, walked from scratch"""
+    with history._lock:
+        return sum(delta.nbytes() for delta in list(history.undo_stack) + list(history.redo_stack))
+
+def settle(history):
+    """Let the compression worker finish what it was handed"""
+    worker, history._worker = history._worker, None
+    history._jobs.put(None)
+    worker.join()
+
+def test_running_total_matches_entries():
+    rng = np.random.default_rng(0)
+    history = HistoryStore(max_steps=6)
+    for i in range(10):
+        history.push(make_delta(rng, uniform=i % 2))
+        assert history.nbytes() == recount(history)
+    history.undo()
+    history.undo()
+    assert history.nbytes() == recount(history)
+    history.redo()
+    assert history.nbytes() == recount(history)
+    history.push(make_delta(rng))
+    assert len(history.redo_stack) == 0
+    settle(history)
+    assert len(history) == 6
+    assert history.nbytes() == recount(history)
+    history.clear()
+    assert history.nbytes() == 0
+
+def test_budget_compresses_then_evicts():
+    rng = np.random.default_rng(1)
+    tile_bytes = UndoDelta.TILE * UndoDelta.TILE
+    # Room for about three raw entries of 8 noisy tiles per side
+    history = HistoryStore(max_steps=30, budget_mb=3 * 16 * tile_bytes / (1024 * 1024))
+    for _ in range(12):
+        history.push(make_delta(rng))
+        assert history.nbytes() <= history.budget
+        assert history.nbytes() == recount(history)
+    assert 1 < len(history) < 12
+    history.close()
+    assert history.nbytes() == 0
+
+def test_worker_starts_when_entries_age():
+    rng = np.random.default_rng(2)
+    history = HistoryStore(max_steps=1)
+    for _ in range(5):
+        history.push(make_delta(rng))
+    # A one-step history never compresses, so it never needs a thread
+    assert history._worker is None
+    history = HistoryStore()
+    for _ in range(HistoryStore.KEEP_RAW + 1):
+        history.push(make_delta(rng))
+    assert history._worker is not None
+    history.close()
+    assert history._worker is None and not history.undo_stack
@@ -0,0 +1,162 @@
+"""
+Tests for the recovery journal: snapshot, append, replay
+"""
+
+import os
+
+import numpy as np
+import pygame
+import pytest
+
+import journal
+from journal import RecoveryJournal, RecoveredMap, read_journal
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'recovery.wodmap'), str(tmp_path / 'recovery.journal')
+
+@pytest.fixture
+def canvas(make_canvas):
+    return make_canvas(600, 330)
+
+@pytest.fixture
+def recovered(make_canvas, pixels, paths):
+    def replay():
+        """Indices of the map rebuilt from the recovery snapshot and its journal"""
+        canvas = make_canvas(600, 330)
+        with RecoveredMap(*paths) as loaded:
+            assert (loaded.width, loaded.height) == (600, 330)
+            canvas.load_tiles(loaded.tiles(canvas.palette))
+        return pixels(canvas)
+    return replay
+
+def test_replay_matches_canvas(canvas, paths, recovered, pixels):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    canvas.draw_rectangle(10, 10, 200, 100, 1)
+    assert recovery.checkpoint()
+    recovery.write()
+    base_size = os.path.getsize(paths[0])
+
+    canvas.paint(300, 200, 30, 2)
+    assert recovery.checkpoint()
+    recovery.write()
+    canvas.draw_line(0, 329, 599, 0, 4, 3)
+    canvas.flood_fill(500, 20, 4)
+    assert recovery.checkpoint()
+    recovery.write()
+
+    # Edits went to the journal, the snapshot was left alone
+    assert os.path.getsize(paths[0]) == base_size
+    assert np.array_equal(recovered(), pixels(canvas))
+    assert not recovery.checkpoint()
+
+def test_checkpoints_queue_until_written(canvas, paths, recovered, pixels):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    assert recovery.checkpoint()
+    canvas.draw_rectangle(50, 50, 90, 90, 5)
+    assert recovery.checkpoint()
+    canvas.draw_rectangle(400, 250, 420, 300, 2)
+    assert recovery.checkpoint()
+    recovery.write()
+    assert recovery.write() is None
+    assert np.array_equal(recovered(), pixels(canvas))
+
+def test_torn_tail_drops_last_record(canvas, paths):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    recovery.checkpoint()
+    recovery.write()
+    canvas.draw_rectangle(0, 0, 599, 329, 1)
+    recovery.checkpoint()
+    recovery.write()
+    records = list(read_journal(paths[1], 600, 330))
+    assert len(records) == 6  # 600x330 is 3x2 tiles
+
+    for cut in (1, journal.RECORD.size + 2):
+        with open(paths[1], 'r+b') as f:
+            f.truncate(os.path.getsize(paths[1]) - cut)
+        replayed = list(read_journal(paths[1], 600, 330))
+        assert len(replayed) == len(records) - 1
+        records = replayed
+
+def test_corrupt_record_stops_replay(canvas, paths, recovered, pixels):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    recovery.checkpoint()
+    recovery.write()
+    canvas.draw_rectangle(0, 0, 100, 100, 1)
+    recovery.checkpoint()
+    recovery.write()
+    good = pixels(canvas)
+    canvas.draw_rectangle(300, 100, 500, 200, 2)
+    recovery.checkpoint()
+    recovery.write()
+
+    # Flip a byte in the last record's payload
+    with open(paths[1], 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)[0]
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last ^ 0xFF]))
+    replayed = recovered()
+    assert np.array_equal(replayed[:150], good[:150])
+    assert not np.array_equal(replayed, pixels(canvas))
+
+def test_journal_for_other_size_is_ignored(canvas, paths):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    recovery.checkpoint()
+    recovery.write()
+    canvas.draw_rectangle(0, 0, 50, 50, 1)
+    recovery.checkpoint()
+    recovery.write()
+    assert list(read_journal(paths[1], 600, 331)) == []
+    assert list(read_journal(paths[1] + '.missing', 600, 330)) == []
+
+def test_large_journal_compacts_into_snapshot(canvas, paths, recovered, pixels):
+    recovery = RecoveryJournal(*paths)
+    recovery.COMPACT_BYTES = 0
+    recovery.attach(canvas)
+    recovery.checkpoint()
+    recovery.write()
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 6, size=(330, 600), dtype=np.uint8)
+    canvas.load_tiles([(pygame.Rect(0, 0, 600, 330), noise)])
+    recovery.checkpoint()
+    recovery.write()
+    assert os.path.getsize(paths[1]) > journal.HEADER.size
+
+    canvas.paint(10, 10, 3, 1)
+    recovery.checkpoint()
+    recovery.write()
+    assert os.path.getsize(paths[1]) == journal.HEADER.size
+    assert np.array_equal(recovered(), pixels(canvas))
+
+def test_missing_journal_falls_back_to_snapshot(canvas, paths, recovered, pixels):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    recovery.checkpoint()
+    recovery.write()
+    os.remove(paths[1])
+    canvas.draw_rectangle(20, 20, 60, 60, 3)
+    recovery.checkpoint()
+    with pytest.raises(OSError):
+        recovery.write()
+
+    canvas.draw_rectangle(100, 20, 160, 60, 2)
+    recovery.checkpoint()
+    recovery.write()
+    assert np.array_equal(recovered(), pixels(canvas))
+
+def test_reset_drops_queued_checkpoints(canvas, paths, recovered, pixels):
+    recovery = RecoveryJournal(*paths)
+    recovery.attach(canvas)
+    recovery.checkpoint()
+    recovery.reset()
+    assert recovery.write() is None
+    assert not os.path.exists(paths[0])
+    assert recovery.checkpoint()
+    recovery.write()
+    assert np.array_equal(recovered(), pixels(canvas))
@@ -0,0 +1,97 @@
+"""
+Tests for the .wodmap tile codec and file round trips
+"""
+
+import os
+
+import numpy as np
+import pygame
+import pytest
+
+import mapfile
+from config import TERRAINS
+
+def random_canvas(make_canvas, w, h, seed=0, terrains=TERRAINS):
+    canvas = make_canvas(w, h, terrains)
+    rng = np.random.default_rng(seed)
+    # Blocky noise so tiles mix uniform, run-heavy and noisy content
+    coarse = rng.integers(0, len(terrains), size=(h // 40 + 1, w // 40 + 1), dtype=np.uint8)
+    indices = np.repeat(np.repeat(coarse, 40, axis=0), 40, axis=1)[:h, :w].copy()
+    indices[h // 2:h // 2 + 30, :w // 3] = rng.integers(0, len(terrains), size=(min(30, h - h // 2), w // 3))
+    canvas.load_tiles([(pygame.Rect(0, 0, w, h), indices)])
+    return canvas
+
+def tile_cases():
+    rng = np.random.default_rng(1)
+    stripes = np.zeros((256, 256), dtype=np.uint8)
+    stripes[::2] = 3
+    lone = np.full((256, 256), 2, dtype=np.uint8)
+    lone[0, 0] = 5
+    return {
+        'uniform': np.full((64, 37), 4, dtype=np.uint8),
+        'noise': rng.integers(0, 256, size=(50, 70), dtype=np.uint8),
+        'stripes': stripes,
+        'longest-run': lone,
+        'single': np.array([[7]], dtype=np.uint8),
+    }
+
+@pytest.mark.parametrize('name', sorted(tile_cases()))
+@pytest.mark.parametrize('compress', [False, True])
+def test_tile_round_trip(name, compress):
+    block = tile_cases()[name]
+    encoding, payload = mapfile.encode_tile(block, compress)
+    decoded = mapfile.decode_tile(encoding, payload, block.shape)
+    if encoding == mapfile.UNIFORM:
+        assert (block == decoded).all()
+    else:
+        assert np.array_equal(decoded, block)
+    if not compress:
+        assert encoding != mapfile.RLE_ZLIB
+
+def test_tile_encodings():
+    cases = tile_cases()
+    assert mapfile.encode_tile(cases['uniform'])[0] == mapfile.UNIFORM
+    assert mapfile.encode_tile(cases['noise'], compress=False)[0] == mapfile.RLE
+    assert mapfile.encode_tile(cases['stripes'])[0] == mapfile.RLE_ZLIB
+
+@pytest.mark.parametrize('size', [(256, 256), (300, 170), (513, 260), (5, 3)])
+def test_save_load_round_trip(tmp_path, make_canvas, pixels, size):
+    canvas = random_canvas(make_canvas, *size)
+    path = str(tmp_path / 'map.wodmap')
+    mapfile.save(canvas, path)
+    assert not os.path.exists(path + '.tmp')
+
+    loaded = make_canvas(*size)
+    with mapfile.MapFile(path) as f:
+        assert (f.width, f.height) == size
+        assert f.terrains == [(name, tuple(color)) for name, color in TERRAINS]
+        loaded.load_tiles(f.tiles(loaded.palette))
+    assert np.array_equal(pixels(loaded), pixels(canvas))
+    assert np.array_equal(loaded.counts, canvas.counts)
+
+def test_load_remaps_terrain_order(tmp_path, make_canvas, pixels):
+    reordered = list(reversed(TERRAINS))
+    canvas = random_canvas(make_canvas, 200, 150, terrains=reordered)
+    path = str(tmp_path / 'map.wodmap')
+    mapfile.save(canvas, path)
+
+    loaded = make_canvas(200, 150)
+    with mapfile.MapFile(path) as f:
+        loaded.load_tiles(f.tiles(loaded.palette))
+    # Same colors, different indices
+    assert np.array_equal(loaded.palette[pixels(loaded)], canvas.palette[pixels(canvas)])
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'map.wodmap'
+    path.write_bytes(b'\x89PNG\r\n\x1a\n' + bytes(64))
+    with pytest.raises(ValueError):
+        mapfile.MapFile(str(path))
+
+def test_png_export_round_trip(tmp_path, make_canvas, pixels):
+    canvas = random_canvas(make_canvas, 300, 170)
+    path = str(tmp_path / 'map.png')
+    mapfile.save_png(canvas, path, band=64)
+    image = pygame.image.load(path)
+    loaded = make_canvas(300, 170)
+    assert loaded.load_surface(image) == 0
+    assert np.array_equal(pixels(loaded), pixels(canvas))
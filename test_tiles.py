@@ -0,0 +1,93 @@
+"""
+Tests for the terrain index stores
+"""
+
+import numpy as np
+import pygame
+import pytest
+
+from tiles import DenseStore, TiledStore, row_spans
+
+def blocky(w, h, seed):
+    """Indices with uniform chunks, detailed chunks and runs crossing chunk edges"""
+    rng = np.random.default_rng(seed)
+    indices = np.zeros((h, w), dtype=np.uint8)
+    indices[:, w // 3:] = 1
+    indices[h // 2:, :] = 2
+    x, y = int(rng.integers(0, w - 80)), int(rng.integers(0, h // 2))
+    indices[y:y + 80, x:x + 80] = rng.integers(0, 3, size=(min(80, h - y), 80))
+    indices[10, :] = 1
+    return indices
+
+def stores(indices):
+    h, w = indices.shape
+    rect = pygame.Rect(0, 0, w, h)
+    dense, tiled = DenseStore(w, h), TiledStore(w, h)
+    dense.write(rect, indices)
+    tiled.write(rect, indices)
+    return dense, tiled
+
+def brute_spans(indices, value):
+    spans = []
+    for y, row in enumerate(indices):
+        x = 0
+        while x < len(row):
+            if row[x] == value:
+                start = x
+                while x < len(row) and row[x] == value:
+                    x += 1
+                spans.append((y, start, x))
+            x += 1
+    return spans
+
+@pytest.mark.parametrize('size', [(700, 530), (256, 256), (300, 90)])
+@pytest.mark.parametrize('value', [0, 1, 2, 5])
+def test_spans_match_brute_force(size, value):
+    indices = blocky(*size, seed=size[0] + value)
+    expected = brute_spans(indices, value)
+    for store in stores(indices):
+        rows, starts, ends = store.spans(value)
+        assert list(zip(rows.tolist(), starts.tolist(), ends.tolist())) == expected
+
+def test_row_spans_offsets():
+    block = np.array([[1, 1, 0], [0, 1, 1]], dtype=np.uint8)
+    rows, starts, ends = row_spans(block, 1, left=10, top=5)
+    assert rows.tolist() == [5, 6] and starts.tolist() == [10, 11] and ends.tolist() == [12, 13]
+
+def test_uniform_and_rect_histogram():
+    indices = blocky(700, 530, seed=3)
+    indices[256:, :512] = 4
+    dense, tiled = stores(indices)
+    assert dense.uniform(pygame.Rect(0, 300, 64, 64)) is None
+    assert tiled.uniform(pygame.Rect(0, 300, 64, 64)) == 4
+    assert tiled.uniform(pygame.Rect(0, 256, 512, 274)) == 4
+    assert tiled.uniform(pygame.Rect(0, 256, 513, 274)) is None
+    rect = pygame.Rect(37, 150, 400, 260)
+    expected = np.bincount(indices[150:410, 37:437].ravel(), minlength=6)
+    for store in (dense, tiled):
+        assert np.array_equal(store.histogram(6, rect), expected)
+        assert np.array_equal(store.histogram(6), np.bincount(indices.ravel(), minlength=6))
+
+def test_mapped_snapshot_reads_copies(tmp_path):
+    from tiles import MappedStore
+    import mapfile
+    from canvas import CanvasManager
+    from config import TERRAINS
+
+    store = MappedStore(300, 200, str(tmp_path / 'map.bin'))
+    canvas = CanvasManager(300, 200, TERRAINS, store=store)
+    canvas.draw_rectangle(10, 10, 100, 50, 2)
+    snapshot = canvas.snapshot()
+    rect = pygame.Rect(0, 0, 300, 200)
+    block = snapshot.store.read(rect)
+    canvas.draw_rectangle(0, 0, 299, 199, 3)
+    assert block[20, 20] == 2 and block[100, 200] == 0
+
+    assert snapshot.flush()
+    mapfile.save(snapshot, str(tmp_path / 'map.wodmap'))
+    with mapfile.MapFile(str(tmp_path / 'map.wodmap')) as loaded:
+        assert all(data == 3 for _, data in loaded.tiles(canvas.palette))
+
+    canvas.close()
+    with pytest.raises(ValueError):
+        snapshot.store.read(rect)
@@ -0,0 +1,56 @@
+"""
+Tests for the background save worker
+"""
+
+import threading
+
+from utils import BackgroundSaver
+
+def blocked_saver():
+    """A saver whose worker is stuck in a job until the returned event is set"""
+    saver = BackgroundSaver()
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+        return 'held'
+
+    saver.submit('hold', hold)
+    assert started.wait(5)
+    return saver, release
+
+def test_resubmits_coalesce():
+    saver, release = blocked_saver()
+    runs = []
+    for i in range(5):
+        saver.submit('map', lambda i=i: runs.append(i) or i)
+    assert saver.busy('map') and saver.busy('hold')
+    release.set()
+    saver.wait()
+    # Only the last of the waiting jobs ran
+    assert runs == [4]
+    assert saver.poll() == [('hold', 'held', None), ('map', 4, None)]
+    assert not saver.busy()
+
+def test_keys_run_in_submit_order():
+    saver, release = blocked_saver()
+    order = []
+    saver.submit('recovery', order.append, 'recovery')
+    saver.submit('map', order.append, 'map')
+    saver.submit('recovery', order.append, 'recovery again')
+    release.set()
+    saver.wait()
+    assert order == ['recovery again', 'map']
+
+def test_errors_are_reported():
+    saver = BackgroundSaver()
+
+    def fail():
+        raise OSError("disk full")
+
+    saver.submit('map', fail)
+    saver.submit('recovery', lambda: 'done')
+    saver.wait()
+    assert saver.poll() == [('map', None, 'disk full'), ('recovery', 'done', None)]
+    assert saver.poll() == []
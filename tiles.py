@@ -0,0 +1,352 @@
+"""
+Terrain index storage for WoD Map Editor
+"""
+
+import os
+import threading
+import numpy as np
+import pygame
+
+def row_spans(block, value, left=0, top=0):
+    """Runs of a value along the rows of a block as (row, start, end) arrays, sorted"""
+    padded_w = block.shape[1] + 2
+    padded = np.zeros((block.shape[0], padded_w), dtype=bool)
+    np.equal(block, value, out=padded[:, 1:-1])
+    flat = padded.ravel()
+    edges = np.flatnonzero(flat[1:] != flat[:-1])
+    rows = edges[0::2] // padded_w
+    starts = edges[0::2] - rows * padded_w
+    ends = edges[1::2] - rows * padded_w
+    return rows + top, starts + left, ends + left
+
+def join_spans(parts):
+    """Concatenate (row, start, end) span arrays and merge spans that touch"""
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    rows, starts, ends = (np.concatenate(arrays) for arrays in zip(*parts))
+    if not len(rows):
+        return rows, starts, ends
+    order = np.lexsort((starts, rows))
+    rows, starts, ends = rows[order], starts[order], ends[order]
+    heads = np.ones(len(rows), dtype=bool)
+    heads[1:] = (rows[1:] != rows[:-1]) | (starts[1:] != ends[:-1])
+    tails = np.append(heads[1:], True)
+    return rows[heads], starts[heads], ends[tails]
+
+class DenseStore:
+    """Terrain indices for the whole map in one array"""
+
+    # Rows scanned per step when finding spans, to bound the temporary mask
+    SPAN_BAND = 256
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.array = np.zeros((height, width), dtype=np.uint8)
+
+    def read(self, rect):
+        """Indices of a canvas rect (a view, copy it before keeping it)"""
+        return self.array[rect.top:rect.bottom, rect.left:rect.right]
+
+    def write(self, rect, block):
+        """Overwrite a canvas rect"""
+        self.array[rect.top:rect.bottom, rect.left:rect.right] = block
+
+    def fill(self, rect, value):
+        """Set a whole canvas rect to one terrain"""
+        self.array[rect.top:rect.bottom, rect.left:rect.right] = value
+
+    def apply_mask(self, rect, mask, value):
+        """Set the masked pixels of a canvas rect to one terrain"""
+        np.copyto(self.array[rect.top:rect.bottom, rect.left:rect.right], value, where=mask)
+
+    def get(self, x, y):
+        """Terrain index of one pixel"""
+        return int(self.array[y, x])
+
+    def uniform(self, rect):
+        """Terrain of a canvas rect kept as a single index; dense stores keep none, so None"""
+        return None
+
+    def spans(self, value):
+        """Every horizontal run of a terrain as sorted (row, start, end) arrays"""
+        parts = [row_spans(self.array[top:top + self.SPAN_BAND], value, top=top)
+                 for top in range(0, self.height, self.SPAN_BAND)]
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    def histogram(self, n, rect=None):
+        """Pixel count of each of n terrain indices, over the map or a canvas rect"""
+        block = self.array if rect is None else self.read(rect)
+        return np.bincount(block.ravel(), minlength=n)[:n].astype(np.int64)
+
+    def snapshot(self):
+        """Independent copy that another thread can read while editing goes on"""
+        copy = DenseStore(self.width, self.height)
+        copy.array = self.array.copy()
+        return copy
+
+    def nbytes(self):
+        """Memory held by the pixel data"""
+        return self.array.nbytes
+
+    def resized(self, width, height):
+        """New store of another size keeping the overlapping pixels"""
+        store = DenseStore(width, height)
+        keep = pygame.Rect(0, 0, min(width, self.width), min(height, self.height))
+        store.write(keep, self.read(keep))
+        return store
+
+class MappedStore(DenseStore):
+    """Terrain indices in a memory-mapped file, only touched pages stay resident"""
+
+    # Rows copied per step when resizing, to keep the copy out of RAM
+    BAND = 1024
+
+    def __init__(self, width, height, path, keep=False):
+        self.width = width
+        self.height = height
+        self.path = path
+        mode = 'r+' if keep else 'w+'
+        self.array = np.memmap(path, dtype=np.uint8, mode=mode, shape=(height, width))
+        # Held by every write and by snapshot reads on the save thread
+        self.lock = threading.Lock()
+
+    def write(self, rect, block):
+        with self.lock:
+            super().write(rect, block)
+
+    def fill(self, rect, value):
+        with self.lock:
+            super().fill(rect, value)
+
+    def apply_mask(self, rect, mask, value):
+        with self.lock:
+            super().apply_mask(rect, mask, value)
+
+    def flush(self):
+        """Write dirty pages back to the file"""
+        with self.lock:
+            self.array.flush()
+
+    def snapshot(self):
+        """Read access for a save thread: copying a map larger than RAM is not an option"""
+        return MappedSnapshot(self)
+
+    def close(self):
+        """Flush and release the mapping"""
+        with self.lock:
+            if self.array is not None:
+                self.array.flush()
+                self.array = None
+
+    def resized(self, width, height):
+        """New store of another size keeping the overlapping pixels, on the same file"""
+        temp_path = self.path + '.tmp'
+        store = MappedStore(width, height, temp_path)
+        keep_w, keep_h = min(width, self.width), min(height, self.height)
+        for top in range(0, keep_h, self.BAND):
+            band = pygame.Rect(0, top, keep_w, min(self.BAND, keep_h - top))
+            store.write(band, self.read(band))
+        store.close()
+        self.close()
+        os.replace(temp_path, self.path)
+        return MappedStore(width, height, self.path, keep=True)
+
+class MappedSnapshot:
+    """A MappedStore as seen by a save thread: each read is a copy taken under the store lock,
+    so no read sees half of a write. Reads fail once the store is closed."""
+
+    def __init__(self, store):
+        self.store = store
+        self.width = store.width
+        self.height = store.height
+
+    def read(self, rect):
+        """Indices of a canvas rect as a new array"""
+        with self.store.lock:
+            if self.store.array is None:
+                raise ValueError("memory-mapped canvas was closed")
+            return self.store.array[rect.top:rect.bottom, rect.left:rect.right].copy()
+
+    def flush(self):
+        """Write dirty pages back to the file"""
+        with self.store.lock:
+            if self.store.array is None:
+                raise ValueError("memory-mapped canvas was closed")
+            self.store.array.flush()
+
+class TiledStore:
+    """Terrain indices in square chunks; uniform chunks are kept as a single int"""
+
+    CHUNK = 256
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        size = self.CHUNK
+        self.chunks = {(cx, cy): 0
+                       for cy in range(-(-height // size))
+                       for cx in range(-(-width // size))}
+
+    def chunk_rect(self, key):
+        """Canvas rect of a chunk, clipped to the map"""
+        size = self.CHUNK
+        left, top = key[0] * size, key[1] * size
+        return pygame.Rect(left, top, min(size, self.width - left), min(size, self.height - top))
+
+    def keys_in(self, rect):
+        """Keys of the chunks overlapping a canvas rect"""
+        size = self.CHUNK
+        return [(cx, cy)
+                for cy in range(rect.top // size, (rect.bottom - 1) // size + 1)
+                for cx in range(rect.left // size, (rect.right - 1) // size + 1)]
+
+    def _pieces(self, rect):
+        """Yield (key, chunk rect, slices into the chunk, slices into the rect block)"""
+        for key in self.keys_in(rect):
+            chunk = self.chunk_rect(key)
+            part = chunk.clip(rect)
+            inner = (slice(part.top - chunk.top, part.bottom - chunk.top),
+                     slice(part.left - chunk.left, part.right - chunk.left))
+            outer = (slice(part.top - rect.top, part.bottom - rect.top),
+                     slice(part.left - rect.left, part.right - rect.left))
+            yield key, chunk, part, inner, outer
+
+    def _materialize(self, key, chunk):
+        """Turn a uniform chunk into a writable array"""
+        data = self.chunks[key]
+        if isinstance(data, int):
+            data = np.full((chunk.height, chunk.width), data, dtype=np.uint8)
+            self.chunks[key] = data
+        return data
+
+    def _collapse(self, key):
+        """Store a chunk as a single int again if it became uniform"""
+        data = self.chunks[key]
+        first = data.flat[0]
+        if (data == first).all():
+            self.chunks[key] = int(first)
+
+    def read(self, rect):
+        """Indices of a canvas rect as a new array"""
+        block = np.empty((rect.height, rect.width), dtype=np.uint8)
+        for key, chunk, part, inner, outer in self._pieces(rect):
+            data = self.chunks[key]
+            block[outer] = data if isinstance(data, int) else data[inner]
+        return block
+
+    def write(self, rect, block):
+        """Overwrite a canvas rect"""
+        for key, chunk, part, inner, outer in self._pieces(rect):
+            piece = block[outer]
+            if part == chunk:
+                first = piece.flat[0]
+                self.chunks[key] = int(first) if (piece == first).all() else piece.copy()
+            else:
+                data = self.chunks[key]
+                if isinstance(data, int) and (piece == data).all():
+                    continue
+                self._materialize(key, chunk)[inner] = piece
+                self._collapse(key)
+
+    def fill(self, rect, value):
+        """Set a whole canvas rect to one terrain"""
+        for key, chunk, part, inner, outer in self._pieces(rect):
+            data = self.chunks[key]
+            if part == chunk:
+                self.chunks[key] = int(value)
+            elif not (isinstance(data, int) and data == value):
+                self._materialize(key, chunk)[inner] = value
+                self._collapse(key)
+
+    def apply_mask(self, rect, mask, value):
+        """Set the masked pixels of a canvas rect to one terrain"""
+        for key, chunk, part, inner, outer in self._pieces(rect):
+            data = self.chunks[key]
+            piece = mask[outer]
+            if isinstance(data, int) and data == value:
+                continue
+            if not piece.any():
+                continue
+            if part == chunk and piece.all():
+                self.chunks[key] = int(value)
+                continue
+            np.copyto(self._materialize(key, chunk)[inner], value, where=piece)
+            self._collapse(key)
+
+    def get(self, x, y):
+        """Terrain index of one pixel"""
+        size = self.CHUNK
+        data = self.chunks[(x // size, y // size)]
+        if isinstance(data, int):
+            return data
+        return int(data[y % size, x % size])
+
+    def uniform(self, rect):
+        """Terrain of a canvas rect kept as a single index, None if it is stored per pixel"""
+        value = None
+        for key in self.keys_in(rect):
+            data = self.chunks[key]
+            if not isinstance(data, int) or value not in (None, data):
+                return None
+            value = data
+        return value
+
+    def spans(self, value):
+        """Every horizontal run of a terrain as sorted (row, start, end) arrays"""
+        size = self.CHUNK
+        parts = []
+        for cy in range(-(-self.height // size)):
+            top = cy * size
+            height = min(size, self.height - top)
+            band = []
+            # Neighbouring uniform chunks of the terrain become one run per row
+            runs = []
+            for cx in range(-(-self.width // size)):
+                data = self.chunks[(cx, cy)]
+                left = cx * size
+                if not isinstance(data, int):
+                    band.append(row_spans(data, value, left, top))
+                elif data == value:
+                    right = min(left + size, self.width)
+                    if runs and runs[-1][1] == left:
+                        runs[-1][1] = right
+                    else:
+                        runs.append([left, right])
+            rows = np.arange(top, top + height)
+            for left, right in runs:
+                band.append((rows, np.full(height, left), np.full(height, right)))
+            parts.append(join_spans(band))
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    def histogram(self, n, rect=None):
+        """Pixel count of each of n terrain indices, over the map or a canvas rect"""
+        counts = np.zeros(n, dtype=np.int64)
+        for key, chunk, part, inner, outer in self._pieces(rect or pygame.Rect(0, 0, self.width, self.height)):
+            data = self.chunks[key]
+            if isinstance(data, int):
+                counts[data] += part.width * part.height
+            else:
+                counts += np.bincount(data[inner].ravel(), minlength=n)[:n]
+        return counts
+
+    def snapshot(self):
+        """Independent copy that another thread can read while editing goes on"""
+        copy = TiledStore(self.width, self.height)
+        copy.chunks = {key: data if isinstance(data, int) else data.copy()
+                       for key, data in self.chunks.items()}
+        return copy
+
+    def nbytes(self):
+        """Memory held by the pixel data"""
+        return sum(data.nbytes for data in self.chunks.values() if not isinstance(data, int))
+
+    def resized(self, width, height):
+        """New store of another size keeping the overlapping pixels"""
+        store = TiledStore(width, height)
+        keep = pygame.Rect(0, 0, min(width, self.width), min(height, self.height))
+        for key in self.keys_in(keep):
+            part = self.chunk_rect(key).clip(keep)
+            store.write(part, self.read(part))
+        return store
@@ -5,6 +5,10 @@ UI rendering for WoD Map Editor
 import pygame
 import math
 import random
+from functools import lru_cache
+from layout import (TOOLBAR_H, TOOLS, SETTINGS_OPTIONS, welcome_layout, canvas_select_layout,
+                    toolbar_layout, side_panel_layout, settings_layout, help_layout,
+                    layer_panel_layout)
 
 def draw_rounded_rect(surface, color, rect, radius=8, border=0, border_color=None):
     """Draw a rounded rectangle with optional border"""
@@ -58,7 +62,7 @@ def draw_welcome_screen(screen, width, height, colors, font_large, font, small_f
             screen.blit(char_surf, (x_offset, y_offset))
 
         # Animated subtitle
-        subtitle = font.render("✨ You got the special edition! ✨", True, colors['accent_hover'])
+        subtitle = render_text(font, "✨ You got the special edition! ✨", True, colors['accent_hover'])
         subtitle_y = 250 + 10 * math.sin(time * 3)
         screen.blit(subtitle, (width // 2 - subtitle.get_width() // 2, subtitle_y))
 
@@ -86,21 +90,18 @@ def draw_welcome_screen(screen, width, height, colors, font_large, font, small_f
             screen.blit(glow_surf, (0, 0))
 
         # Main title
-        title = font_large.render("WOD MAP MAKER", True, colors['text'])
+        title = render_text(font_large, "WOD MAP MAKER", True, colors['text'])
         title_rect = title.get_rect(center=(width // 2, title_y))
         screen.blit(title, title_rect)
 
         # Animated subtitle
-        subtitle = font.render("Enhanced Edition v2.0", True, colors['accent'])
+        subtitle = render_text(font, "Enhanced Edition v2.0", True, colors['accent'])
         subtitle_y = title_y + 50 + 5 * math.sin(time * 3)
         subtitle_rect = subtitle.get_rect(center=(width // 2, subtitle_y))
         screen.blit(subtitle, subtitle_rect)
 
     # Continue button
-    btn_y = height - 200
-    btn_w = 300
-    btn_h = 60
-    btn = pygame.Rect(width // 2 - btn_w // 2, btn_y, btn_w, btn_h)
+    btn = welcome_layout(width, height)
     hover = btn.collidepoint(mx, my)
 
     # Animated button
@@ -114,7 +115,7 @@ def draw_welcome_screen(screen, width, height, colors, font_large, font, small_f
 
     pygame.draw.rect(screen, colors['border_light'], btn, 2, border_radius=15)
 
-    btn_text = font.render("START CREATING", True, (255, 255, 255))
+    btn_text = render_text(font, "START CREATING", True, (255, 255, 255))
     btn_rect = btn_text.get_rect(center=btn.center)
     screen.blit(btn_text, btn_rect)
 
@@ -126,14 +127,14 @@ def draw_welcome_screen(screen, width, height, colors, font_large, font, small_f
         "⚡ Auto-save & recovery",
     ]
 
-    hint_y = btn_y + 100
+    hint_y = btn.y + 100
     for i, hint in enumerate(hints):
-        hint_surf = tiny_font.render(hint, True, colors['text_dim'])
+        hint_surf = render_text(tiny_font, hint, True, colors['text_dim'])
         hint_x = width // 2 - 200 + (i % 2) * 240
         hint_y_pos = hint_y + (i // 2) * 25
         screen.blit(hint_surf, (hint_x, hint_y_pos))
 
-    return btn, title_rect
+    return btn
 
 def draw_canvas_select(screen, width, height, colors, presets, font_large, font, small_font, tiny_font):
     """Enhanced canvas selection screen"""
@@ -141,11 +142,11 @@ def draw_canvas_select(screen, width, height, colors, presets, font_large, font,
 
     # Title
     title_y = 80
-    title = font_large.render("CREATE NEW CANVAS", True, colors['text'])
+    title = render_text(font_large, "CREATE NEW CANVAS", True, colors['text'])
     title_rect = title.get_rect(center=(width // 2, title_y))
     screen.blit(title, title_rect)
 
-    subtitle = small_font.render("Choose a preset size or create custom dimensions", True, colors['text_dim'])
+    subtitle = render_text(small_font, "Choose a preset size or create custom dimensions", True, colors['text_dim'])
     subtitle_rect = subtitle.get_rect(center=(width // 2, title_y + 35))
     screen.blit(subtitle, subtitle_rect)
 
@@ -154,27 +155,9 @@ def draw_canvas_select(screen, width, height, colors, presets, font_large, font,
     pygame.draw.line(screen, colors['accent'], (width//2 - 200, line_y), (width//2 + 200, line_y), 2)
 
     mx, my = pygame.mouse.get_pos()
-    rects = []
+    rects = canvas_select_layout(width, tuple(presets))
 
-    # Calculate grid layout
-    start_y = 180
-    cols = 3
-    card_w = 280
-    card_h = 100
-    spacing_x = 30
-    spacing_y = 30
-
-    total_width = cols * card_w + (cols - 1) * spacing_x
-    start_x = (width - total_width) // 2
-
-    for i, (name, w, h) in enumerate(presets):
-        col = i % cols
-        row = i // cols
-
-        x = start_x + col * (card_w + spacing_x)
-        y = start_y + row * (card_h + spacing_y)
-
-        rect = pygame.Rect(x, y, card_w, card_h)
+    for i, ((name, w, h), (rect, _, _, _)) in enumerate(zip(presets, rects)):
         hover = rect.collidepoint(mx, my)
 
         # Card shadow
@@ -198,263 +181,240 @@ def draw_canvas_select(screen, width, height, colors, presets, font_large, font,
 
         # Name
         name_color = (255, 255, 255) if i == 0 else colors['text']
-        name_text = font.render(name, True, name_color)
+        name_text = render_text(font, name, True, name_color)
         name_rect = name_text.get_rect(center=(rect.centerx, rect.y + 35))
         screen.blit(name_text, name_rect)
 
         # Dimensions
         dim_color = (240, 240, 255) if i == 0 else colors['text_dim']
-        dim_text = small_font.render(f"{w} x {h} px", True, dim_color)
+        dim_text = render_text(small_font, f"{w} x {h} px", True, dim_color)
         dim_rect = dim_text.get_rect(center=(rect.centerx, rect.y + 65))
         screen.blit(dim_text, dim_rect)
 
         # Recommended badge
         if i == 0:
-            badge_text = tiny_font.render("RECOMMENDED", True, (255, 255, 255))
+            badge_text = render_text(tiny_font, "RECOMMENDED", True, (255, 255, 255))
             badge_rect = badge_text.get_rect(center=(rect.centerx, rect.y + 85))
             badge_bg = badge_rect.inflate(12, 6)
             draw_rounded_rect(screen, colors['accent_hover'], badge_bg, radius=4)
             screen.blit(badge_text, badge_rect)
 
-        rects.append((rect, w, h, 'preset'))
-
     # Load existing button
-    load_y = start_y + ((len(presets) - 1) // cols + 1) * (card_h + spacing_y) + 20
-    load_btn = pygame.Rect(width // 2 - 150, load_y, 300, 50)
+    load_btn = rects[-1][0]
     load_hover = load_btn.collidepoint(mx, my)
 
     draw_rounded_rect(screen, colors['success_hover' if load_hover else 'success'], load_btn, radius=10)
     pygame.draw.rect(screen, colors['border'], load_btn, 2, border_radius=10)
 
-    load_text = font.render("Load Existing Map", True, (255, 255, 255))
+    load_text = render_text(font, "Load Existing Map", True, (255, 255, 255))
     load_rect = load_text.get_rect(center=load_btn.center)
     screen.blit(load_text, load_rect)
 
-    rects.append((load_btn, 0, 0, 'load'))
-
     return rects
 
+# Retained panels: name -> (inputs, surface), re-rendered only when the inputs change
+_panel_cache = {}
+_panel_versions = {}
+
+def cached_panel(name, inputs, size, render):
+    """Surface of a panel, drawn by render(surface) the first time and whenever inputs change"""
+    entry = _panel_cache.get(name)
+    if entry is None or entry[0] != (size, inputs):
+        surface = pygame.Surface(size)
+        render(surface)
+        entry = ((size, inputs), surface)
+        _panel_cache[name] = entry
+        _panel_versions[name] = _panel_versions.get(name, 0) + 1
+    return entry[1]
+
+def panel_version(name):
+    """How many times a cached panel has been redrawn, to tell when it changed"""
+    return _panel_versions.get(name, 0)
+
+@lru_cache(maxsize=256)
+def render_text(font, text, antialias, color):
+    """Cached font.render (blit it, never draw on it); render_text.cache_info() counts hits and misses"""
+    return font.render(text, antialias, color)
+
+@lru_cache(maxsize=16)
+def gradient_surface(size, color1, color2, vertical=True):
+    """Cached gradient fill, shared between panels (blit it, never draw on it)"""
+    surface = pygame.Surface(size)
+    draw_gradient_rect(surface, color1, color2, pygame.Rect((0, 0), size), vertical)
+    return surface
+
 def draw_toolbar(screen, width, canvas_w, canvas_h, layer_count, colors, font_large, small_font):
     """Enhanced toolbar"""
-    toolbar_h = 90
-
-    # Gradient background
-    toolbar_surf = pygame.Surface((width, toolbar_h))
-    draw_gradient_rect(toolbar_surf, colors['panel'], colors['panel_light'], pygame.Rect(0, 0, width, toolbar_h))
-
-    # Shadow
-    pygame.draw.line(toolbar_surf, colors['border'], (0, toolbar_h-1), (width, toolbar_h-1), 2)
-
-    screen.blit(toolbar_surf, (0, 0))
-
-    # Title
-    title_text = font_large.render("WOD MAP MAKER", True, colors['text'])
-    screen.blit(title_text, (25, 20))
+    toolbar_h = TOOLBAR_H
+
+    btn_colors = {
+        "Save": colors['success'],
+        "Load": colors['accent'],
+        "New": colors['border'],
+        "Layers": colors['layer_accent'],
+        "Settings": colors['border'],
+        "Help": colors['warning'],
+    }
+    btn_rects = toolbar_layout(width)
 
-    # Canvas info
-    info_text = small_font.render(f"{canvas_w}x{canvas_h}px | {layer_count} layers", True, colors['text_dim'])
-    screen.blit(info_text, (25, 52))
-
-    # Buttons
     mx, my = pygame.mouse.get_pos()
-    btn_rects = []
-
-    btn_data = [
-        ("Save", colors['success'], "Save map (Ctrl+S)"),
-        ("Load", colors['accent'], "Load map"),
-        ("New", colors['border'], "New canvas (Ctrl+N)"),
-        ("Layers", colors['layer_accent'], "Manage layers (Ctrl+O)"),
-        ("Settings", colors['border'], "Settings"),
-        ("Help", colors['warning'], "Keyboard shortcuts"),
-    ]
-
-    btn_x = width - 650
-    btn_y = 20
-    btn_w = 90
-    btn_h = 50
-    btn_spacing = 10
-
-    for label, color, tooltip in btn_data:
-        btn = pygame.Rect(btn_x, btn_y, btn_w, btn_h)
-        hover = btn.collidepoint(mx, my)
+    hover = next((i for i, (btn, _) in enumerate(btn_rects) if btn.collidepoint(mx, my)), None)
 
-        # Button background
-        if hover:
-            lighter = tuple(min(255, c + 30) for c in color)
-            draw_rounded_rect(screen, lighter, btn, radius=8)
-            pygame.draw.rect(screen, colors['border_light'], btn, 2, border_radius=8)
-        else:
-            draw_rounded_rect(screen, color, btn, radius=8)
-            pygame.draw.rect(screen, colors['border'], btn, 1, border_radius=8)
-
-        # Label
-        label_text = small_font.render(label, True, (255, 255, 255))
-        label_rect = label_text.get_rect(center=btn.center)
-        screen.blit(label_text, label_rect)
-
-        btn_rects.append((btn, label))
-        btn_x += btn_w + btn_spacing
+    def render(surf):
+        # Gradient background
+        surf.blit(gradient_surface((width, toolbar_h), colors['panel'], colors['panel_light']), (0, 0))
 
+        # Shadow
+        pygame.draw.line(surf, colors['border'], (0, toolbar_h-1), (width, toolbar_h-1), 2)
+
+        # Title
+        title_text = render_text(font_large, "WOD MAP MAKER", True, colors['text'])
+        surf.blit(title_text, (25, 20))
+
+        # Canvas info
+        info_text = render_text(small_font, f"{canvas_w}x{canvas_h}px | {layer_count} layers", True, colors['text_dim'])
+        surf.blit(info_text, (25, 52))
+
+        # Buttons
+        for i, (btn, label) in enumerate(btn_rects):
+            color = btn_colors[label]
+            if i == hover:
+                lighter = tuple(min(255, c + 30) for c in color)
+                draw_rounded_rect(surf, lighter, btn, radius=8)
+                pygame.draw.rect(surf, colors['border_light'], btn, 2, border_radius=8)
+            else:
+                draw_rounded_rect(surf, color, btn, radius=8)
+                pygame.draw.rect(surf, colors['border'], btn, 1, border_radius=8)
+
+            # Label
+            label_text = render_text(small_font, label, True, (255, 255, 255))
+            label_rect = label_text.get_rect(center=btn.center)
+            surf.blit(label_text, label_rect)
+
+    inputs = (canvas_w, canvas_h, layer_count, hover, tuple(colors.values()))
+    screen.blit(cached_panel('toolbar', inputs, (width, toolbar_h), render), (0, 0))
     return btn_rects
 
 def draw_side_panel(screen, width, height, selected_terrain, tool, brush_size, terrains, colors, font, small_font, tiny_font, min_brush, max_brush):
     """Enhanced side panel with terrains and tools"""
-    panel_w = 340
-    panel_x = width - panel_w
-    panel_h = height - 90
-
-    # Panel background
-    panel_surf = pygame.Surface((panel_w, panel_h))
-    draw_gradient_rect(panel_surf, colors['panel'], colors['panel_light'], pygame.Rect(0, 0, panel_w, panel_h), vertical=False)
-    screen.blit(panel_surf, (panel_x, 90))
-
-    # Border
-    pygame.draw.line(screen, colors['border'], (panel_x, 90), (panel_x, height), 2)
+    layout = side_panel_layout(width, height, len(terrains))
+    panel_x, panel_y, panel_w, panel_h = layout.rect
+    terrain_rects = layout.terrain_rects
+    tool_rects = layout.tool_rects
+    slider_rect = layout.slider_rect
 
     mx, my = pygame.mouse.get_pos()
-    y = 110
-
-    terrain_rects = []
-    tool_rects = []
-
-    # TERRAINS SECTION
-    section_title = font.render("TERRAIN PALETTE", True, colors['text'])
-    screen.blit(section_title, (panel_x + 20, y))
-    y += 40
-
-    # Terrain grid (2 columns)
-    cols = 2
-    terrain_w = (panel_w - 60) // cols
-    terrain_h = 44
-    spacing = 10
-
-    for i, (name, color) in enumerate(terrains):
-        col = i % cols
-        row = i // cols
-
-        x = panel_x + 20 + col * (terrain_w + spacing)
-        terrain_y = y + row * (terrain_h + spacing)
-
-        rect = pygame.Rect(x, terrain_y, terrain_w, terrain_h)
-        hover = rect.collidepoint(mx, my)
-        is_selected = i == selected_terrain
-
-        # Terrain card
-        if is_selected:
-            draw_shadow(screen, rect, offset=3, alpha=40)
-            draw_rounded_rect(screen, color, rect, radius=6)
-            pygame.draw.rect(screen, colors['accent'], rect, 3, border_radius=6)
-        elif hover:
-            draw_rounded_rect(screen, color, rect, radius=6)
-            pygame.draw.rect(screen, colors['border_light'], rect, 2, border_radius=6)
-        else:
-            draw_rounded_rect(screen, color, rect, radius=6)
-            pygame.draw.rect(screen, colors['border'], rect, 1, border_radius=6)
+    hover_terrain = next((i for i, rect in enumerate(terrain_rects) if rect.collidepoint(mx, my)), None)
+    hover_tool = next((name for rect, name in tool_rects if rect.collidepoint(mx, my)), None)
 
-        # Name and hotkey
-        brightness = sum(color) / 3
-        text_color = (0, 0, 0) if brightness > 127 else (255, 255, 255)
+    def render(surf):
+        # Everything below is laid out in screen space; the panel surface starts at (panel_x, panel_y)
+        def local(rect):
+            return rect.move(-panel_x, -panel_y)
 
-        name_text = small_font.render(name, True, text_color)
-        screen.blit(name_text, (x + 8, terrain_y + 8))
-
-        hotkey_text = tiny_font.render(f"[{i+1}]", True, text_color)
-        screen.blit(hotkey_text, (x + 8, terrain_y + 24))
-
-        terrain_rects.append(rect)
-
-    y += ((len(terrains) - 1) // cols + 1) * (terrain_h + spacing) + 25
-
-    # TOOLS SECTION
-    pygame.draw.line(screen, colors['border'], (panel_x + 20, y), (panel_x + panel_w - 20, y), 1)
-    y += 15
-
-    section_title = font.render("DRAWING TOOLS", True, colors['text'])
-    screen.blit(section_title, (panel_x + 20, y))
-    y += 35
-
-    tools_data = [
-        ("brush", "Brush", "B"),
-        ("eraser", "Eraser", "E"),
-        ("fill", "Fill", "F"),
-        ("rect", "Rectangle", "R"),
-        ("line", "Line", "L"),
-        ("circle", "Circle", "C"),
-        ("picker", "Picker", "P"),
-    ]
-
-    for tool_name, label, hotkey in tools_data:
-        rect = pygame.Rect(panel_x + 20, y, panel_w - 40, 36)
-        hover = rect.collidepoint(mx, my)
-        is_active = tool == tool_name
-
-        # Tool button
-        if is_active:
-            draw_rounded_rect(screen, colors['accent'], rect, radius=6)
-            pygame.draw.rect(screen, colors['accent_hover'], rect, 2, border_radius=6)
-        elif hover:
-            draw_rounded_rect(screen, colors['panel_light'], rect, radius=6)
-            pygame.draw.rect(screen, colors['border_light'], rect, 1, border_radius=6)
-        else:
-            draw_rounded_rect(screen, colors['panel'], rect, radius=6)
-            pygame.draw.rect(screen, colors['border'], rect, 1, border_radius=6)
-
-        # Label
-        label_color = (255, 255, 255) if is_active else colors['text']
-        label_text = small_font.render(label, True, label_color)
-        screen.blit(label_text, (rect.x + 15, rect.y + 10))
-
-        # Hotkey
-        hotkey_text = tiny_font.render(f"[{hotkey}]", True, label_color)
-        screen.blit(hotkey_text, (rect.right - 35, rect.y + 11))
-
-        tool_rects.append((rect, tool_name))
-        y += 40
-
-    y += 10
-
-    # BRUSH SIZE SLIDER
-    pygame.draw.line(screen, colors['border'], (panel_x + 20, y), (panel_x + panel_w - 20, y), 1)
-    y += 15
-
-    brush_label = small_font.render(f"Brush Size: {brush_size}px", True, colors['text'])
-    screen.blit(brush_label, (panel_x + 20, y))
-    y += 25
-
-    slider_rect = pygame.Rect(panel_x + 20, y, panel_w - 40, 20)
-
-    # Slider track
-    draw_rounded_rect(screen, colors['bg'], slider_rect, radius=10)
-    pygame.draw.rect(screen, colors['border'], slider_rect, 1, border_radius=10)
-
-    # Slider fill
-    fill_percent = (brush_size - min_brush) / (max_brush - min_brush)
-    fill_w = int((panel_w - 40) * fill_percent)
-    fill_rect = pygame.Rect(panel_x + 20, y, fill_w, 20)
-    draw_rounded_rect(screen, colors['accent'], fill_rect, radius=10)
-
-    # Slider handle
-    handle_x = panel_x + 20 + fill_w
-    handle_y = y + 10
-    pygame.draw.circle(screen, (255, 255, 255), (handle_x, handle_y), 12)
-    pygame.draw.circle(screen, colors['accent'], (handle_x, handle_y), 10)
-    pygame.draw.circle(screen, (255, 255, 255), (handle_x, handle_y), 4)
+        # Panel background
+        surf.blit(gradient_surface((panel_w, panel_h), colors['panel'], colors['panel_light'], False), (0, 0))
 
+        # Border
+        pygame.draw.line(surf, colors['border'], (0, 0), (0, panel_h), 2)
+
+        # TERRAINS SECTION
+        section_title = render_text(font, "TERRAIN PALETTE", True, colors['text'])
+        surf.blit(section_title, (20, layout.terrain_title_y - panel_y))
+
+        for i, ((name, color), rect) in enumerate(zip(terrains, terrain_rects)):
+            card = local(rect)
+
+            # Terrain card
+            if i == selected_terrain:
+                draw_shadow(surf, card, offset=3, alpha=40)
+                draw_rounded_rect(surf, color, card, radius=6)
+                pygame.draw.rect(surf, colors['accent'], card, 3, border_radius=6)
+            elif i == hover_terrain:
+                draw_rounded_rect(surf, color, card, radius=6)
+                pygame.draw.rect(surf, colors['border_light'], card, 2, border_radius=6)
+            else:
+                draw_rounded_rect(surf, color, card, radius=6)
+                pygame.draw.rect(surf, colors['border'], card, 1, border_radius=6)
+
+            # Name and hotkey
+            brightness = sum(color) / 3
+            text_color = (0, 0, 0) if brightness > 127 else (255, 255, 255)
+
+            name_text = render_text(small_font, name, True, text_color)
+            surf.blit(name_text, (card.x + 8, card.y + 8))
+
+            hotkey_text = render_text(tiny_font, f"[{i+1}]", True, text_color)
+            surf.blit(hotkey_text, (card.x + 8, card.y + 24))
+
+        # TOOLS SECTION
+        rule_y = layout.tools_rule_y - panel_y
+        pygame.draw.line(surf, colors['border'], (20, rule_y), (panel_w - 20, rule_y), 1)
+
+        section_title = render_text(font, "DRAWING TOOLS", True, colors['text'])
+        surf.blit(section_title, (20, layout.tools_title_y - panel_y))
+
+        for (rect, tool_name), (_, label, hotkey) in zip(tool_rects, TOOLS):
+            button = local(rect)
+            is_active = tool == tool_name
+
+            # Tool button
+            if is_active:
+                draw_rounded_rect(surf, colors['accent'], button, radius=6)
+                pygame.draw.rect(surf, colors['accent_hover'], button, 2, border_radius=6)
+            elif tool_name == hover_tool:
+                draw_rounded_rect(surf, colors['panel_light'], button, radius=6)
+                pygame.draw.rect(surf, colors['border_light'], button, 1, border_radius=6)
+            else:
+                draw_rounded_rect(surf, colors['panel'], button, radius=6)
+                pygame.draw.rect(surf, colors['border'], button, 1, border_radius=6)
+
+            # Label
+            label_color = (255, 255, 255) if is_active else colors['text']
+            label_text = render_text(small_font, label, True, label_color)
+            surf.blit(label_text, (button.x + 15, button.y + 10))
+
+            # Hotkey
+            hotkey_text = render_text(tiny_font, f"[{hotkey}]", True, label_color)
+            surf.blit(hotkey_text, (button.right - 35, button.y + 11))
+
+        # BRUSH SIZE SLIDER
+        rule_y = layout.brush_rule_y - panel_y
+        pygame.draw.line(surf, colors['border'], (20, rule_y), (panel_w - 20, rule_y), 1)
+
+        brush_label = render_text(small_font, f"Brush Size: {brush_size}px", True, colors['text'])
+        surf.blit(brush_label, (20, layout.brush_label_y - panel_y))
+
+        track = local(slider_rect)
+
+        # Slider track
+        draw_rounded_rect(surf, colors['bg'], track, radius=10)
+        pygame.draw.rect(surf, colors['border'], track, 1, border_radius=10)
+
+        # Slider fill
+        fill_percent = (brush_size - min_brush) / (max_brush - min_brush)
+        fill_w = int((panel_w - 40) * fill_percent)
+        fill_rect = pygame.Rect(track.x, track.y, fill_w, 20)
+        draw_rounded_rect(surf, colors['accent'], fill_rect, radius=10)
+
+        # Slider handle
+        handle_x = track.x + fill_w
+        handle_y = track.y + 10
+        pygame.draw.circle(surf, (255, 255, 255), (handle_x, handle_y), 12)
+        pygame.draw.circle(surf, colors['accent'], (handle_x, handle_y), 10)
+        pygame.draw.circle(surf, (255, 255, 255), (handle_x, handle_y), 4)
+
+    inputs = (selected_terrain, tool, brush_size, hover_terrain, hover_tool,
+              tuple(terrains), tuple(colors.values()))
+    if panel_h > 0:
+        screen.blit(cached_panel('side_panel', inputs, (panel_w, panel_h), render), (panel_x, panel_y))
     return terrain_rects, tool_rects, slider_rect
 
-def draw_status_bar(screen, width, height, mx, my, tool, selected_terrain, brush_size, zoom_level, layer_count, visible_layer_count, unsaved_changes, terrains, colors, tiny_font, canvas_w, canvas_h, screen_to_canvas_func, show_coordinates):
+def draw_status_bar(screen, width, height, mx, my, tool, selected_terrain, brush_size, zoom_level, layer_count, visible_layer_count, unsaved_changes, terrains, colors, tiny_font, canvas_w, canvas_h, screen_to_canvas_func, show_coordinates, history_bytes=0, terrain_share=None):
     """Enhanced status bar"""
     status_h = 35
     status_y = height - status_h
 
-    # Gradient background
-    status_surf = pygame.Surface((width, status_h))
-    draw_gradient_rect(status_surf, colors['panel_light'], colors['panel'], pygame.Rect(0, 0, width, status_h))
-    screen.blit(status_surf, (0, status_y))
-
-    # Top border
-    pygame.draw.line(screen, colors['border'], (0, status_y), (width, status_y), 2)
-
     # Left side info
     info_parts = []
 
@@ -469,7 +429,10 @@ def draw_status_bar(screen, width, height, mx, my, tool, selected_terrain, brush
 
     # Terrain
     terrain_name, _ = terrains[selected_terrain]
-    info_parts.append(f"{terrain_name}")
+    if terrain_share is None:
+        info_parts.append(f"{terrain_name}")
+    else:
+        info_parts.append(f"{terrain_name} {terrain_share * 100:.1f}%")
 
     # Brush size
     info_parts.append(f"Size: {brush_size}px")
@@ -481,27 +444,43 @@ def draw_status_bar(screen, width, height, mx, my, tool, selected_terrain, brush
     if layer_count > 0:
         info_parts.append(f"{visible_layer_count}/{layer_count} layers")
 
-    # Join and render
+    # Undo history memory
+    info_parts.append(f"History: {history_bytes / (1024 * 1024):.1f} MB")
+
     status_text = " | ".join(info_parts)
-    text_surf = tiny_font.render(status_text, True, colors['text'])
-    screen.blit(text_surf, (15, status_y + 10))
 
-    # Right side - save status
-    if unsaved_changes:
-        save_text = "Unsaved changes"
-        save_color = colors['warning']
-    else:
-        save_text = "Saved"
-        save_color = colors['success']
+    def render(surf):
+        # Gradient background
+        surf.blit(gradient_surface((width, status_h), colors['panel_light'], colors['panel']), (0, 0))
+
+        # Top border
+        pygame.draw.line(surf, colors['border'], (0, 0), (width, 0), 2)
+
+        # Coordinates and history size make this text new on most frames: keep it out of
+        # render_text so it cannot push the static labels out of the cache
+        text_surf = tiny_font.render(status_text, True, colors['text'])
+        surf.blit(text_surf, (15, 10))
 
-    save_surf = tiny_font.render(save_text, True, save_color)
-    screen.blit(save_surf, (width - save_surf.get_width() - 15, status_y + 10))
+        # Right side - save status
+        if unsaved_changes:
+            save_text = "Unsaved changes"
+            save_color = colors['warning']
+        else:
+            save_text = "Saved"
+            save_color = colors['success']
+
+        save_surf = render_text(tiny_font, save_text, True, save_color)
+        surf.blit(save_surf, (width - save_surf.get_width() - 15, 10))
+
+    inputs = (status_text, unsaved_changes, tuple(colors.values()))
+    screen.blit(cached_panel('status_bar', inputs, (width, status_h), render), (0, status_y))
 
-def draw_minimap(screen, canvas, canvas_w, canvas_h, width, height, zoom_level, zoom_offset_x, zoom_offset_y, colors, tiny_font, show_minimap):
-    """Draw minimap in corner"""
+def draw_minimap(screen, canvas_manager, width, height, zoom_level, zoom_offset_x, zoom_offset_y, colors, tiny_font, show_minimap):
+    """Draw minimap in corner, returns the screen rect it covers or None"""
     if not show_minimap or zoom_level <= 1.0:
-        return
+        return None
 
+    canvas_w, canvas_h = canvas_manager.width, canvas_manager.height
     minimap_w = 200
     minimap_h = int(minimap_w * canvas_h / canvas_w)
     minimap_x = 20
@@ -512,8 +491,9 @@ def draw_minimap(screen, canvas, canvas_w, canvas_h, width, height, zoom_level,
     draw_rounded_rect(screen, colors['panel'], minimap_bg, radius=8)
     pygame.draw.rect(screen, colors['border'], minimap_bg, 2, border_radius=8)
 
-    # Scaled canvas
-    minimap_canvas = pygame.transform.scale(canvas, (minimap_w, minimap_h))
+    # Scaled canvas, resampled from the nearest pyramid level
+    source, _ = canvas_manager.mip_level(minimap_w / canvas_w)
+    minimap_canvas = pygame.transform.smoothscale(source, (minimap_w, minimap_h))
     screen.blit(minimap_canvas, (minimap_x, minimap_y))
 
     # Viewport indicator
@@ -527,13 +507,16 @@ def draw_minimap(screen, canvas, canvas_w, canvas_h, width, height, zoom_level,
     pygame.draw.rect(screen, colors['accent'], viewport_rect, 2)
 
     # Label
-    label = tiny_font.render("MINIMAP", True, colors['text_dim'])
+    label = render_text(tiny_font, "MINIMAP", True, colors['text_dim'])
     screen.blit(label, (minimap_x, minimap_bg.bottom + 3))
 
+    return minimap_bg.union(label.get_rect(topleft=(minimap_x, minimap_bg.bottom + 3)))
+
 def draw_notifications(screen, ui_state, width, colors, small_font):
-    """Draw notification queue"""
+    """Draw notification queue, returns the screen rects drawn on"""
     y = 110
     to_remove = []
+    drawn = []
     current_time = pygame.time.get_ticks()
 
     for i, notif in enumerate(ui_state.notification_queue):
@@ -547,7 +530,7 @@ def draw_notifications(screen, ui_state, width, colors, small_font):
             notif['alpha'] = int(255 * (time_left / 500))
 
         # Notification box
-        text_surf = small_font.render(notif['text'], True, colors['text'])
+        text_surf = render_text(small_font, notif['text'], True, colors['text'])
         box_w = text_surf.get_width() + 40
         box_h = 40
         box_x = width // 2 - box_w // 2
@@ -573,9 +556,13 @@ def draw_notifications(screen, ui_state, width, colors, small_font):
         pygame.draw.rect(screen, (*colors['border_light'], notif['alpha']), box_rect, 2, border_radius=8)
 
         # Text
-        text_surf.set_alpha(notif['alpha'])
+        if notif['alpha'] < 255:
+            # The cached text is shared, fade a copy
+            text_surf = text_surf.copy()
+            text_surf.set_alpha(notif['alpha'])
         text_rect = text_surf.get_rect(center=box_rect.center)
         screen.blit(text_surf, text_rect)
+        drawn.append(box_rect.inflate(8, 8))
 
         y += box_h + 10
 
@@ -583,12 +570,12 @@ def draw_notifications(screen, ui_state, width, colors, small_font):
     for i in reversed(to_remove):
         ui_state.notification_queue.remove(list(ui_state.notification_queue)[i])
 
+    return drawn
+
 def draw_settings_panel(screen, width, height, settings, colors, font_large, font, small_font):
     """Draw settings dialog"""
-    panel_w = 500
-    panel_h = 400
-    panel_x = width // 2 - panel_w // 2
-    panel_y = height // 2 - panel_h // 2
+    panel_rect, rects = settings_layout(width, height)
+    panel_x, panel_y = panel_rect.topleft
 
     # Dark overlay
     overlay = pygame.Surface((width, height), pygame.SRCALPHA)
@@ -596,7 +583,6 @@ def draw_settings_panel(screen, width, height, settings, colors, font_large, fon
     screen.blit(overlay, (0, 0))
 
     # Shadow
-    panel_rect = pygame.Rect(panel_x, panel_y, panel_w, panel_h)
     draw_shadow(screen, panel_rect, offset=8, alpha=50)
 
     # Background
@@ -604,55 +590,36 @@ def draw_settings_panel(screen, width, height, settings, colors, font_large, fon
     pygame.draw.rect(screen, colors['accent'], panel_rect, 3, border_radius=12)
 
     mx, my = pygame.mouse.get_pos()
-    y = panel_y + 20
-    rects = []
 
     # Title
-    title = font_large.render("SETTINGS", True, colors['text'])
-    screen.blit(title, (panel_x + 20, y))
-    y += 50
+    title = render_text(font_large, "SETTINGS", True, colors['text'])
+    screen.blit(title, (panel_x + 20, panel_y + 20))
 
     # Settings checkboxes
-    settings_list = [
-        ('dark_theme', "Dark Theme"),
-        ('show_grid', "Show Grid"),
-        ('show_minimap', "Show Minimap"),
-        ('smooth_brush', "Smooth Brush (Anti-aliased)"),
-        ('show_coordinates', "Show Coordinates"),
-    ]
-
-    for key, label in settings_list:
-        checkbox_rect = pygame.Rect(panel_x + 20, y, 30, 30)
+    for (key, label), (_, checkbox_rect) in zip(SETTINGS_OPTIONS, rects):
         pygame.draw.rect(screen, colors['bg'], checkbox_rect, border_radius=4)
         pygame.draw.rect(screen, colors['border'], checkbox_rect, 2, border_radius=4)
         if settings.get(key, False):
             pygame.draw.circle(screen, colors['accent'], checkbox_rect.center, 10)
 
-        label_text = small_font.render(label, True, colors['text'])
-        screen.blit(label_text, (panel_x + 60, y + 5))
-        rects.append((key, checkbox_rect))
-        y += 45
-
-    y += 15
+        label_text = render_text(small_font, label, True, colors['text'])
+        screen.blit(label_text, (panel_x + 60, checkbox_rect.y + 5))
 
     # Close button
-    close_btn = pygame.Rect(panel_x + 150, panel_y + panel_h - 60, 200, 40)
+    close_btn = rects[-1][1]
     close_hover = close_btn.collidepoint(mx, my)
     draw_rounded_rect(screen, colors['accent_hover' if close_hover else 'accent'], close_btn, radius=8)
     pygame.draw.rect(screen, colors['border'], close_btn, 2, border_radius=8)
 
-    close_text = font.render("Close", True, (255, 255, 255))
+    close_text = render_text(font, "Close", True, (255, 255, 255))
     screen.blit(close_text, (close_btn.centerx - 25, close_btn.centery - 8))
-    rects.append(('close', close_btn))
 
     return rects
 
-def draw_help_panel(screen, width, height, colors, font_large, font, tiny_font):
+def draw_help_panel(screen, width, height, colors, font_large, font, small_font, tiny_font):
     """Draw help dialog with keyboard shortcuts"""
-    panel_w = 600
-    panel_h = 500
-    panel_x = width // 2 - panel_w // 2
-    panel_y = height // 2 - panel_h // 2
+    panel_rect, rects = help_layout(width, height)
+    panel_x, panel_y = panel_rect.topleft
 
     # Dark overlay
     overlay = pygame.Surface((width, height), pygame.SRCALPHA)
@@ -660,7 +627,6 @@ def draw_help_panel(screen, width, height, colors, font_large, font, tiny_font):
     screen.blit(overlay, (0, 0))
 
     # Shadow
-    panel_rect = pygame.Rect(panel_x, panel_y, panel_w, panel_h)
     draw_shadow(screen, panel_rect, offset=8, alpha=50)
 
     # Background
@@ -671,7 +637,7 @@ def draw_help_panel(screen, width, height, colors, font_large, font, tiny_font):
     y = panel_y + 20
 
     # Title
-    title = font_large.render("KEYBOARD SHORTCUTS", True, colors['text'])
+    title = render_text(font_large, "KEYBOARD SHORTCUTS", True, colors['text'])
     screen.blit(title, (panel_x + 20, y))
     y += 50
 
@@ -682,7 +648,7 @@ def draw_help_panel(screen, width, height, colors, font_large, font, tiny_font):
         ("E", "Eraser"),
         ("F", "Fill bucket"),
         ("R", "Rectangle"),
-        ("L", "Line"),
+        ("L", "Line (Shift+release adds a vertex)"),
         ("C", "Circle"),
         ("P", "Color picker"),
         ("", ""),
@@ -712,45 +678,38 @@ def draw_help_panel(screen, width, height, colors, font_large, font, tiny_font):
             continue
 
         if not desc:  # Section header
-            section_text = small_font.render(key, True, colors['accent'])
+            section_text = render_text(small_font, key, True, colors['accent'])
             screen.blit(section_text, (panel_x + 20, y))
             y += 25
         else:
-            key_text = tiny_font.render(key, True, colors['text'])
-            desc_text = tiny_font.render(desc, True, colors['text_dim'])
+            key_text = render_text(tiny_font, key, True, colors['text'])
+            desc_text = render_text(tiny_font, desc, True, colors['text_dim'])
             screen.blit(key_text, (panel_x + 40, y))
             screen.blit(desc_text, (panel_x + 200, y))
             y += 20
 
     # Close button
-    close_btn = pygame.Rect(panel_x + 200, panel_y + panel_h - 60, 200, 40)
+    close_btn = rects[0][1]
     close_hover = close_btn.collidepoint(mx, my)
     draw_rounded_rect(screen, colors['accent_hover' if close_hover else 'accent'], close_btn, radius=8)
     pygame.draw.rect(screen, colors['border'], close_btn, 2, border_radius=8)
 
-    close_text = font.render("Close", True, (255, 255, 255))
+    close_text = render_text(font, "Close", True, (255, 255, 255))
     screen.blit(close_text, (close_btn.centerx - 25, close_btn.centery - 8))
 
-    return [('close', close_btn)]
+    return rects
 
 def draw_layer_panel(screen, width, height, layer_manager, colors, settings, font_large, small_font, tiny_font, custom_pos=None):
     """Enhanced multi-layer panel - now draggable!"""
     if not layer_manager.layers:
         return [], pygame.Rect(0, 0, 0, 0)
 
-    panel_w = 600
-    panel_h = min(500, height - 200)
-
-    # Use custom position if dragged, otherwise default centered position
-    if custom_pos:
-        panel_x = max(0, min(width - panel_w, custom_pos[0]))
-        panel_y = max(90, min(height - panel_h, custom_pos[1]))
-    else:
-        panel_x = width // 2 - panel_w // 2
-        panel_y = height - panel_h - 60
+    layer = layer_manager.get_current_layer()
+    layout = layer_panel_layout(width, height, len(layer_manager.layers), layer is not None, custom_pos)
+    panel_rect = layout.rect
+    panel_x, panel_y, panel_w, panel_h = panel_rect
 
     # Shadow
-    panel_rect = pygame.Rect(panel_x, panel_y, panel_w, panel_h)
     draw_shadow(screen, panel_rect, offset=8, alpha=50)
 
     # Background
@@ -763,43 +722,29 @@ def draw_layer_panel(screen, width, height, layer_manager, colors, settings, fon
     pygame.draw.rect(screen, colors['layer_hover'], panel_rect.inflate(4, 4), 1, border_radius=13)
 
     mx, my = pygame.mouse.get_pos()
-    y = panel_y + 20
-    rects = []
-
-    # Drag handle bar at the top
-    drag_handle = pygame.Rect(panel_x, panel_y, panel_w, 60)
-    drag_handle_hover = drag_handle.collidepoint(mx, my)
 
     # Add visual indicator for drag handle
-    if drag_handle_hover:
-        drag_indicator = tiny_font.render("⬍ DRAG TO MOVE ⬍", True, colors['accent_hover'])
+    if layout.drag_handle.collidepoint(mx, my):
+        drag_indicator = render_text(tiny_font, "⬍ DRAG TO MOVE ⬍", True, colors['accent_hover'])
     else:
-        drag_indicator = tiny_font.render("⬍ DRAG TO MOVE ⬍", True, colors['text_dim'])
+        drag_indicator = render_text(tiny_font, "⬍ DRAG TO MOVE ⬍", True, colors['text_dim'])
     drag_rect = drag_indicator.get_rect(center=(panel_x + panel_w // 2, panel_y + 10))
     screen.blit(drag_indicator, drag_rect)
 
-    rects.append(('drag_handle', drag_handle, 0))
-
     # Title
-    title = font_large.render("LAYER MANAGER", True, colors['layer_hover'])
-    screen.blit(title, (panel_x + 20, y))
-    y += 35
+    title = render_text(font_large, "LAYER MANAGER", True, colors['layer_hover'])
+    screen.blit(title, (panel_x + 20, layout.title_y))
 
-    subtitle = tiny_font.render(f"{len(layer_manager.layers)} layer(s) | Ctrl+Shift+1-9 to toggle", True, colors['text_dim'])
-    screen.blit(subtitle, (panel_x + 20, y))
-    y += 25
+    subtitle = render_text(tiny_font, f"{len(layer_manager.layers)} layer(s) | Ctrl+Shift+1-9 to toggle", True, colors['text_dim'])
+    screen.blit(subtitle, (panel_x + 20, layout.subtitle_y))
 
-    # Divider
-    pygame.draw.line(screen, colors['border'], (panel_x + 20, y), (panel_x + panel_w - 20, y), 1)
-    y += 15
+    # Dividers
+    for rule_y in layout.rule_ys:
+        pygame.draw.line(screen, colors['border'], (panel_x + 20, rule_y), (panel_x + panel_w - 20, rule_y), 1)
 
     # Layer list
-    layer_list_h = 180
-    layer_y_start = y
-
-    for i, layer in enumerate(layer_manager.layers):
+    for i, (item, layer_rect) in enumerate(zip(layer_manager.layers, layout.layer_rects)):
         is_current = i == layer_manager.current_idx
-        layer_rect = pygame.Rect(panel_x + 20, y, panel_w - 40, 38)
         hover = layer_rect.collidepoint(mx, my)
 
         # Layer card
@@ -816,50 +761,40 @@ def draw_layer_panel(screen, width, height, layer_manager, colors, settings, fon
         # Layer number indicator
         num_color = (255, 255, 255) if is_current else colors['text']
         num_text = f"[{i+1}]" if i < 9 else "[*]"
-        num_label = tiny_font.render(num_text, True, num_color)
+        num_label = render_text(tiny_font, num_text, True, num_color)
         screen.blit(num_label, (layer_rect.x + 10, layer_rect.y + 12))
 
         # Visibility indicator
-        vis_text = "V" if layer.visible else "H"
-        vis_label = tiny_font.render(vis_text, True, num_color)
+        vis_text = "V" if item.visible else "H"
+        vis_label = render_text(tiny_font, vis_text, True, num_color)
         screen.blit(vis_label, (layer_rect.x + 45, layer_rect.y + 12))
 
         # Lock indicator
-        if layer.locked:
-            lock_label = tiny_font.render("[L]", True, num_color)
+        if item.locked:
+            lock_label = render_text(tiny_font, "[L]", True, num_color)
             screen.blit(lock_label, (layer_rect.x + 70, layer_rect.y + 12))
 
         # Layer name
-        name_text = tiny_font.render(layer.name[:40], True, num_color)
-        screen.blit(name_text, (layer_rect.x + (95 if layer.locked else 70), layer_rect.y + 12))
+        name_text = render_text(tiny_font, item.name[:40], True, num_color)
+        screen.blit(name_text, (layer_rect.x + (95 if item.locked else 70), layer_rect.y + 12))
 
         # Layer info
-        img_w, img_h = layer.original.get_size()
-        info_text = tiny_font.render(f"{img_w}x{img_h} | {int(layer.alpha/255*100)}% | {layer.scale:.2f}x", True, num_color)
+        img_w, img_h = item.original.get_size()
+        info_text = render_text(tiny_font, f"{img_w}x{img_h} | {int(item.alpha/255*100)}% | {item.scale:.2f}x", True, num_color)
         screen.blit(info_text, (layer_rect.right - info_text.get_width() - 10, layer_rect.y + 12))
 
-        rects.append(('layer_select', layer_rect, i))
-        y += 42
-
-    y = layer_y_start + max(layer_list_h, len(layer_manager.layers) * 42 + 10)
-
-    # Divider
-    pygame.draw.line(screen, colors['border'], (panel_x + 20, y), (panel_x + panel_w - 20, y), 1)
-    y += 15
-
     # Current layer controls
-    layer = layer_manager.get_current_layer()
     if layer:
         # Opacity slider
-        opacity_label = small_font.render("Opacity", True, colors['text'])
-        screen.blit(opacity_label, (panel_x + 20, y))
+        opacity_label = render_text(small_font, "Opacity", True, colors['text'])
+        screen.blit(opacity_label, (panel_x + 20, layout.alpha_label_y))
 
-        opacity_val = small_font.render(f"{int(layer.alpha/255*100)}%", True, colors['layer_hover'])
-        screen.blit(opacity_val, (panel_x + panel_w - 60, y))
-        y += 25
+        opacity_val = render_text(small_font, f"{int(layer.alpha/255*100)}%", True, colors['layer_hover'])
+        screen.blit(opacity_val, (panel_x + panel_w - 60, layout.alpha_label_y))
 
-        slider_w = panel_w - 40
-        alpha_slider = pygame.Rect(panel_x + 20, y, slider_w, 22)
+        alpha_slider = layout.alpha_slider
+        slider_w = alpha_slider.width
+        y = alpha_slider.y
 
         # Track
         draw_rounded_rect(screen, colors['bg'], alpha_slider, radius=11)
@@ -868,33 +803,30 @@ def draw_layer_panel(screen, width, height, layer_manager, colors, settings, fon
         # Fill
         fill_percent = layer.alpha / 255
         fill_w = int(slider_w * fill_percent)
-        fill_rect = pygame.Rect(panel_x + 20, y, fill_w, 22)
+        fill_rect = pygame.Rect(alpha_slider.x, y, fill_w, 22)
 
         if fill_w > 0:
             fill_surf = pygame.Surface((fill_w, 22))
             draw_gradient_rect(fill_surf, colors['layer_accent'], colors['layer_hover'], pygame.Rect(0, 0, fill_w, 22), vertical=False)
-            screen.blit(fill_surf, (panel_x + 20, y))
+            screen.blit(fill_surf, (alpha_slider.x, y))
             pygame.draw.rect(screen, colors['layer_hover'], fill_rect, border_radius=11)
 
         # Handle
-        handle_x = panel_x + 20 + fill_w
+        handle_x = alpha_slider.x + fill_w
         handle_y = y + 11
         pygame.draw.circle(screen, (255, 255, 255), (handle_x, handle_y), 14)
         pygame.draw.circle(screen, colors['layer_hover'], (handle_x, handle_y), 12)
         pygame.draw.circle(screen, (255, 255, 255), (handle_x, handle_y), 5)
 
-        rects.append(('alpha_slider', alpha_slider))
-        y += 35
-
         # Scale slider
-        scale_label = small_font.render("Scale", True, colors['text'])
-        screen.blit(scale_label, (panel_x + 20, y))
+        scale_label = render_text(small_font, "Scale", True, colors['text'])
+        screen.blit(scale_label, (panel_x + 20, layout.scale_label_y))
 
-        scale_val = small_font.render(f"{layer.scale:.2f}x", True, colors['layer_hover'])
-        screen.blit(scale_val, (panel_x + panel_w - 60, y))
-        y += 25
+        scale_val = render_text(small_font, f"{layer.scale:.2f}x", True, colors['layer_hover'])
+        screen.blit(scale_val, (panel_x + panel_w - 60, layout.scale_label_y))
 
-        scale_slider = pygame.Rect(panel_x + 20, y, slider_w, 22)
+        scale_slider = layout.scale_slider
+        y = scale_slider.y
 
         # Track
         draw_rounded_rect(screen, colors['bg'], scale_slider, radius=11)
@@ -903,41 +835,29 @@ def draw_layer_panel(screen, width, height, layer_manager, colors, settings, fon
         # Fill
         fill_percent = (layer.scale - 0.1) / (3.0 - 0.1)
         fill_w = int(slider_w * fill_percent)
-        fill_rect = pygame.Rect(panel_x + 20, y, fill_w, 22)
+        fill_rect = pygame.Rect(scale_slider.x, y, fill_w, 22)
 
         if fill_w > 0:
             draw_rounded_rect(screen, colors['success'], fill_rect, radius=11)
 
         # Handle
-        handle_x = panel_x + 20 + fill_w
+        handle_x = scale_slider.x + fill_w
         handle_y = y + 11
         pygame.draw.circle(screen, (255, 255, 255), (handle_x, handle_y), 14)
         pygame.draw.circle(screen, colors['success'], (handle_x, handle_y), 12)
         pygame.draw.circle(screen, (255, 255, 255), (handle_x, handle_y), 5)
 
-        rects.append(('scale_slider', scale_slider))
-        y += 40
-
-    # Divider
-    pygame.draw.line(screen, colors['border'], (panel_x + 20, y), (panel_x + panel_w - 20, y), 1)
-    y += 12
-
     # Action buttons
-    btn_data = [
-        ('Add', colors['success'], 'add_layer'),
-        ('Toggle', colors['accent'], 'toggle'),
-        ('Apply', colors['success_hover'], 'apply'),
-        ('Remove', colors['error'], 'clear'),
-        ('Close', colors['border'], 'close'),
-    ]
-
-    btn_count = len(btn_data)
-    btn_w = (panel_w - 40 - 10 * (btn_count - 1)) // btn_count
-    btn_h = 44
-    btn_x = panel_x + 20
-
-    for label, color, action in btn_data:
-        btn_rect = pygame.Rect(btn_x, y, btn_w, btn_h)
+    btn_style = {
+        'add_layer': ('Add', colors['success']),
+        'toggle': ('Toggle', colors['accent']),
+        'apply': ('Apply', colors['success_hover']),
+        'clear': ('Remove', colors['error']),
+        'close': ('Close', colors['border']),
+    }
+
+    for action, btn_rect in layout.buttons:
+        label, color = btn_style[action]
         hover = btn_rect.collidepoint(mx, my)
 
         # Button
@@ -950,11 +870,8 @@ def draw_layer_panel(screen, width, height, layer_manager, colors, settings, fon
             pygame.draw.rect(screen, colors['border'], btn_rect, 1, border_radius=8)
 
         # Label
-        label_text = small_font.render(label, True, (255, 255, 255))
+        label_text = render_text(small_font, label, True, (255, 255, 255))
         label_rect = label_text.get_rect(center=btn_rect.center)
         screen.blit(label_text, label_rect)
 
-        rects.append((action, btn_rect))
-        btn_x += btn_w + 10
-
-    return rects, panel_rect
+    return layout.rects, panel_rect
@@ -5,9 +5,13 @@ Utility functions for WoD Map Editor
 import pygame
 import json
 import os
+import threading
 from tkinter import filedialog
 from collections import deque
-from config import RECOVERY_FILE, RECOVERY_INFO_FILE
+from config import RECOVERY_FILE, RECOVERY_INFO_FILE, RECOVERY_MAP_FILE, RECOVERY_JOURNAL_FILE
+from tiles import MappedStore
+from journal import RecoveredMap
+import mapfile
 
 class UIState:
     """UI state management"""
@@ -29,14 +33,75 @@ class UIState:
             'alpha': 255
         })
 
-def save_recovery_file(canvas, canvas_w, canvas_h, last_save_path):
-    """Save current canvas to recovery file"""
+class BackgroundSaver:
+    """Runs save jobs on a worker thread, one at a time.
+
+    A job submitted under a key that is still waiting replaces the waiting
+    one, so repeated saves coalesce instead of piling up behind a slow one.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.results = deque()
+        self.running = None
+        self.cond = threading.Condition()
+        worker = threading.Thread(target=self._worker, daemon=True)
+        worker.start()
+
+    def submit(self, key, func, *args):
+        """Queue func(*args) under a key"""
+        with self.cond:
+            self.pending[key] = (func, args)
+            self.cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                key = next(iter(self.pending))
+                func, args = self.pending.pop(key)
+                self.running = key
+            try:
+                result, error = func(*args), None
+            except Exception as e:
+                result, error = None, str(e)
+            with self.cond:
+                self.running = None
+                self.results.append((key, result, error))
+                self.cond.notify_all()
+
+    def poll(self):
+        """Finished jobs since the last call as (key, result, error) tuples"""
+        with self.cond:
+            done = list(self.results)
+            self.results.clear()
+        return done
+
+    def busy(self, key=None):
+        """Whether a job (under a key, if given) is queued or running"""
+        with self.cond:
+            if key is None:
+                return bool(self.pending) or self.running is not None
+            return key in self.pending or self.running == key
+
+    def wait(self):
+        """Block until every queued job has finished"""
+        with self.cond:
+            while self.pending or self.running is not None:
+                self.cond.wait()
+
+def save_recovery_file(journal, last_save_path):
+    """Write the checkpoints queued on a RecoveryJournal and the recovery info"""
     try:
-        pygame.image.save(canvas, RECOVERY_FILE)
+        mapped = journal.write()
+        if mapped is None:
+            return False
         recovery_info = {
             'timestamp': pygame.time.get_ticks(),
-            'canvas_size': [canvas_w, canvas_h],
-            'last_save_path': last_save_path
+            'canvas_size': list(journal.size),
+            'last_save_path': last_save_path,
+            'mapped': mapped
         }
         with open(RECOVERY_INFO_FILE, 'w') as f:
             json.dump(recovery_info, f)
@@ -45,16 +110,19 @@ def save_recovery_file(canvas, canvas_w, canvas_h, last_save_path):
         return False
 
 def load_recovery_file():
-    """Load canvas from recovery file"""
+    """Load the recovered canvas: a RecoveredMap, or a MappedStore for memory-mapped canvases"""
     try:
-        if os.path.exists(RECOVERY_FILE) and os.path.exists(RECOVERY_INFO_FILE):
+        if os.path.exists(RECOVERY_INFO_FILE):
             with open(RECOVERY_INFO_FILE, 'r') as f:
                 recovery_info = json.load(f)
 
-            loaded = pygame.image.load(RECOVERY_FILE)
-            canvas_w, canvas_h = loaded.get_size()
-            
-            return loaded, canvas_w, canvas_h, recovery_info
+            if recovery_info.get('mapped'):
+                canvas_w, canvas_h = recovery_info['canvas_size']
+                store = MappedStore(canvas_w, canvas_h, RECOVERY_MAP_FILE, keep=True)
+                return store, canvas_w, canvas_h, recovery_info
+
+            loaded = RecoveredMap(RECOVERY_FILE, RECOVERY_JOURNAL_FILE)
+            return loaded, loaded.width, loaded.height, recovery_info
     except:
         pass
     return None, None, None, None
@@ -64,6 +132,8 @@ def delete_recovery_files():
     try:
         if os.path.exists(RECOVERY_FILE):
             os.remove(RECOVERY_FILE)
+        if os.path.exists(RECOVERY_JOURNAL_FILE):
+            os.remove(RECOVERY_JOURNAL_FILE)
         if os.path.exists(RECOVERY_INFO_FILE):
             os.remove(RECOVERY_INFO_FILE)
     except:
@@ -71,47 +141,63 @@ def delete_recovery_files():
 
 def check_for_recovery():
     """Check if recovery file exists"""
-    return os.path.exists(RECOVERY_FILE) and os.path.exists(RECOVERY_INFO_FILE)
+    if not os.path.exists(RECOVERY_INFO_FILE):
+        return False
+    return os.path.exists(RECOVERY_FILE) or os.path.exists(RECOVERY_MAP_FILE)
 
-def save_map(canvas, last_save_path=None):
-    """Save map to file"""
+def ask_save_path(last_save_path=None):
+    """Ask where to save the map, .wodmap natively or PNG as an export"""
     filename = filedialog.asksaveasfilename(
         title="Save Map",
-        defaultextension=".png",
-        filetypes=[("PNG files", "*.png")],
-        initialfile=last_save_path or 'my_map.png'
+        defaultextension=mapfile.EXTENSION,
+        filetypes=[("WoD maps", "*" + mapfile.EXTENSION), ("PNG files", "*.png")],
+        initialfile=last_save_path or 'my_map' + mapfile.EXTENSION
     )
 
     if not filename:
         return None
-
-    try:
-        if not filename.lower().endswith('.png'):
-            filename += '.png'
-
-        pygame.image.save(canvas, filename)
-        delete_recovery_files()
-        return filename
-    except Exception as e:
-        return False
+    if not filename.lower().endswith(('.png', mapfile.EXTENSION)):
+        filename += mapfile.EXTENSION
+    return filename
+
+def write_map(canvas, filename):
+    """Write a canvas or snapshot to filename, returns the filename"""
+    if filename.lower().endswith(mapfile.EXTENSION):
+        mapfile.save(canvas, filename)
+    else:
+        mapfile.save_png(canvas, filename)
+    delete_recovery_files()
+    return filename
 
 def load_map():
-    """Load map from file"""
+    """Load map from file, returns a Surface or an open MapFile"""
     filename = filedialog.askopenfilename(
         title="Load Map",
-        filetypes=[("PNG files", "*.png")]
+        filetypes=[("Maps", "*" + mapfile.EXTENSION + " *.png"),
+                   ("WoD maps", "*" + mapfile.EXTENSION), ("PNG files", "*.png")]
     )
 
     if not filename:
         return None, None, None
 
     try:
+        if filename.lower().endswith(mapfile.EXTENSION):
+            loaded = mapfile.MapFile(filename)
+            return loaded, loaded.width, loaded.height
         loaded = pygame.image.load(filename)
         canvas_w, canvas_h = loaded.get_size()
         return loaded, canvas_w, canvas_h
     except Exception as e:
         return None, None, str(e)
 
+def fill_canvas(canvas_manager, loaded):
+    """Put a map returned by load_map into a canvas, returns the off-palette pixel count"""
+    if isinstance(loaded, mapfile.MapFile):
+        with loaded:
+            canvas_manager.load_tiles(loaded.tiles(canvas_manager.palette))
+        return 0
+    return canvas_manager.load_surface(loaded)
+
 def screen_to_canvas(mx, my, base_x, base_y, zoom_offset_x, zoom_offset_y, zoom_level, snap_to_grid=False, grid_size=32):
     """Convert screen coordinates to canvas coordinates"""
     canvas_x = base_x + zoom_offset_x